@@ -22,6 +22,12 @@ class Settings(BaseSettings):
     # مدة صلاحية الـ Access Token (قصير المدى - 1 ساعة)
     # Access Token قصير لأسباب أمنية، يتم تجديده تلقائياً باستخدام Refresh Token
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60  # 1 ساعة
+    # كاش المستخدم الحالي (get_current_user) داخل العملية: مدة الصلاحية وأقصى عدد
+    PRINCIPAL_CACHE_TTL_SECONDS: int = 60
+    PRINCIPAL_CACHE_MAX_ENTRIES: int = 5000
+    # تكلفة bcrypt لكلمات مرور الطاقم (الأقل منها يُعاد تشفيره عند الدخول) وعدد خيوط التشفير
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 4
     # مدة صلاحية الـ Refresh Token (طويل المدى - 30 يوم)
     # Refresh Token يستخدم لتجديد Access Token تلقائياً
     REFRESH_TOKEN_EXPIRE_DAYS: int = 30  # 30 يوم
@@ -36,6 +42,50 @@ class Settings(BaseSettings):
     R2_BUCKET_NAME: str | None = None
     # Public base URL, e.g. https://cdn.example.com or https://<account>.r2.cloudflarestorage.com/<bucket>
     R2_PUBLIC_BASE: str | None = None
+    # Optional S3-compatible endpoint override (MinIO / moto server for local tests)
+    R2_ENDPOINT_URL: str | None = None
+    # اتصالات HTTP المحفوظة (keep-alive) في الـ client المشترك
+    R2_MAX_POOL_CONNECTIONS: int = 32
+    # عدد عمليات الرفع المتزامنة لكل worker (الباقي ينتظر في الطابور)
+    MEDIA_UPLOAD_WORKERS: int = 8
+    R2_UPLOAD_MAX_ATTEMPTS: int = 3
+    R2_UPLOAD_BACKOFF_SECONDS: float = 0.5
+    # الملفات الأكبر من هذا الحجم تُرفع multipart على أجزاء
+    R2_MULTIPART_THRESHOLD_MB: int = 8
+    R2_MULTIPART_CHUNK_MB: int = 8
+    # صلاحية روابط الرفع المباشر (presigned PUT)
+    PRESIGNED_UPLOAD_EXPIRE_SECONDS: int = 600
+    # مفاتيح presign لم تُؤكَّد: تُحذف ملفاتها بعد انتهاء الرابط + هذه المهلة
+    PRESIGNED_UPLOAD_GRACE_SECONDS: int = 3600
+    # الحد الأقصى لحجم الصورة الواحدة (يُفحص أثناء القراءة)
+    MAX_IMAGE_MB: int = 10
+    # الحد الأقصى لجسم طلب multipart كامل (عدة صور) — يُقطع الطلب أثناء الاستقبال
+    MAX_UPLOAD_REQUEST_MB: int = 60
+    # رفع جلسة تصوير كاملة في طلب واحد (/patients/{id}/gallery/batch)
+    MAX_BATCH_UPLOAD_REQUEST_MB: int = 400
+    GALLERY_BATCH_MAX_FILES: int = 50
+    # عدد الصور التي تُفحص وتُرفع في نفس الوقت داخل الدفعة الواحدة
+    GALLERY_BATCH_UPLOAD_CONCURRENCY: int = 6
+    # نسخ الصور (thumb/medium/display) تُولَّد بـ Pillow على process pool بعد الرفع
+    IMAGE_PROCESS_WORKERS: int = 2
+    IMAGE_THUMB_PX: int = 320
+    IMAGE_MEDIUM_PX: int = 1280
+    IMAGE_DISPLAY_PX: int = 2048
+    IMAGE_VARIANT_FORMAT: str = "webp"  # webp | jpeg
+    IMAGE_VARIANT_QUALITY: int = 80
+    # JPEG أكبر من هذا الحجم يحصل أيضاً على نسخة display مضغوطة
+    IMAGE_TRANSCODE_OVER_MB: float = 3
+    # الملفات التي لم يعد يشير إليها أي سجل تُحذف بعد هذه المهلة (media_blobs GC)
+    MEDIA_GC_GRACE_SECONDS: int = 86400
+    MEDIA_GC_INTERVAL_MINUTES: int = 60
+    # كاش في الذاكرة للملفات الصغيرة المطلوبة كثيراً من /media (QR، thumbnails)
+    MEDIA_CACHE_MAX_MB: int = 32
+    MEDIA_CACHE_MAX_FILE_KB: int = 256
+    # صور QR تُولَّد عند أول طلب (/qr/{code}.png|svg) وتبقى في كاش LRU بهذا العدد
+    QR_CACHE_SIZE: int = 2048
+    # حزمة ملف المريض للطبيب (GET /doctor/patients/{id}/chart): الأقسام الافتراضية وحجم كل قائمة
+    PATIENT_CHART_SECTIONS: str = "patient,notes,appointments,gallery,dental_chart,implant_stages,chat"
+    PATIENT_CHART_SECTION_LIMIT: int = 20
 
     # SMS provider config (dummy | twilio)
     SMS_PROVIDER: str = "dummy"
@@ -47,6 +97,30 @@ class Settings(BaseSettings):
     OTPIQ_API_KEY: str | None = None
     OTPIQ_BASE_URL: str | None = None
     OTP_TTL_SECONDS: int = 120
+    # حدود لكل رقم هاتف (نافذة منزلقة، مشتركة بين الـ workers): صيغة limits مفصولة بـ ;
+    OTP_REQUEST_PHONE_LIMIT: str = "3/10minutes;10/day"
+    OTP_VERIFY_PHONE_LIMIT: str = "10/10minutes;30/day"
+    # تخزين عدادات الـ rate limit: redis://... أو mongodb://... أو memory://
+    # فارغ = SOCKETIO_MESSAGE_QUEUE إن كان Redis، وإلا ذاكرة العملية
+    RATE_LIMIT_STORAGE_URI: str | None = None
+
+    # أنواع تذكير المواعيد المفعّلة (مفصولة بفاصلة): 3d,1d,day,2h
+    REMINDER_KINDS: str = "1d,day"
+    # كل كم ثانية يفحص الـ poller التذكيرات المستحقة
+    REMINDER_POLL_SECONDS: int = 60
+
+    # Socket.IO بين عدة workers: فارغ = عملية واحدة (ذاكرة)، أو redis://host:6379/0
+    SOCKETIO_MESSAGE_QUEUE: str | None = None
+    # مدة صلاحية سجل الاتصال في السجل المشترك (يُجدَّد تلقائياً كل ثلث المدة)
+    SOCKET_PRESENCE_TTL_SECONDS: int = 90
+    # إعادة اتصال الطبيب خلال هذه المدة لا تُرسل presence_changed (منع الوميض)
+    SOCKET_PRESENCE_GRACE_SECONDS: float = 5.0
+    # الاتصال يُصرَّح من claims الـ JWT؛ فعّل هذا للتحقق من وجود المستخدم في MongoDB أيضاً
+    SOCKET_VERIFY_USER: bool = False
+    # مدة تخزين نتيجة البحث عن المستخدم عند الاتصال (للتوكنات القديمة أو SOCKET_VERIFY_USER)
+    SOCKET_USER_CACHE_SECONDS: int = 300
+    # كل كم ثانية تُكتب نبضات حضور الأطباء (HTTP heartbeat) إلى MongoDB دفعة واحدة
+    PRESENCE_FLUSH_SECONDS: int = 15
 
     # Firebase Admin SDK service account
     FIREBASE_CREDENTIALS_FILE: str | None = None
@@ -64,6 +138,11 @@ class Settings(BaseSettings):
         raw = self.CORS_ORIGINS or os.getenv("CORS_ORIGINS", "") or ""
         return [o.strip() for o in raw.split(",") if o.strip()]
 
+    @property
+    def reminder_kinds(self) -> List[str]:
+        """Enabled appointment reminder kinds, parsed from REMINDER_KINDS."""
+        return [k.strip() for k in (self.REMINDER_KINDS or "").split(",") if k.strip()]
+
 
 @lru_cache()
 def get_settings() -> Settings:
@@ -33,6 +33,8 @@ async def init_db() -> None:
         CallCenterAppointment,
         TreatmentNote,
         GalleryImage,
+        MediaBlob,
+        PendingUpload,
         ChatRoom,
         ChatMessage,
         DeviceToken,
@@ -45,6 +47,8 @@ async def init_db() -> None:
         DentalChart,  # noqa: F401 — registered below
         ReceptionQueueDay,
         DoctorPresence,  # noqa: F401 — registered below
+        JobLease,
+        ReminderSchedule,
     )
     await init_beanie(
         database=_mongo_client[db_name],
@@ -56,6 +60,8 @@ async def init_db() -> None:
         CallCenterAppointment,
             TreatmentNote,
             GalleryImage,
+            MediaBlob,
+            PendingUpload,
             ChatRoom,
             ChatMessage,
             DeviceToken,
@@ -68,6 +74,8 @@ async def init_db() -> None:
             DentalChart,
             ReceptionQueueDay,
             DoctorPresence,
+            JobLease,
+            ReminderSchedule,
         ],
     )
     try:
@@ -1,17 +1,15 @@
 from fastapi import FastAPI, Request, status, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse, RedirectResponse
+from fastapi.responses import JSONResponse, RedirectResponse
 from fastapi.exceptions import RequestValidationError
 from fastapi.openapi.utils import get_openapi
 from starlette.exceptions import HTTPException as StarletteHTTPException
-from slowapi import _rate_limit_exceeded_handler
-from slowapi.errors import RateLimitExceeded
 from pathlib import Path
 
 from app.config import get_settings
 from app.database import init_db, ping_db
 from app.utils.logger import get_logger
-from app.rate_limit import limiter
+from app.utils.uploads import UploadBodyLimitMiddleware
 
 logger = get_logger("main")
 settings = get_settings()
@@ -34,6 +32,8 @@ from app.routers import dental_chart as dental_chart_router
 from app.routers import call_center as call_center_router
 from app.routers import call_center_internal as call_center_internal_router
 from app.routers import presence as presence_router
+from app.routers import uploads as uploads_router
+from app.routers import patient_chart as patient_chart_router
 from app.services.socket_service import sio, get_socket_app
 
 # FastAPI مع Swagger UI الافتراضي
@@ -46,9 +46,6 @@ app = FastAPI(
 socket_app = get_socket_app()
 app.mount("/socket.io", socket_app)
 
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
-
 
 # 🔐 Enable JWT Bearer Auth in Swagger
 # Reset OpenAPI schema to force regeneration
@@ -86,6 +83,10 @@ def custom_openapi():
 
 app.openapi = custom_openapi
 
+# يقطع طلبات multipart الأكبر من MAX_UPLOAD_REQUEST_MB أثناء الاستقبال (413).
+# يُضاف قبل CORS حتى يكون CORS خارجه وتصل ترويسات CORS مع الـ 413 للمتصفح.
+app.add_middleware(UploadBodyLimitMiddleware)
+
 # CORS for Flutter/web
 app.add_middleware(
     CORSMiddleware,
@@ -131,6 +132,10 @@ app.include_router(call_center_internal_router.router)
 print("   ✅ Call Center router registered")
 app.include_router(presence_router.router)
 print("   ✅ Presence router registered")
+app.include_router(uploads_router.router)
+print("   ✅ Direct uploads router registered")
+app.include_router(patient_chart_router.router)
+print("   ✅ Patient chart bundle router registered")
 print("✅ [STARTUP] All routers registered successfully!")
 print(f"   📍 Auth endpoints available at: /auth/*")
 print(f"   🔗 Test endpoint: http://localhost:8000/auth/test")
@@ -243,36 +248,28 @@ async def readyz():
 
 
 @app.get("/media/{file_path:path}")
-async def serve_media(file_path: str):
+async def serve_media(file_path: str, request: Request):
     """
-    Serve media files. In dev mode with R2 disabled, tries to serve from local media directory.
-    If file doesn't exist, returns a placeholder image.
+    Serve media files stored locally (R2 disabled / dev), with ETag, 304,
+    Range and Cache-Control (see utils/media_serving). Files not on this
+    machine are redirected to R2 when configured.
     """
-    from pathlib import Path
-    
-    # Try to find the file in local media directory
-    # backend/app/main.py -> project root is 2 levels up ( .../farah_2/backend/app/main.py )
-    media_dir = Path(__file__).resolve().parents[2] / "media"
-    file_path_obj = Path(file_path)
-    
+    from app.utils.media_serving import serve_local_media
+
     # Security: prevent directory traversal
-    if ".." in file_path or file_path_obj.is_absolute():
+    if ".." in file_path or Path(file_path).is_absolute():
         raise HTTPException(status_code=400, detail="Invalid file path")
-    
-    local_file_path = media_dir / file_path
-    
-    # If file exists locally, serve it
-    if local_file_path.exists() and local_file_path.is_file():
-        return FileResponse(str(local_file_path))
-    
+
+    response = await serve_local_media(request, file_path)
+    if response is not None:
+        return response
+
     if settings.R2_PUBLIC_BASE:
         r2_url = f"{settings.R2_PUBLIC_BASE.rstrip('/')}/{file_path}"
         logger.info(f"Media file missing locally; redirecting to R2 URL: {r2_url}")
         return RedirectResponse(url=r2_url)
 
-    logger.warning(
-        f"Media file not found locally: {file_path} (looked in: {local_file_path})"
-    )
+    logger.warning(f"Media file not found locally: {file_path}")
     raise HTTPException(status_code=404, detail="Media file not found")
 
 
@@ -282,8 +279,13 @@ scheduler = None
 @app.on_event("startup")
 async def on_startup():
     import socket
+    from datetime import timedelta
     from apscheduler.schedulers.asyncio import AsyncIOScheduler
-    from app.services.appointment_reminder_service import check_and_send_reminders
+    from app.services.appointment_reminder_service import (
+        backfill_reminder_schedule,
+        process_due_reminders,
+    )
+    from app.services.job_runner import leased_job, WORKER_ID
     
     global scheduler
     
@@ -322,26 +324,101 @@ async def on_startup():
     # Initialize and start appointment reminder scheduler
     try:
         scheduler = AsyncIOScheduler()
-        # Schedule reminder check every hour
+        # كل worker يشغّل scheduler، لكن القفل في Mongo يضمن تنفيذ المهمة مرة واحدة فقط.
+        # Poll reminder_schedule for due entries (claimed atomically per entry).
         scheduler.add_job(
-            check_and_send_reminders,
-            trigger="cron",
-            hour="*",
-            minute=0,
-            timezone="Asia/Baghdad",
+            leased_job("appointment_reminders", process_due_reminders),
+            trigger="interval",
+            seconds=settings.REMINDER_POLL_SECONDS,
             id="appointment_reminders",
             replace_existing=True,
         )
+        # One-off on startup: make sure pending future appointments have schedule entries.
+        scheduler.add_job(
+            leased_job(
+                "reminder_schedule_backfill",
+                backfill_reminder_schedule,
+                min_interval=timedelta(hours=1),
+            ),
+            trigger="date",
+            id="reminder_schedule_backfill",
+            replace_existing=True,
+        )
+        # One-time migration: legacy room ids, duplicate rooms merged, unique pair index.
+        from app.utils.chat_helpers import backfill_chat_room_summaries, migrate_legacy_chat_rooms
+
+        scheduler.add_job(
+            leased_job(
+                "legacy_chat_room_migration",
+                migrate_legacy_chat_rooms,
+                ttl=timedelta(minutes=15),
+                run_once=True,
+            ),
+            trigger="date",
+            id="legacy_chat_room_migration",
+            replace_existing=True,
+        )
+        # One-time migration: summary fields for /chat/list.
+
+        scheduler.add_job(
+            leased_job(
+                "chat_room_summary_backfill",
+                backfill_chat_room_summaries,
+                ttl=timedelta(minutes=15),
+                run_once=True,
+            ),
+            trigger="date",
+            id="chat_room_summary_backfill",
+            replace_existing=True,
+        )
+        # One-time migration: uploaded_by_role on gallery images (gallery visibility filters).
+        from app.services.patient_service import backfill_gallery_uploader_roles
+
+        scheduler.add_job(
+            leased_job(
+                "gallery_uploader_role_backfill",
+                backfill_gallery_uploader_roles,
+                ttl=timedelta(minutes=15),
+                run_once=True,
+            ),
+            trigger="date",
+            id="gallery_uploader_role_backfill",
+            replace_existing=True,
+        )
+        # حذف ملفات الوسائط التي لم يعد يشير إليها أي سجل (بعد مهلة)
+        from app.services.media_blobs import collect_abandoned_uploads, collect_orphaned_blobs
+
+        scheduler.add_job(
+            leased_job("media_blob_gc", collect_orphaned_blobs, ttl=timedelta(minutes=15)),
+            trigger="interval",
+            minutes=settings.MEDIA_GC_INTERVAL_MINUTES,
+            id="media_blob_gc",
+            replace_existing=True,
+        )
+        # ملفات الرفع المباشر (presign) التي لم تُؤكَّد
+        scheduler.add_job(
+            leased_job("abandoned_upload_gc", collect_abandoned_uploads, ttl=timedelta(minutes=15)),
+            trigger="interval",
+            minutes=settings.MEDIA_GC_INTERVAL_MINUTES,
+            id="abandoned_upload_gc",
+            replace_existing=True,
+        )
         scheduler.start()
-        logger.info("Appointment reminder scheduler started")
+        logger.info("Appointment reminder scheduler started (worker=%s)", WORKER_ID)
         print(
             "✅ [STARTUP] Appointment reminder scheduler started "
-            "(1 day before + same day at 9:00 AM Iraq time)"
+            f"(kinds={','.join(settings.reminder_kinds)}, poll every {settings.REMINDER_POLL_SECONDS}s)"
         )
     except Exception as e:
         logger.error(f"Failed to start appointment reminder scheduler: {e}")
         print(f"⚠️ [STARTUP] Failed to start appointment reminder scheduler: {e}")
     
+    from app.services.presence_service import start_presence_flush
+    from app.services.socket_service import start_registry_refresh
+
+    start_registry_refresh()
+    start_presence_flush()
+
     print("✅ [STARTUP] Application ready!")
     print("=" * 60)
 
@@ -356,4 +433,14 @@ async def on_shutdown():
             print("✅ [SHUTDOWN] Appointment reminder scheduler stopped")
         except Exception as e:
             logger.error(f"Error stopping scheduler: {e}")
+    from app.services.presence_service import stop_presence_flush
+    from app.services.socket_service import stop_registry_refresh
+
+    stop_registry_refresh()
+    await stop_presence_flush()
+    from app.services.image_variants import shutdown_image_variants
+    from app.services.media_storage import shutdown_media_storage
+
+    shutdown_image_variants()
+    shutdown_media_storage()
     logger.info("Shutting down application...")
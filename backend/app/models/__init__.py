@@ -5,7 +5,7 @@ from .patient import Patient, DoctorPatientProfile
 from .appointment import Appointment
 from .call_center_appointment import CallCenterAppointment
 from .note import TreatmentNote
-from .media import GalleryImage
+from .media import GalleryImage, ImageVariants, MediaBlob, PendingUpload
 from .chat import ChatRoom, ChatMessage
 from .notification import DeviceToken, Notification
 from .otp import OTPRequest
@@ -14,4 +14,6 @@ from .doctor_working_hours import DoctorWorkingHours
 from .implant_stage import ImplantStage
 from .dental_chart import DentalChart, DentalNoteEntry
 from .reception_queue import ReceptionQueueDay, ReceptionQueueEntry
-from .presence import DoctorPresence
\ No newline at end of file
+from .presence import DoctorPresence
+from .job import JobLease
+from .reminder import ReminderSchedule
@@ -4,6 +4,8 @@ from pydantic import Field
 from datetime import datetime, timezone
 from typing import List, Optional
 
+from .media import ImageVariants
+
 class Appointment(Document):
     """موعد مريض لدى طبيب."""
     patient_id: Indexed(OID)
@@ -14,6 +16,7 @@ class Appointment(Document):
     note: str | None = None
     image_path: str | None = None  # للتوافق مع البيانات القديمة
     image_paths: List[str] = Field(default_factory=list)  # قائمة الصور الجديدة
+    image_variants: List[ImageVariants] = Field(default_factory=list)
     # الحالات المعتمدة: pending (قيد الانتظار), completed (مكتمل), cancelled (ملغي)
     # late لا يُخزَّن في قاعدة البيانات؛ يتم احتسابه عند العرض فقط.
     status: Indexed(str) = "pending"  # pending|completed|cancelled
@@ -21,6 +24,7 @@ class Appointment(Document):
     remind_3d_sent: bool = False
     remind_1d_sent: bool = False
     remind_day_sent: bool = False
+    remind_2h_sent: bool = False
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
@@ -3,9 +3,14 @@ from beanie import PydanticObjectId as OID
 from pydantic import Field
 from datetime import datetime, timezone
 from typing import Optional
+from pymongo import IndexModel, ASCENDING, DESCENDING
 
 from app.constants import Role
 
+# فهرس فريد (patient_id, doctor_id) — يُنشئه migrate_legacy_chat_rooms بعد دمج
+# الغرف المكررة القديمة، لذلك لا يُعرَّف في Settings.indexes.
+CHAT_ROOM_PAIR_INDEX = "chat_room_patient_doctor_unique"
+
 
 class ChatRoom(Document):
     """غرفة محادثة واحدة لكل زوج (طبيب، مريض)."""
@@ -17,8 +22,31 @@ class ChatRoom(Document):
     doctor_id: Indexed(OID) | None = None
     patient_id: Indexed(OID) | None = None
 
+    # ملخص آخر رسالة وعدد غير المقروء لكل طرف — يُحدَّث ذرياً مع كل رسالة/تعديل/قراءة
+    # حتى تصبح قائمة المحادثات استعلاماً واحداً مرتباً.
+    last_message_id: OID | None = None
+    last_message_at: datetime | None = None
+    last_message_preview: str | None = None
+    last_sender_user_id: OID | None = None
+    unread_for_doctor: int = 0
+    unread_for_patient: int = 0
+
     class Settings:
         name = "chat_rooms"
+        indexes = [
+            IndexModel(
+                [("doctor_user_id", ASCENDING), ("last_message_at", DESCENDING)],
+                name="chat_room_doctor_last_message",
+            ),
+            IndexModel(
+                [("patient_id", ASCENDING), ("last_message_at", DESCENDING)],
+                name="chat_room_patient_last_message",
+            ),
+            IndexModel(
+                [("patient_user_id", ASCENDING), ("last_message_at", DESCENDING)],
+                name="chat_room_patient_user_last_message",
+            ),
+        ]
 
 
 class ChatMessage(Document):
@@ -33,3 +61,10 @@ class ChatMessage(Document):
 
     class Settings:
         name = "chat_messages"
+        indexes = [
+            # صفحات تاريخ المحادثة بمؤشر (created_at, _id) في الاتجاهين
+            IndexModel(
+                [("room_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+                name="chat_message_room_created",
+            ),
+        ]
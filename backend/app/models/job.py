@@ -0,0 +1,29 @@
+from beanie import Document, Indexed
+from pydantic import Field
+from datetime import datetime, timezone
+
+
+class JobLease(Document):
+    """قفل موزّع لمهمة دورية + حالة آخر تشغيل (سجل واحد لكل مهمة).
+
+    - owner / lease_expires_at: العامل الذي يحمل القفل حالياً وحتى متى.
+    - last_*: نتيجة آخر تشغيل لعرضها في لوحة المدير.
+    """
+
+    name: Indexed(str, unique=True)
+    owner: str | None = None
+    lease_expires_at: datetime | None = None
+    heartbeat_at: datetime | None = None
+
+    last_started_at: datetime | None = None
+    last_finished_at: datetime | None = None
+    last_duration_ms: int | None = None
+    last_outcome: str | None = None  # success | error
+    last_error: str | None = None
+    last_owner: str | None = None
+    run_count: int = 0
+
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+    class Settings:
+        name = "job_leases"
@@ -1,18 +1,32 @@
 from beanie import Document, Indexed
 from beanie import PydanticObjectId as OID
-from pydantic import Field
+from pydantic import BaseModel, Field
 from datetime import datetime, timezone
-from typing import Optional
-from pymongo import IndexModel, ASCENDING
+from typing import List, Optional
+from pymongo import IndexModel, ASCENDING, DESCENDING
+
+from app.constants import Role
+
+
+class ImageVariants(BaseModel):
+    """نسخ مصغّرة (بدون EXIF) لصورة أصلية: للقوائم والعرض بدل تحميل الأصل."""
+    original: str
+    thumb: Optional[str] = None
+    medium: Optional[str] = None
+    # نسخة بالحجم الكامل محوّلة من HEIC أو من JPEG كبير
+    display: Optional[str] = None
 
 
 class GalleryImage(Document):
     """صورة مرفوعة للمريض مع ملاحظة اختيارية."""
     patient_id: Indexed(OID)
     uploaded_by_user_id: Indexed(OID) | None = None
+    # دور الرافع وقت الرفع: فلترة المعرض (المريض/الطبيب) تتم في الاستعلام نفسه
+    uploaded_by_role: Optional[Role] = None
     doctor_id: Indexed(OID) | None = None
     note: str | None = None
     image_path: str
+    image_variants: List[ImageVariants] = Field(default_factory=list)
     # مفتاح عملية العميل لمنع تكرار الرفع عند إعادة المحاولة
     client_operation_id: Optional[str] = None
     created_at: Indexed(datetime) = Field(default_factory=lambda: datetime.now(timezone.utc))
@@ -26,4 +40,62 @@ class GalleryImage(Document):
                 sparse=True,
                 name="gallery_client_operation_id_unique_sparse",
             ),
+            IndexModel(
+                [("patient_id", ASCENDING), ("uploaded_by_role", ASCENDING), ("created_at", DESCENDING)],
+                name="gallery_patient_role_created",
+            ),
+        ]
+
+
+class MediaBlob(Document):
+    """فهرس المحتوى: بصمة SHA-256 لملف مريض → مفتاح التخزين وعدد السجلات التي تشير إليه."""
+    patient_id: OID
+    sha256: str
+    key: str
+    url: str
+    size: int = 0
+    content_type: Optional[str] = None
+    ref_count: int = 1
+    # مفاتيح النسخ المصغّرة — تُحذف مع الأصل
+    variant_keys: List[str] = Field(default_factory=list)
+    # وقت وصول ref_count إلى صفر؛ الـ GC يحذف بعد مهلة
+    orphaned_at: Optional[datetime] = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+    class Settings:
+        name = "media_blobs"
+        indexes = [
+            IndexModel(
+                [("patient_id", ASCENDING), ("sha256", ASCENDING)],
+                unique=True,
+                name="media_blob_patient_sha256_unique",
+            ),
+            IndexModel([("url", ASCENDING)], name="media_blob_url"),
+            IndexModel(
+                [("orphaned_at", ASCENDING)],
+                partialFilterExpression={"orphaned_at": {"$type": "date"}},
+                name="media_blob_orphaned_at",
+            ),
+        ]
+
+
+class PendingUpload(Document):
+    """مفتاح رفع مباشر (presigned PUT) لم يُؤكَّد بعد؛ يُحذف عند التأكيد.
+
+    ما يبقى بعد انتهاء الرابط + PRESIGNED_UPLOAD_GRACE_SECONDS يُحذف مع الملف
+    (collect_abandoned_uploads).
+    """
+    key: str
+    patient_id: OID
+    folder: str
+    uploaded_by_user_id: OID | None = None
+    expires_at: datetime
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+    class Settings:
+        name = "pending_uploads"
+        indexes = [
+            IndexModel([("key", ASCENDING)], unique=True, name="pending_upload_key_unique"),
+            IndexModel([("expires_at", ASCENDING)], name="pending_upload_expires_at"),
         ]
@@ -5,6 +5,8 @@ from datetime import datetime, timezone
 from typing import List, Optional
 from pymongo import IndexModel, ASCENDING
 
+from .media import ImageVariants
+
 class TreatmentNote(Document):
     """سجل علاجي نصي مع صور اختيارية."""
     patient_id: Indexed(OID)
@@ -12,6 +14,7 @@ class TreatmentNote(Document):
     note: str | None = None
     image_path: str | None = None  # للتوافق مع البيانات القديمة
     image_paths: List[str] = Field(default_factory=list)  # قائمة الصور الجديدة
+    image_variants: List[ImageVariants] = Field(default_factory=list)
     # مفتاح عملية العميل لمنع التكرار عند إعادة محاولة الرفع (at-least-once)
     client_operation_id: Optional[str] = None
     created_at: Indexed(datetime) = Field(default_factory=lambda: datetime.now(timezone.utc))
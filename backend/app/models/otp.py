@@ -1,7 +1,12 @@
 from beanie import Document
 from pydantic import Field
+from pymongo import ASCENDING, DESCENDING, IndexModel
 from datetime import datetime, timezone
 
+# الطلبات تُحذف تلقائياً (TTL index) بعد انتهاء صلاحيتها بهذه المدة
+OTP_RETENTION_SECONDS = 24 * 60 * 60
+
+
 class OTPRequest(Document):
     """طلبات OTP للتحقق من الهاتف مع انتهاء صلاحية وتجزئة الكود."""
     phone: str
@@ -13,3 +18,16 @@ class OTPRequest(Document):
 
     class Settings:
         name = "otp_requests"
+        indexes = [
+            # آخر طلب غير مُتحقق لرقم معيّن: verify_otp_or_raise
+            IndexModel(
+                [("phone", ASCENDING), ("verified_at", ASCENDING), ("created_at", DESCENDING)],
+                name="otp_phone_verified_created",
+            ),
+            # Mongo يحذف الطلبات المنتهية تلقائياً فلا يكبر الـ collection
+            IndexModel(
+                [("expires_at", ASCENDING)],
+                name="otp_expires_ttl",
+                expireAfterSeconds=OTP_RETENTION_SECONDS,
+            ),
+        ]
@@ -2,6 +2,10 @@ from datetime import datetime, timezone
 
 from beanie import Document, Indexed, PydanticObjectId as OID
 from pydantic import Field
+from pymongo import ASCENDING, IndexModel
+
+# الصفوف التي لم يصلها heartbeat منذ هذه المدة تُحذف تلقائياً (TTL index)
+PRESENCE_RETENTION_SECONDS = 24 * 60 * 60
 
 
 class DoctorPresence(Document):
@@ -14,3 +18,10 @@ class DoctorPresence(Document):
 
     class Settings:
         name = "doctor_presence"
+        indexes = [
+            IndexModel(
+                [("last_seen_at", ASCENDING)],
+                name="doctor_presence_last_seen_ttl",
+                expireAfterSeconds=PRESENCE_RETENTION_SECONDS,
+            ),
+        ]
@@ -0,0 +1,41 @@
+from beanie import Document
+from beanie import PydanticObjectId as OID
+from pydantic import Field
+from datetime import datetime, timezone
+from pymongo import IndexModel, ASCENDING
+
+
+class ReminderSchedule(Document):
+    """تذكير مجدول لموعد واحد ونوع واحد (3d | 1d | day | 2h).
+
+    يُحدَّث عند إنشاء الموعد أو تعديل وقته أو إلغائه، ويلتقط الـ poller
+    فقط السجلات المستحقة (status=pending و due_at <= الآن).
+    """
+
+    appointment_id: OID
+    kind: str
+    due_at: datetime
+    # pending | claimed | sent | cancelled | failed (بعد MAX_ATTEMPTS)
+    status: str = "pending"
+    claimed_by: str | None = None
+    claimed_at: datetime | None = None
+    attempts: int = 0
+    # وقت جديد وصل أثناء الالتقاط (تعديل الموعد)؛ يُطبَّق عند تحرير السجل
+    pending_due_at: datetime | None = None
+    sent_at: datetime | None = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+    class Settings:
+        name = "reminder_schedule"
+        indexes = [
+            IndexModel(
+                [("appointment_id", ASCENDING), ("kind", ASCENDING)],
+                unique=True,
+                name="reminder_appointment_kind_unique",
+            ),
+            IndexModel(
+                [("status", ASCENDING), ("due_at", ASCENDING)],
+                name="reminder_status_due_at",
+            ),
+        ]
@@ -1,7 +1,103 @@
-from slowapi import Limiter
+"""Rate limiting shared by every worker.
+
+slowapi keeps its counters in the storage named by RATE_LIMIT_STORAGE_URI
+(redis://, mongodb:// or memory://). When it is empty we reuse a Redis
+SOCKETIO_MESSAGE_QUEUE if there is one, otherwise fall back to per-process
+memory. All limits use a moving (sliding) window so a burst straddling a
+minute boundary cannot get twice the budget.
+
+Per-IP limits are the `@limiter.limit(...)` decorators on the routes; per-phone
+limits (OTP request/verify) call `hit_or_raise` directly. Both go through the
+same store and the same code path: the storage client is synchronous, so every
+round-trip runs in a thread and never blocks the event loop, and if the store
+is down the request is let through (logged) instead of failing with a 500.
+"""
+
+import asyncio
+import functools
+
+from fastapi import HTTPException, Request
+from limits import parse_many
+from limits.storage import storage_from_string
+from limits.strategies import MovingWindowRateLimiter
 from slowapi.util import get_remote_address
 
-# Global limiter instance reused across the app
-limiter = Limiter(key_func=get_remote_address)
+from app.config import get_settings
+from app.utils.logger import get_logger
+
+settings = get_settings()
+logger = get_logger("rate_limit")
+
+
+def _storage_uri() -> str:
+    uri = (settings.RATE_LIMIT_STORAGE_URI or "").strip()
+    if uri:
+        return uri
+    queue = (settings.SOCKETIO_MESSAGE_QUEUE or "").strip()
+    if queue.split("://", 1)[0] in ("redis", "rediss"):
+        return queue
+    return "memory://"
+
+
+RATE_LIMIT_STORAGE_URI = _storage_uri()
+if RATE_LIMIT_STORAGE_URI.startswith("memory://"):
+    logger.info("Rate limits are process-local (set RATE_LIMIT_STORAGE_URI to share them)")
+
+_window = MovingWindowRateLimiter(storage_from_string(RATE_LIMIT_STORAGE_URI))
+
+
+def _hit(limit: str, scope: str, key: str) -> bool:
+    # Check every window first so a rejected request does not burn the others.
+    items = parse_many(limit)
+    if not all(_window.test(item, scope, key) for item in items):
+        return False
+    return all(_window.hit(item, scope, key) for item in items)
 
 
+async def hit_or_raise(limit: str, scope: str, key: str) -> None:
+    """Count one hit for (scope, key) against `limit` ("3/10minutes;10/day"), 429 if over.
+
+    The storage client is synchronous, so the round-trip runs off the event loop.
+    If the shared store is down we let the request through rather than lock
+    everyone out of login.
+    """
+    if not limit or not key:
+        return
+    try:
+        allowed = await asyncio.to_thread(_hit, limit, scope, key)
+    except Exception as exc:
+        logger.warning("Rate limit store unavailable (%s): %s", scope, exc)
+        return
+    if not allowed:
+        raise HTTPException(status_code=429, detail="Too many requests, try again later")
+
+
+class IPRateLimiter:
+    """Per-IP route limits on top of `hit_or_raise` (same store, off the event loop)."""
+
+    def limit(self, limit: str):
+        """Decorator: `limit` ("5/minute") per client IP for this route.
+
+        Like slowapi, the endpoint must take a `request: Request` parameter.
+        """
+
+        def decorator(func):
+            scope = f"route:{func.__module__}.{func.__name__}"
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                request = kwargs.get("request")
+                if not isinstance(request, Request):
+                    request = next((a for a in args if isinstance(a, Request)), None)
+                if request is None:
+                    raise RuntimeError(f"{func.__name__} needs a `request: Request` parameter to be rate limited")
+                await hit_or_raise(limit, scope, get_remote_address(request))
+                return await func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+
+# Global limiter instance reused across the app
+limiter = IPRateLimiter()
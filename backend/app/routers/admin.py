@@ -2,7 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException, Body
 from typing import List
 
 from app.schemas import UserOut, PatientOut, PatientCreate, PatientUpdate
-from app.security import require_roles, get_current_user
+from app.security import require_roles, get_current_user, invalidate_principal
 from app.constants import Role
 from app.services.admin_service import (
     create_staff_user,
@@ -11,7 +11,8 @@ from app.services.admin_service import (
 from app.services.patient_service import update_patient_by_admin, delete_patient
 from app.models import Patient, Doctor, AssignmentLog, User
 from app.services import patient_service
-from app.schemas import AppointmentOut, NoteOut, GalleryOut
+from app.services.image_variants import variant_fields
+from app.schemas import AppointmentOut, NoteOut, GalleryOut, JobStatusOut
 from app.utils.patient_out import build_patient_out
 from datetime import datetime, timezone
 from typing import Optional
@@ -101,6 +102,7 @@ async def set_doctor_manager(
 
     d.is_manager = bool(is_manager)
     await d.save()
+    invalidate_principal(d.user_id)
     return {"ok": True, "doctor_id": str(d.id), "is_manager": d.is_manager}
 
 @router.post("/assign", summary="تعيين مريض لأطباء")
@@ -308,6 +310,7 @@ async def admin_patient_appointments(patient_id: str):
             scheduled_at=a.scheduled_at.isoformat(),
             note=a.note,
             image_path=a.image_path,
+            **variant_fields(a),
             image_paths=a.image_paths or [],
             status=a.status,
         )
@@ -330,6 +333,7 @@ async def admin_patient_gallery(patient_id: str):
                     id=str(g.id),
                     patient_id=str(g.patient_id),
                     image_path=g.image_path,
+                    **variant_fields(g),
                     note=g.note,
                     created_at=g.created_at.isoformat() if g.created_at else datetime.now(timezone.utc).isoformat(),
                 )
@@ -338,3 +342,37 @@ async def admin_patient_gallery(patient_id: str):
             # Skip this image if there's an error
             continue
     return result
+
+
+@router.get("/jobs", response_model=list[JobStatusOut])
+async def list_jobs():
+    """حالة المهام الدورية (التذكيرات وغيرها): من يحمل القفل، آخر تشغيل، المدة والنتيجة."""
+    from app.services.job_runner import list_job_status
+
+    def _iso(dt: datetime | None) -> str | None:
+        return dt.isoformat() if dt else None
+
+    return [
+        JobStatusOut(
+            name=job.name,
+            owner=job.owner,
+            lease_expires_at=_iso(job.lease_expires_at),
+            heartbeat_at=_iso(job.heartbeat_at),
+            last_started_at=_iso(job.last_started_at),
+            last_finished_at=_iso(job.last_finished_at),
+            last_duration_ms=job.last_duration_ms,
+            last_outcome=job.last_outcome,
+            last_error=job.last_error,
+            last_owner=job.last_owner,
+            run_count=job.run_count,
+        )
+        for job in await list_job_status()
+    ]
+
+
+@router.get("/media/upload-metrics")
+async def media_upload_metrics():
+    """إحصائيات رفع الوسائط على هذا الـ worker: العدد، الإخفاقات، إعادة المحاولة، وزمن الرفع p50/p95/p99."""
+    from app.services.media_storage import upload_metrics
+
+    return upload_metrics()
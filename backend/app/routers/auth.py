@@ -5,7 +5,7 @@ from datetime import datetime, timezone
 from app.rate_limit import limiter
 from app.schemas import OTPRequestIn, OTPVerifyIn, Token, UserOut, StaffLoginIn, PatientCreate
 from app.models.user import User
-from app.security import get_current_user
+from app.security import get_current_user, get_doctor_profile, invalidate_principal
 from app.constants import Role
 from app.services.auth_service import (
     request_otp,
@@ -14,9 +14,9 @@ from app.services.auth_service import (
     refresh_access_token,
 )
 from app.services.admin_service import create_patient
-from app.security import create_access_token
+from app.security import create_access_token, token_claims
 from fastapi import HTTPException
-from app.utils.r2_clinic import upload_clinic_image
+from app.utils.r2_clinic import upload_clinic_file
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
@@ -31,7 +31,8 @@ async def test_auth_endpoint():
 @limiter.limit("5/minute")
 async def route_request_otp(request: Request, payload: OTPRequestIn):
     """طلب إرسال رمز تحقق (OTP) إلى رقم الهاتف المدخل (للمرضى فقط).
-    Rate limit: 5 requests per minute per IP.
+    Rate limit: 5 requests per minute per IP, plus OTP_REQUEST_PHONE_LIMIT per phone
+    (sliding windows, shared between workers).
     """
     print("=" * 60)
     print("🔐 [AUTH ROUTER] /auth/request-otp endpoint called")
@@ -58,7 +59,7 @@ async def route_request_otp(request: Request, payload: OTPRequestIn):
 async def route_verify_otp(request: Request, payload: OTPVerifyIn):
     """التحقق من رمز OTP فقط - لا ينشئ حساب جديد.
     يرجع {account_exists: true/false, token: Token} أو {account_exists: false}
-    Rate limit: 10 requests per minute per IP.
+    Rate limit: 10 requests per minute per IP, plus OTP_VERIFY_PHONE_LIMIT per phone.
     """
     print("=" * 60)
     print("🔐 [AUTH ROUTER] /auth/verify-otp endpoint called")
@@ -142,11 +143,7 @@ async def route_create_patient_account(request: Request, payload: PatientCreate)
         
         # إنشاء access_token و refresh_token
         from app.security import create_refresh_token
-        token_data = {
-            "sub": str(user.id),
-            "role": user.role,
-            "phone": user.phone,
-        }
+        token_data = token_claims(user)
         access_token = create_access_token(token_data)
         refresh_token = create_refresh_token(token_data)
         print("=" * 60)
@@ -239,9 +236,7 @@ async def route_me(current: User = Depends(get_current_user)):
     doctor_manager = None
     try:
         if current.role == Role.DOCTOR:
-            from app.models import Doctor
-            d = await Doctor.find_one(Doctor.user_id == current.id)
-            doctor_manager = bool(getattr(d, "is_manager", False)) if d else False
+            _, doctor_manager = await get_doctor_profile(current)
     except Exception:
         doctor_manager = None
 
@@ -288,13 +283,12 @@ async def route_update_me(
     
     current.updated_at = datetime.now(timezone.utc)
     await current.save()
+    invalidate_principal(current.id)
     
     doctor_manager = None
     try:
         if current.role == Role.DOCTOR:
-            from app.models import Doctor
-            d = await Doctor.find_one(Doctor.user_id == current.id)
-            doctor_manager = bool(getattr(d, "is_manager", False)) if d else False
+            _, doctor_manager = await get_doctor_profile(current)
     except Exception:
         doctor_manager = None
 
@@ -325,31 +319,28 @@ async def route_upload_profile_image(
             status_code=400,
             detail=f"نوع الملف غير مدعوم. الأنواع المدعومة: {', '.join(IMAGE_TYPES)}",
         )
-    
-    file_bytes = await image.read()
 
     # رفع الصورة باستخدام user_id بدلاً من patient_id (صور موظفين)
-    image_path = await upload_clinic_image(
+    image_path = await upload_clinic_file(
         patient_id=str(current.id),
         folder="profile",
-        file_bytes=file_bytes,
+        upload=image,
         content_type=image.content_type,
         name_hint=current.name,
     )
     
     # تحديث imageUrl في User
-    # upload_clinic_image now returns a direct /media/... URL
+    # upload_clinic_file returns a direct /media/... URL
     
     current.imageUrl = image_path
     current.updated_at = datetime.now(timezone.utc)
     await current.save()
+    invalidate_principal(current.id)
     
     doctor_manager = None
     try:
         if current.role == Role.DOCTOR:
-            from app.models import Doctor
-            d = await Doctor.find_one(Doctor.user_id == current.id)
-            doctor_manager = bool(getattr(d, "is_manager", False)) if d else False
+            _, doctor_manager = await get_doctor_profile(current)
     except Exception:
         doctor_manager = None
 
@@ -4,7 +4,7 @@ from pydantic import BaseModel
 from beanie import PydanticObjectId as OID
 
 from app.models import User
-from app.security import verify_internal_secret
+from app.security import invalidate_principal, verify_internal_secret
 
 
 router = APIRouter(
@@ -35,4 +35,5 @@ async def increment_call_center_accepted_count(body: IncrementAcceptedBody):
     current = getattr(user, "call_center_accepted_count", 0) or 0
     user.call_center_accepted_count = current + 1
     await user.save()
+    invalidate_principal(user.id)
     return {"ok": True, "user_id": body.user_id, "new_count": user.call_center_accepted_count}
@@ -1,18 +1,25 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File, Form
+from beanie.operators import In
 from datetime import datetime, timezone
 from beanie import PydanticObjectId as OID
-from typing import Optional
+from typing import Literal, Optional
 
 from app.security import get_current_user
-from app.schemas import ChatMessageOut, ChatMessageIn, ChatListItemOut
+from app.schemas import ChatMessageOut, ChatMessageIn, ChatListItemOut, ChatHistoryOut
 from app.models import ChatRoom, ChatMessage, Patient, User, Doctor
 from app.constants import Role
 from app.utils.chat_helpers import (
+    decode_message_cursor,
+    encode_message_cursor,
     ensure_chat_room_user_ids,
+    fetch_room_messages,
     get_chat_room,
     get_or_create_chat_room,
+    mark_room_message_read,
+    record_room_message,
+    record_room_message_edit,
 )
-from app.utils.r2_clinic import upload_clinic_image
+from app.utils.r2_clinic import upload_clinic_file
 from app.utils.patient_out import resolve_patient_identity, patient_name_hint_for_id
 from app.utils.logger import get_logger
 from pydantic import BaseModel
@@ -94,81 +101,64 @@ async def _get_or_room_for_user(*, patient_id: str, user: User, doctor_id: str |
 
 @router.get("/list", response_model=list[ChatListItemOut])
 async def get_chat_list(current: User = Depends(get_current_user)):
-    """جلب قائمة المحادثات للطبيب أو المريض مع آخر رسالة وعدد الرسائل غير المقروءة."""
+    """جلب قائمة المحادثات للطبيب أو المريض مع آخر رسالة وعدد الرسائل غير المقروءة.
+
+    تعتمد على حقول الملخص في ChatRoom (last_message_* و unread_for_*):
+    استعلام واحد مرتب للغرف ثم جلب المرضى/المستخدمين دفعة واحدة.
+    """
     if current.role == Role.DOCTOR:
         doctor = await Doctor.find_one(Doctor.user_id == current.id)
         if not doctor:
             raise HTTPException(status_code=403, detail="Doctor profile not found")
 
-        rooms = []
-        primary_rooms = await ChatRoom.find(ChatRoom.doctor_user_id == current.id).to_list()
-        legacy_rooms = await ChatRoom.find(
-            ChatRoom.doctor_user_id == None,
-            ChatRoom.doctor_id == doctor.id,
-        ).to_list()
-
-        seen_ids: set[str] = set()
-        for room in primary_rooms + legacy_rooms:
-            room_key = str(room.id)
-            if room_key in seen_ids:
-                continue
-            seen_ids.add(room_key)
-            rooms.append(room)
+        rooms = await ChatRoom.find(
+            ChatRoom.doctor_user_id == current.id,
+            ChatRoom.last_message_at != None,  # noqa: E711
+        ).sort(-ChatRoom.last_message_at).to_list()
+
+        patient_ids = list({r.patient_id for r in rooms if r.patient_id})
+        patients = await Patient.find(In(Patient.id, patient_ids)).to_list() if patient_ids else []
+        patient_map = {p.id: p for p in patients}
+
+        # غرف قديمة بدون patient_id: نربطها بأول ملف لنفس الحساب
+        legacy_user_ids = list({r.patient_user_id for r in rooms if not r.patient_id and r.patient_user_id})
+        patient_by_user: dict[OID, Patient] = {}
+        if legacy_user_ids:
+            for p in await Patient.find(In(Patient.user_id, legacy_user_ids)).to_list():
+                current_pick = patient_by_user.get(p.user_id)
+                if current_pick is None or (p.is_primary and not current_pick.is_primary):
+                    patient_by_user[p.user_id] = p
+
+        user_ids = {p.user_id for p in patients} | {p.user_id for p in patient_by_user.values()}
+        users = await User.find(In(User.id, list(user_ids))).to_list() if user_ids else []
+        user_map = {u.id: u for u in users}
 
         result = []
         for room in rooms:
-            room = await ensure_chat_room_user_ids(room)
             if room.patient_user_id is None:
                 continue
-
             if room.patient_id:
-                patient = await Patient.get(room.patient_id)
+                patient = patient_map.get(room.patient_id)
             else:
-                patient = await Patient.find_one(Patient.user_id == room.patient_user_id)
+                patient = patient_by_user.get(room.patient_user_id)
             if not patient:
                 continue
-
-            patient_user = await User.get(patient.user_id)
+            patient_user = user_map.get(patient.user_id)
             if not patient_user:
                 continue
 
             identity = resolve_patient_identity(patient, patient_user)
-
-            last_messages = await ChatMessage.find(
-                ChatMessage.room_id == room.id
-            ).sort(-ChatMessage.created_at).limit(1).to_list()
-            last_message = last_messages[0] if last_messages else None
-
-            unread_count = await ChatMessage.find(
-                ChatMessage.room_id == room.id,
-                ChatMessage.sender_user_id == room.patient_user_id,
-                ChatMessage.is_read == False,
-            ).count()
-
-            if not last_message:
-                continue
-
-            last_message_text = None
-            last_message_time = None
-            if last_message.imageUrl:
-                last_message_text = "صورة"
-            else:
-                last_message_text = last_message.content
-            last_message_time = last_message.created_at.isoformat()
-
             result.append(ChatListItemOut(
                 patient_id=str(patient.id),
                 patient_name=identity["name"] or identity["phone"],
                 patient_image_url=identity["imageUrl"],
-                last_message=last_message_text,
-                last_message_time=last_message_time,
-                unread_count=unread_count,
+                last_message=room.last_message_preview,
+                last_message_time=room.last_message_at.isoformat(),
+                unread_count=room.unread_for_doctor,
                 room_id=str(room.id),
                 doctor_id=str(doctor.id),
                 doctor_user_id=str(doctor.user_id) if doctor.user_id else None,
             ))
-
-        result.sort(key=lambda x: x.last_message_time or "", reverse=True)
         return result
     
     elif current.role == Role.PATIENT:
@@ -177,31 +167,34 @@ async def get_chat_list(current: User = Depends(get_current_user)):
             raise HTTPException(status_code=404, detail="Patient not found")
 
         family_ids = [p.id for p in family_patients]
-        rooms = []
-        primary_rooms = await ChatRoom.find(
-            {"patient_id": {"$in": family_ids}}
-        ).to_list()
-        legacy_rooms = await ChatRoom.find(
-            ChatRoom.patient_user_id == current.id,
-        ).to_list()
-
-        seen_ids: set[str] = set()
-        for room in primary_rooms + legacy_rooms:
-            room_key = str(room.id)
-            if room_key in seen_ids:
-                continue
-            seen_ids.add(room_key)
-            rooms.append(room)
+        rooms = await ChatRoom.find(
+            {
+                "$or": [
+                    {"patient_id": {"$in": family_ids}},
+                    {"patient_user_id": current.id},
+                ],
+                "last_message_at": {"$ne": None},
+            }
+        ).sort(-ChatRoom.last_message_at).to_list()
 
         patient_map = {p.id: p for p in family_patients}
 
+        doctor_user_ids = list({r.doctor_user_id for r in rooms if r.doctor_user_id})
+        doctor_users = await User.find(In(User.id, doctor_user_ids)).to_list() if doctor_user_ids else []
+        doctor_user_map = {u.id: u for u in doctor_users}
+
+        # غرف قديمة بدون doctor_id: نستنتج ملف الطبيب من doctor_user_id
+        legacy_doctor_user_ids = list({r.doctor_user_id for r in rooms if not r.doctor_id and r.doctor_user_id})
+        doctor_profile_by_user: dict[OID, OID] = {}
+        if legacy_doctor_user_ids:
+            for d in await Doctor.find(In(Doctor.user_id, legacy_doctor_user_ids)).to_list():
+                doctor_profile_by_user.setdefault(d.user_id, d.id)
+
         result = []
         for room in rooms:
-            room = await ensure_chat_room_user_ids(room)
             if room.doctor_user_id is None:
                 continue
-
-            doctor_user = await User.get(room.doctor_user_id)
+            doctor_user = doctor_user_map.get(room.doctor_user_id)
             if not doctor_user:
                 continue
 
@@ -211,54 +204,40 @@ async def get_chat_list(current: User = Depends(get_current_user)):
             elif len(family_patients) == 1:
                 profile_patient = family_patients[0]
 
-            last_messages = await ChatMessage.find(
-                ChatMessage.room_id == room.id
-            ).sort(-ChatMessage.created_at).limit(1).to_list()
-            last_message = last_messages[0] if last_messages else None
-
-            unread_count = await ChatMessage.find(
-                ChatMessage.room_id == room.id,
-                ChatMessage.sender_user_id == room.doctor_user_id,
-                ChatMessage.is_read == False,
-            ).count()
-
-            if not last_message:
-                continue
-
-            last_message_text = None
-            last_message_time = None
-            if last_message.imageUrl:
-                last_message_text = "صورة"
-            else:
-                last_message_text = last_message.content
-            last_message_time = last_message.created_at.isoformat()
-
-            doctor_profile_id = room.doctor_id
-            if doctor_profile_id is None and room.doctor_user_id is not None:
-                doctor_profile = await Doctor.find_one(Doctor.user_id == room.doctor_user_id)
-                if doctor_profile:
-                    doctor_profile_id = doctor_profile.id
-                    room.doctor_id = doctor_profile.id
-                    await room.save()
+            doctor_profile_id = room.doctor_id or doctor_profile_by_user.get(room.doctor_user_id)
 
             result.append(ChatListItemOut(
                 patient_id=str(profile_patient.id) if profile_patient else str(family_patients[0].id),
                 patient_name=doctor_user.name or doctor_user.phone,
                 patient_image_url=doctor_user.imageUrl,
-                last_message=last_message_text,
-                last_message_time=last_message_time,
-                unread_count=unread_count,
+                last_message=room.last_message_preview,
+                last_message_time=room.last_message_at.isoformat(),
+                unread_count=room.unread_for_patient,
                 room_id=str(room.id),
                 doctor_id=str(doctor_profile_id) if doctor_profile_id else None,
                 doctor_user_id=str(room.doctor_user_id) if room.doctor_user_id else None,
             ))
-
-        result.sort(key=lambda x: x.last_message_time or "", reverse=True)
         return result
     
     else:
         raise HTTPException(status_code=403, detail="Forbidden")
 
+def _message_out_from_doc(doc: dict) -> ChatMessageOut:
+    """ChatMessageOut من مستند خام (إسقاط MESSAGE_PROJECTION) دون بناء نموذج Beanie."""
+    sender_user_id = doc.get("sender_user_id")
+    created_at = doc.get("created_at")
+    return ChatMessageOut(
+        id=str(doc["_id"]),
+        room_id=str(doc["room_id"]),
+        sender_user_id=str(sender_user_id) if sender_user_id else None,
+        sender_role=doc.get("sender_role"),
+        content=doc.get("content") or "",
+        imageUrl=doc.get("imageUrl"),
+        is_read=doc.get("is_read", False),
+        created_at=created_at.isoformat() if created_at else "",
+    )
+
+
 @router.get("/{patient_id}/messages", response_model=list[ChatMessageOut])
 async def get_messages(
     patient_id: str, 
@@ -272,30 +251,51 @@ async def get_messages(
     if not room:
         return []
 
-    query = ChatMessage.find(ChatMessage.room_id == room.id)
-    
+    cursor = None
     if before:
         try:
-            dt = datetime.fromisoformat(before.replace('Z', '+00:00'))
-            query = query.find(ChatMessage.created_at < dt)
+            cursor = (datetime.fromisoformat(before.replace('Z', '+00:00')), None)
         except Exception:
             pass
-    
-    messages = await query.sort(-ChatMessage.created_at).limit(limit).to_list()
-    
-    return [
-        ChatMessageOut(
-            id=str(msg.id),
-            room_id=str(msg.room_id),
-            sender_user_id=str(msg.sender_user_id) if msg.sender_user_id else None,
-            sender_role=msg.sender_role,
-            content=msg.content,
-            imageUrl=msg.imageUrl,
-            is_read=msg.is_read,
-            created_at=msg.created_at.isoformat()
-        )
-        for msg in messages
-    ]
+
+    docs, _ = await fetch_room_messages(room.id, cursor=cursor, limit=limit)
+    return [_message_out_from_doc(doc) for doc in docs]
+
+
+@router.get("/{patient_id}/history", response_model=ChatHistoryOut)
+async def get_message_history(
+    patient_id: str,
+    cursor: str | None = Query(None, description="next_cursor from a previous page"),
+    direction: Literal["before", "after"] = Query(
+        "before", description="before: older messages (newest first); after: newer messages (oldest first)"
+    ),
+    limit: int = Query(50, ge=1, le=200),
+    doctor_id: str | None = Query(None, description="Doctor ID for patient to select specific doctor chat"),
+    current: User = Depends(get_current_user),
+):
+    """تاريخ المحادثة بمؤشر (created_at, _id) في الاتجاهين، مع وضع after للّحاق بعد إعادة الاتصال."""
+    decoded = None
+    if cursor:
+        try:
+            decoded = decode_message_cursor(cursor)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    room = await _get_room_for_user(patient_id=patient_id, user=current, doctor_id=doctor_id)
+    if not room:
+        return ChatHistoryOut(messages=[], next_cursor=cursor, has_more=False)
+
+    docs, has_more = await fetch_room_messages(
+        room.id, cursor=decoded, direction=direction, limit=limit
+    )
+    next_cursor = (
+        encode_message_cursor(docs[-1]["created_at"], docs[-1]["_id"]) if docs else cursor
+    )
+    return ChatHistoryOut(
+        messages=[_message_out_from_doc(doc) for doc in docs],
+        next_cursor=next_cursor,
+        has_more=has_more,
+    )
 
 @router.post("/{patient_id}/messages", response_model=ChatMessageOut)
 async def send_message(
@@ -331,17 +331,13 @@ async def send_message(
                 detail="نوع الملف غير مدعوم. فقط JPEG, PNG, WEBP",
             )
 
-        file_bytes = await image.read()
-        if not file_bytes:
-            raise HTTPException(status_code=400, detail="الصورة فارغة")
-
         # بعض الأجهزة ترسل octet-stream — نفترض jpeg
         upload_ct = content_type if content_type.startswith("image/") else "image/jpeg"
         patient_name_hint = await patient_name_hint_for_id(patient_id)
-        image_path = await upload_clinic_image(
+        image_path = await upload_clinic_file(
             patient_id=patient_id,
             folder="chat",
-            file_bytes=file_bytes,
+            upload=image,
             content_type=upload_ct,
             name_hint=patient_name_hint,
         )
@@ -357,6 +353,7 @@ async def send_message(
         is_read=False
     )
     await message.insert()
+    await record_room_message(room, message)
     
     # إرسال الرسالة عبر Socket.IO إذا كان متاحاً
     try:
@@ -504,6 +501,7 @@ async def edit_message(
 
     message.content = new_content
     await message.save()
+    await record_room_message_edit(room.id, message)
 
     if current.role == Role.DOCTOR:
         receiver_id = str(room.patient_user_id) if room.patient_user_id else None
@@ -584,8 +582,11 @@ async def mark_message_as_read(
     if message.room_id != room.id:
         raise HTTPException(status_code=403, detail="Forbidden")
 
-    message.is_read = True
-    await message.save()
+    if not message.is_read:
+        message.is_read = True
+        await message.save()
+        if message.sender_user_id != current.id:
+            await mark_room_message_read(room, current.id)
 
     return ChatMessageOut(
         id=str(message.id),
@@ -4,44 +4,14 @@ from beanie import PydanticObjectId as OID
 from app.constants import Role
 from app.services.chat_service import ConnectionManager
 from app.models import ChatRoom, ChatMessage, Patient, User, Doctor
-from app.utils.chat_helpers import ensure_chat_room_user_ids
+from app.utils.chat_helpers import get_or_create_chat_room, record_room_message
 
 router = APIRouter(prefix="/ws", tags=["chat"])
 manager = ConnectionManager()
 
 async def _get_room_for_pair(patient: Patient, doctor: Doctor) -> ChatRoom:
-    """Ensure a chat room exists for the given patient/doctor pair and populate user IDs."""
-    room = await ChatRoom.find_one(
-        ChatRoom.patient_user_id == patient.user_id,
-        ChatRoom.doctor_user_id == doctor.user_id,
-    )
-    if not room:
-        room = await ChatRoom.find_one(
-            ChatRoom.patient_id == patient.id,
-            ChatRoom.doctor_id == doctor.id,
-        )
-
-    if room:
-        room = await ensure_chat_room_user_ids(room)
-        updated = False
-        if room.patient_id is None:
-            room.patient_id = patient.id
-            updated = True
-        if room.doctor_id is None:
-            room.doctor_id = doctor.id
-            updated = True
-        if updated:
-            await room.save()
-    else:
-        room = ChatRoom(
-            patient_user_id=patient.user_id,
-            doctor_user_id=doctor.user_id,
-            patient_id=patient.id,
-            doctor_id=doctor.id,
-        )
-        await room.insert()
-
-    return room
+    """Ensure a chat room exists for the given patient/doctor pair."""
+    return await get_or_create_chat_room(patient=patient, doctor=doctor)
 
 @router.websocket("/chat/{patient_id}")
 async def chat_ws(websocket: WebSocket, patient_id: str, token: str = Query("")):
@@ -113,6 +83,7 @@ async def chat_ws(websocket: WebSocket, patient_id: str, token: str = Query(""))
                 continue
             msg = ChatMessage(room_id=room.id, sender_user_id=user.id, content=content)
             await msg.insert()
+            await record_room_message(room, msg)
             await manager.broadcast(room_key, {
                 "sender_id": str(user.id),
                 "message": content,
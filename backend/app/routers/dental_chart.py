@@ -11,10 +11,9 @@ from app.schemas import (
     DentalToothPatch,
     DentalNoteEntryOut,
 )
-from app.security import require_roles, get_current_user
+from app.security import require_roles, get_current_user, get_current_doctor_id
 from app.constants import Role
 from app.services import dental_chart_service
-from app.models import Doctor
 from app.models.dental_chart import DentalChart
 
 router = APIRouter(
@@ -92,10 +91,10 @@ def _empty_out(*, patient_id: str, doctor_id: str) -> DentalChartOut:
 
 
 async def _current_doctor_id(current) -> str:
-    doctor = await Doctor.find_one(Doctor.user_id == current.id)
-    if not doctor:
+    doctor_id = await get_current_doctor_id(current)
+    if not doctor_id:
         raise HTTPException(status_code=404, detail="Doctor profile not found")
-    return str(doctor.id)
+    return doctor_id
 
 
 def _notes_payload_from_upsert(
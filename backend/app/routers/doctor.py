@@ -20,12 +20,13 @@ from app.schemas import (
     PatientTransferIn,
 )
 from app.database import get_db
-from app.security import require_roles, get_current_user
+from app.security import require_roles, get_current_user, get_current_doctor_id, get_doctor_profile
 from app.constants import Role
 from app.services import patient_service
 from app.services.admin_service import create_patient
 from app.services.patient_service import assign_patient_doctors
-from app.utils.r2_clinic import upload_clinic_image
+from app.services.image_variants import variant_fields
+from app.utils.r2_clinic import upload_clinic_file
 from app.models import Doctor, User, Patient
 from app.utils.logger import get_logger
 from app.utils.patient_profile import build_doctor_profile_map, get_doctor_profile
@@ -47,7 +48,6 @@ IMAGE_TYPES = (
     "image/heic",
     "image/heif",
 )
-MAX_IMAGE_MB = 10
 
 router = APIRouter(prefix="/doctor", tags=["doctor"], dependencies=[Depends(require_roles([Role.DOCTOR]))])
 
@@ -64,20 +64,20 @@ async def _get_current_doctor_id(current) -> str:
     """
     Helper to resolve the Doctor document for the currently authenticated user.
     """
-    doctor = await Doctor.find_one(Doctor.user_id == current.id)
-    if not doctor:
+    doctor_id = await get_current_doctor_id(current)
+    if not doctor_id:
         raise HTTPException(status_code=404, detail="Doctor profile not found")
-    return str(doctor.id)
+    return doctor_id
 
 
 async def _require_doctor_manager(current) -> str:
     """Ensure current doctor has manager privileges. Returns doctor_id."""
-    doctor = await Doctor.find_one(Doctor.user_id == current.id)
-    if not doctor:
+    doctor_id, is_manager = await get_doctor_profile(current)
+    if not doctor_id:
         raise HTTPException(status_code=404, detail="Doctor profile not found")
-    if not getattr(doctor, "is_manager", False):
+    if not is_manager:
         raise HTTPException(status_code=403, detail="Doctor manager privileges required")
-    return str(doctor.id)
+    return doctor_id
 
 
 def _appointment_status_for_output(raw_status: str | None) -> str:
@@ -121,6 +121,7 @@ def _build_appointment_out(
         scheduled_at=scheduled_at.isoformat(),
         note=appointment.note,
         image_path=appointment.image_path,
+        **variant_fields(appointment),
         image_paths=getattr(appointment, "image_paths", []) if hasattr(appointment, "image_paths") else (([appointment.image_path] if appointment.image_path else [])),
         status=normalized_status,
         is_late=is_late,
@@ -380,12 +381,11 @@ async def upload_patient_profile_image(
     if not u:
         raise HTTPException(status_code=404, detail="User not found")
 
-    file_bytes = await image.read()
     patient_name_hint = resolve_patient_name(p, u)
-    image_path = await upload_clinic_image(
+    image_path = await upload_clinic_file(
         patient_id=str(p.id),
         folder="profile",
-        file_bytes=file_bytes,
+        upload=image,
         content_type=image.content_type,
         name_hint=patient_name_hint,
     )
@@ -689,6 +689,7 @@ async def add_note(
                 doctor_id=str(existing.doctor_id),
                 note=existing.note,
                 image_path=existing.image_path,
+                **variant_fields(existing),
                 image_paths=existing.image_paths if existing.image_paths else None,
                 created_at=existing.created_at.isoformat() if existing.created_at else datetime.now(timezone.utc).isoformat(),
             )
@@ -702,11 +703,10 @@ async def add_note(
                     status_code=400,
                     detail=f"Unsupported file type: {image.content_type}. Allowed types: {', '.join(IMAGE_TYPES)}",
                 )
-            file_bytes = await image.read()
-            image_path = await upload_clinic_image(
+            image_path = await upload_clinic_file(
                 patient_id=patient_id,
                 folder="notes",
-                file_bytes=file_bytes,
+                upload=image,
                 content_type=image.content_type,
                 name_hint=patient_name_hint,
             )
@@ -731,6 +731,7 @@ async def add_note(
         doctor_id=str(note_obj.doctor_id),
         note=note_obj.note,
         image_path=note_obj.image_path,
+        **variant_fields(note_obj),
         image_paths=note_obj.image_paths if note_obj.image_paths else None,
         created_at=note_obj.created_at.isoformat() if note_obj.created_at else datetime.now(timezone.utc).isoformat(),
     )
@@ -753,11 +754,10 @@ async def update_note(
                     status_code=400,
                     detail=f"Unsupported file type: {image.content_type}. Allowed types: {', '.join(IMAGE_TYPES)}",
                 )
-            file_bytes = await image.read()
-            image_path = await upload_clinic_image(
+            image_path = await upload_clinic_file(
                 patient_id=patient_id,
                 folder="notes",
-                file_bytes=file_bytes,
+                upload=image,
                 content_type=image.content_type,
                 name_hint=patient_name_hint,
             )
@@ -778,6 +778,7 @@ async def update_note(
         doctor_id=str(note_obj.doctor_id),
         note=note_obj.note,
         image_path=note_obj.image_path,
+        **variant_fields(note_obj),
         image_paths=note_obj.image_paths if note_obj.image_paths else None,
         created_at=note_obj.created_at.isoformat() if note_obj.created_at else datetime.now(timezone.utc).isoformat(),
     )
@@ -816,11 +817,10 @@ async def add_appointment(
                     status_code=400,
                     detail=f"Unsupported file type: {image.content_type}. Allowed types: {', '.join(IMAGE_TYPES)}",
                 )
-            file_bytes = await image.read()
-            image_path = await upload_clinic_image(
+            image_path = await upload_clinic_file(
                 patient_id=patient_id,
                 folder="appointments",
-                file_bytes=file_bytes,
+                upload=image,
                 content_type=image.content_type,
                 name_hint=patient_name_hint,
             )
@@ -885,6 +885,7 @@ async def add_gallery_image(
                 id=str(existing.id),
                 patient_id=str(existing.patient_id),
                 image_path=existing.image_path,
+                **variant_fields(existing),
                 note=existing.note,
                 created_at=existing.created_at.isoformat()
                 if existing.created_at
@@ -899,11 +900,10 @@ async def add_gallery_image(
             status_code=400,
             detail=f"Unsupported file type. Allowed types: {', '.join(IMAGE_TYPES)}",
         )
-    file_bytes = await image.read()
-    image_path = await upload_clinic_image(
+    image_path = await upload_clinic_file(
         patient_id=patient_id,
         folder="gallery",
-        file_bytes=file_bytes,
+        upload=image,
         content_type=image.content_type,
         name_hint=patient_name_hint,
     )
@@ -914,11 +914,13 @@ async def add_gallery_image(
         note=note,
         doctor_id=doctor_id,
         client_operation_id=x_idempotency_key,
+        uploaded_by_role=current.role,
     )
     return GalleryOut(
         id=str(gi.id),
         patient_id=str(gi.patient_id),
         image_path=gi.image_path,
+        **variant_fields(gi),
         note=gi.note,
         created_at=gi.created_at.isoformat() if gi.created_at else datetime.now(timezone.utc).isoformat(),
     )
@@ -1087,6 +1089,7 @@ async def list_notes(
                 doctor_id=str(n.doctor_id),
                 note=n.note,
                 image_path=n.image_path,
+                **variant_fields(n),
                 image_paths=n.image_paths if n.image_paths else None,
                 created_at=n.created_at.isoformat() if n.created_at else datetime.now(timezone.utc).isoformat(),
             )
@@ -1168,6 +1171,7 @@ async def list_gallery(
                     id=str(g.id),
                     patient_id=str(g.patient_id),
                     image_path=g.image_path,
+                    **variant_fields(g),
                     note=g.note,
                     created_at=g.created_at.isoformat() if g.created_at else datetime.now(timezone.utc).isoformat(),
                 )
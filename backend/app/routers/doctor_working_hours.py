@@ -3,9 +3,10 @@ from typing import List
 from datetime import datetime, timezone
 
 from app.routers.doctor import get_current_user
+from app.security import get_current_doctor_id
 from app.services.doctor_working_hours_service import DoctorWorkingHoursService
 from app.schemas import WorkingHoursIn, WorkingHoursOut
-from app.models import User, Doctor
+from app.models import User
 
 router = APIRouter(prefix="/doctor", tags=["Doctor Working Hours"])
 working_hours_service = DoctorWorkingHoursService()
@@ -13,10 +14,10 @@ working_hours_service = DoctorWorkingHoursService()
 
 async def _get_current_doctor_id(current_user: User) -> str:
     """Get doctor ID from current user."""
-    doctor = await Doctor.find_one(Doctor.user_id == current_user.id)
-    if not doctor:
+    doctor_id = await get_current_doctor_id(current_user)
+    if not doctor_id:
         raise HTTPException(status_code=404, detail="Doctor profile not found")
-    return str(doctor.id)
+    return doctor_id
 
 
 @router.post("/working-hours", response_model=List[WorkingHoursOut])
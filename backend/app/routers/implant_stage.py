@@ -7,10 +7,10 @@ from app.schemas import (
     ImplantStageDateUpdate,
     ImplantStagesResponse,
 )
-from app.security import require_roles, get_current_user
+from app.security import require_roles, get_current_user, get_current_doctor_id
 from app.constants import Role
 from app.services import implant_stage_service
-from app.models import User, Doctor, Patient
+from app.models import User, Patient
 from beanie import PydanticObjectId as OID
 
 router = APIRouter(
@@ -19,6 +19,20 @@ router = APIRouter(
 )
 
 
+def _stage_out(stage) -> ImplantStageOut:
+    now = datetime.now(timezone.utc).isoformat()
+    return ImplantStageOut(
+        id=str(stage.id),
+        patient_id=str(stage.patient_id),
+        stage_name=stage.stage_name,
+        scheduled_at=stage.scheduled_at.isoformat() if stage.scheduled_at else now,
+        is_completed=stage.is_completed,
+        appointment_id=str(stage.appointment_id) if stage.appointment_id else None,
+        created_at=stage.created_at.isoformat() if stage.created_at else now,
+        updated_at=stage.updated_at.isoformat() if stage.updated_at else now,
+    )
+
+
 @router.get("", response_model=ImplantStagesResponse)
 async def get_implant_stages(
     patient_id: str,
@@ -40,10 +54,10 @@ async def get_implant_stages(
     user_type = current.role
     if user_type == Role.DOCTOR:
         # الطبيب: يجب أن يكون المريض في قائمة أطبائه
-        doctor = await Doctor.find_one(Doctor.user_id == current.id)
-        if not doctor or OID(doctor.id) not in patient.doctor_ids:
+        doctor_id = await get_current_doctor_id(current)
+        if not doctor_id or OID(doctor_id) not in patient.doctor_ids:
             raise HTTPException(status_code=403, detail="Not your patient")
-        doctor_id_for_query = str(doctor.id)
+        doctor_id_for_query = doctor_id
     elif user_type == Role.PATIENT:
         # المريض: يجب أن يكون المريض نفسه
         if str(patient.user_id) != str(current.id):
@@ -58,27 +72,7 @@ async def get_implant_stages(
     )
 
     # تحويل إلى ImplantStageOut
-    stage_outs = [
-        ImplantStageOut(
-            id=str(stage.id),
-            patient_id=str(stage.patient_id),
-            stage_name=stage.stage_name,
-            scheduled_at=stage.scheduled_at.isoformat()
-            if stage.scheduled_at
-            else datetime.now(timezone.utc).isoformat(),
-            is_completed=stage.is_completed,
-            appointment_id=str(stage.appointment_id)
-            if stage.appointment_id
-            else None,
-            created_at=stage.created_at.isoformat()
-            if stage.created_at
-            else datetime.now(timezone.utc).isoformat(),
-            updated_at=stage.updated_at.isoformat()
-            if stage.updated_at
-            else datetime.now(timezone.utc).isoformat(),
-        )
-        for stage in stages
-    ]
+    stage_outs = [_stage_out(stage) for stage in stages]
 
     return ImplantStagesResponse(stages=stage_outs)
 
@@ -94,8 +88,8 @@ async def initialize_implant_stages(
         raise HTTPException(status_code=404, detail="Patient not found")
     
     # التحقق من أن الطبيب هو طبيب المريض
-    doctor = await Doctor.find_one(Doctor.user_id == current.id)
-    if not doctor or OID(doctor.id) not in patient.doctor_ids:
+    doctor_id = await get_current_doctor_id(current)
+    if not doctor_id or OID(doctor_id) not in patient.doctor_ids:
         raise HTTPException(status_code=403, detail="Not your patient")
     
     # الحصول على تاريخ تسجيل المريض
@@ -109,23 +103,11 @@ async def initialize_implant_stages(
     stages = await implant_stage_service.initialize_implant_stages(
         patient_id, 
         registration_date, 
-        str(doctor.id)
+        doctor_id
     )
     
     # تحويل إلى ImplantStageOut
-    stage_outs = [
-        ImplantStageOut(
-            id=str(stage.id),
-            patient_id=str(stage.patient_id),
-            stage_name=stage.stage_name,
-            scheduled_at=stage.scheduled_at.isoformat() if stage.scheduled_at else datetime.now(timezone.utc).isoformat(),
-            is_completed=stage.is_completed,
-            appointment_id=str(stage.appointment_id) if stage.appointment_id else None,
-            created_at=stage.created_at.isoformat() if stage.created_at else datetime.now(timezone.utc).isoformat(),
-            updated_at=stage.updated_at.isoformat() if stage.updated_at else datetime.now(timezone.utc).isoformat(),
-        )
-        for stage in stages
-    ]
+    stage_outs = [_stage_out(stage) for stage in stages]
     
     return ImplantStagesResponse(stages=stage_outs)
 
@@ -143,8 +125,8 @@ async def update_stage_date(
         raise HTTPException(status_code=404, detail="Patient not found")
     
     # التحقق من أن الطبيب هو طبيب المريض
-    doctor = await Doctor.find_one(Doctor.user_id == current.id)
-    if not doctor or OID(doctor.id) not in patient.doctor_ids:
+    doctor_id = await get_current_doctor_id(current)
+    if not doctor_id or OID(doctor_id) not in patient.doctor_ids:
         raise HTTPException(status_code=403, detail="Not your patient")
     
     # تحويل التاريخ من ISO string إلى datetime
@@ -159,19 +141,10 @@ async def update_stage_date(
         patient_id,
         stage_name,
         new_date,
-        str(doctor.id)
+        doctor_id
     )
     
-    return ImplantStageOut(
-        id=str(stage.id),
-        patient_id=str(stage.patient_id),
-        stage_name=stage.stage_name,
-        scheduled_at=stage.scheduled_at.isoformat() if stage.scheduled_at else datetime.now(timezone.utc).isoformat(),
-        is_completed=stage.is_completed,
-        appointment_id=str(stage.appointment_id) if stage.appointment_id else None,
-        created_at=stage.created_at.isoformat() if stage.created_at else datetime.now(timezone.utc).isoformat(),
-        updated_at=stage.updated_at.isoformat() if stage.updated_at else datetime.now(timezone.utc).isoformat(),
-    )
+    return _stage_out(stage)
 
 
 @router.post("/{stage_name}/complete", response_model=ImplantStageOut)
@@ -186,26 +159,17 @@ async def complete_stage(
         raise HTTPException(status_code=404, detail="Patient not found")
     
     # التحقق من أن الطبيب هو طبيب المريض
-    doctor = await Doctor.find_one(Doctor.user_id == current.id)
-    if not doctor or OID(doctor.id) not in patient.doctor_ids:
+    doctor_id = await get_current_doctor_id(current)
+    if not doctor_id or OID(doctor_id) not in patient.doctor_ids:
         raise HTTPException(status_code=403, detail="Not your patient")
     
     stage = await implant_stage_service.complete_stage(
         patient_id,
         stage_name,
-        str(doctor.id)
+        doctor_id
     )
     
-    return ImplantStageOut(
-        id=str(stage.id),
-        patient_id=str(stage.patient_id),
-        stage_name=stage.stage_name,
-        scheduled_at=stage.scheduled_at.isoformat() if stage.scheduled_at else datetime.now(timezone.utc).isoformat(),
-        is_completed=stage.is_completed,
-        appointment_id=str(stage.appointment_id) if stage.appointment_id else None,
-        created_at=stage.created_at.isoformat() if stage.created_at else datetime.now(timezone.utc).isoformat(),
-        updated_at=stage.updated_at.isoformat() if stage.updated_at else datetime.now(timezone.utc).isoformat(),
-    )
+    return _stage_out(stage)
 
 
 @router.post("/{stage_name}/uncomplete", response_model=ImplantStageOut)
@@ -220,24 +184,15 @@ async def uncomplete_stage(
         raise HTTPException(status_code=404, detail="Patient not found")
     
     # التحقق من أن الطبيب هو طبيب المريض
-    doctor = await Doctor.find_one(Doctor.user_id == current.id)
-    if not doctor or OID(doctor.id) not in patient.doctor_ids:
+    doctor_id = await get_current_doctor_id(current)
+    if not doctor_id or OID(doctor_id) not in patient.doctor_ids:
         raise HTTPException(status_code=403, detail="Not your patient")
     
     stage = await implant_stage_service.uncomplete_stage(
         patient_id,
         stage_name,
-        str(doctor.id)
+        doctor_id
     )
     
-    return ImplantStageOut(
-        id=str(stage.id),
-        patient_id=str(stage.patient_id),
-        stage_name=stage.stage_name,
-        scheduled_at=stage.scheduled_at.isoformat() if stage.scheduled_at else datetime.now(timezone.utc).isoformat(),
-        is_completed=stage.is_completed,
-        appointment_id=str(stage.appointment_id) if stage.appointment_id else None,
-        created_at=stage.created_at.isoformat() if stage.created_at else datetime.now(timezone.utc).isoformat(),
-        updated_at=stage.updated_at.isoformat() if stage.updated_at else datetime.now(timezone.utc).isoformat(),
-    )
+    return _stage_out(stage)
 
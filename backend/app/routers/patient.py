@@ -9,10 +9,11 @@ from app.schemas import PatientOut, PatientAppointmentsOut, AppointmentOut, Note
 from app.security import require_roles, get_current_user
 from app.constants import Role
 from app.services import patient_service
+from app.services.image_variants import variant_fields
 from app.models import Patient, Doctor, User
 from app.utils.qrcode_gen import ensure_patient_qr
 from app.utils.patient_out import build_patient_out, resolve_patient_name
-from app.utils.r2_clinic import upload_clinic_image
+from app.utils.r2_clinic import upload_clinic_file
 
 router = APIRouter(prefix="/patient", tags=["patient"], dependencies=[Depends(require_roles([Role.PATIENT]))])
 
@@ -144,11 +145,10 @@ async def upload_my_profile_image(
         )
 
     patient, family_count = await _resolve_active_patient(current, patient_id)
-    file_bytes = await image.read()
-    image_path = await upload_clinic_image(
+    image_path = await upload_clinic_file(
         patient_id=str(patient.id),
         folder="profile",
-        file_bytes=file_bytes,
+        upload=image,
         content_type=image.content_type,
         name_hint=patient.name or current.name,
     )
@@ -272,6 +272,7 @@ async def my_appointments(
             scheduled_at=sa.isoformat(),
             note=a.note,
             image_path=a.image_path,
+            **variant_fields(a),
             image_paths=a.image_paths or [],
             status=normalized_status,
             is_late=is_late,
@@ -303,13 +304,15 @@ async def my_notes(
 async def my_gallery(
     current=Depends(get_current_user),
     patient_id: Optional[str] = Query(None),
+    skip: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=100),
 ):
-    """معرض صور الملف الطبي النشط."""
+    """معرض صور الملف الطبي النشط (بدون limit: كل الصور كما سابقاً)."""
     patient, _ = await _resolve_active_patient(current, patient_id)
     gallery = await patient_service.list_gallery_for_patient_public(
         patient_id=str(patient.id),
-        skip=0,
-        limit=None,
+        skip=skip,
+        limit=limit,
     )
     result = []
     for g in gallery:
@@ -319,6 +322,7 @@ async def my_gallery(
                     id=str(g.id),
                     patient_id=str(g.patient_id),
                     image_path=g.image_path,
+                    **variant_fields(g),
                     note=g.note,
                     created_at=g.created_at.isoformat() if g.created_at else datetime.now(timezone.utc).isoformat(),
                 )
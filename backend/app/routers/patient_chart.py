@@ -0,0 +1,199 @@
+"""Patient chart bundle for the doctor app: one request when a patient is opened.
+
+Opening a patient used to take seven requests (patient, notes, appointments,
+gallery, dental chart, implant stages, chat), each resolving the doctor and
+re-checking that the patient is theirs. GET /doctor/patients/{id}/chart does
+the authentication, doctor lookup and ownership check once, then fetches the
+requested sections concurrently with asyncio.gather.
+
+- sections: comma-separated subset of SECTIONS (default PATIENT_CHART_SECTIONS)
+- *_limit: page size per list section; the client pages further with the
+  per-section endpoints (e.g. chat history uses next_cursor)
+- a section that fails is reported in `errors` instead of failing the bundle
+- the response carries an ETag over the whole body; If-None-Match -> 304
+"""
+
+import asyncio
+import hashlib
+from datetime import datetime, timezone
+from typing import Optional
+
+from beanie import PydanticObjectId as OID
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+
+from app.config import get_settings
+from app.constants import Role
+from app.models import Appointment, ChatRoom, DentalChart, Patient, User
+from app.routers.chat import _message_out_from_doc
+from app.routers.dental_chart import _chart_to_out, _empty_out
+from app.routers.doctor import _build_appointment_out
+from app.routers.implant_stage import _stage_out
+from app.schemas import ChatHistoryOut, NoteOut, PatientChartOut
+from app.security import get_current_doctor_id, get_current_user, require_roles
+from app.services import implant_stage_service, patient_service
+from app.services.gallery_uploads import gallery_out
+from app.services.image_variants import variant_fields
+from app.utils.chat_helpers import encode_message_cursor, fetch_room_messages
+from app.utils.logger import get_logger
+from app.utils.media_serving import etag_matches
+from app.utils.patient_out import build_patient_out, resolve_patient_name
+
+settings = get_settings()
+logger = get_logger("patient_chart")
+
+SECTIONS = ("patient", "notes", "appointments", "gallery", "dental_chart", "implant_stages", "chat")
+
+router = APIRouter(prefix="/doctor", tags=["doctor"], dependencies=[Depends(require_roles([Role.DOCTOR]))])
+
+
+def _parse_sections(raw: Optional[str]) -> list[str]:
+    requested = [s.strip() for s in (raw or settings.PATIENT_CHART_SECTIONS).split(",") if s.strip()]
+    unknown = [s for s in requested if s not in SECTIONS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown sections: {', '.join(unknown)}. Allowed: {', '.join(SECTIONS)}",
+        )
+    # نفس الترتيب دائماً حتى يبقى الـ ETag ثابتاً لنفس الطلب
+    return [s for s in SECTIONS if s in requested]
+
+
+async def _notes(patient: Patient, doctor_id: str, limit: int) -> list[NoteOut]:
+    notes = await patient_service.list_notes_for_patient(
+        patient_id=str(patient.id), limit=limit, doctor_id=doctor_id
+    )
+    return [
+        NoteOut(
+            id=str(n.id),
+            patient_id=str(n.patient_id),
+            doctor_id=str(n.doctor_id),
+            note=n.note,
+            image_path=n.image_path,
+            **variant_fields(n),
+            image_paths=n.image_paths if n.image_paths else None,
+            created_at=n.created_at.isoformat() if n.created_at else datetime.now(timezone.utc).isoformat(),
+        )
+        for n in notes
+    ]
+
+
+async def _appointments(patient: Patient, user: Optional[User], doctor_id: str, doctor_name: Optional[str], limit: int):
+    # نفس ترتيب /doctor/patients/{id}/appointments (الأقدم أولاً)؛ المريض والطبيب معروفان مسبقاً
+    appointments = (
+        await Appointment.find(
+            Appointment.patient_id == patient.id,
+            Appointment.doctor_id == OID(doctor_id),
+        )
+        .sort(+Appointment.scheduled_at)
+        .limit(limit)
+        .to_list()
+    )
+    patient_name = resolve_patient_name(patient, user)
+    patient_phone = user.phone if user else None
+    return [
+        _build_appointment_out(
+            appointment=ap,
+            patient_name=patient_name,
+            patient_phone=patient_phone,
+            doctor_name=doctor_name,
+        )
+        for ap in appointments
+    ]
+
+
+async def _gallery(patient: Patient, doctor_id: str, limit: int):
+    gallery = await patient_service.list_gallery_for_doctor_view(
+        patient_id=str(patient.id), doctor_id=doctor_id, limit=limit
+    )
+    return [gallery_out(g) for g in gallery]
+
+
+async def _dental_chart(patient: Patient, doctor_id: str):
+    doc = await DentalChart.find_one(
+        DentalChart.patient_id == patient.id,
+        DentalChart.doctor_id == OID(doctor_id),
+    )
+    if not doc:
+        return _empty_out(patient_id=str(patient.id), doctor_id=doctor_id)
+    return _chart_to_out(doc)
+
+
+async def _implant_stages(patient: Patient, doctor_id: str):
+    stages = await implant_stage_service.get_implant_stages(str(patient.id), doctor_id, patient=patient)
+    return [_stage_out(stage) for stage in stages]
+
+
+async def _chat(patient: Patient, doctor_id: str, limit: int) -> ChatHistoryOut:
+    room = await ChatRoom.find_one(
+        ChatRoom.patient_id == patient.id,
+        ChatRoom.doctor_id == OID(doctor_id),
+    )
+    if not room:
+        return ChatHistoryOut(messages=[], next_cursor=None, has_more=False)
+    docs, has_more = await fetch_room_messages(room.id, limit=limit)
+    return ChatHistoryOut(
+        messages=[_message_out_from_doc(doc) for doc in docs],
+        next_cursor=encode_message_cursor(docs[-1]["created_at"], docs[-1]["_id"]) if docs else None,
+        has_more=has_more,
+    )
+
+
+@router.get("/patients/{patient_id}/chart", response_model=PatientChartOut)
+async def get_patient_chart(
+    patient_id: str,
+    request: Request,
+    sections: Optional[str] = Query(None, description=f"Comma-separated: {','.join(SECTIONS)}"),
+    notes_limit: int = Query(settings.PATIENT_CHART_SECTION_LIMIT, ge=1, le=100),
+    appointments_limit: int = Query(settings.PATIENT_CHART_SECTION_LIMIT, ge=1, le=100),
+    gallery_limit: int = Query(settings.PATIENT_CHART_SECTION_LIMIT, ge=1, le=100),
+    chat_limit: int = Query(settings.PATIENT_CHART_SECTION_LIMIT, ge=1, le=200),
+    current=Depends(get_current_user),
+):
+    """ملف المريض كاملاً للطبيب (بيانات، سجلات، مواعيد، معرض، مخطط أسنان، زراعة، محادثة) في طلب واحد."""
+    wanted = _parse_sections(sections)
+
+    doctor_id = await get_current_doctor_id(current)
+    if not doctor_id:
+        raise HTTPException(status_code=404, detail="Doctor profile not found")
+    try:
+        patient = await Patient.get(OID(patient_id))
+    except Exception:
+        patient = None
+    if not patient:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    if OID(doctor_id) not in patient.doctor_ids:
+        raise HTTPException(status_code=403, detail="Patient not assigned to this doctor")
+
+    user: Optional[User] = None
+    if "patient" in wanted or "appointments" in wanted:
+        user = await User.get(patient.user_id) if patient.user_id else None
+
+    async def _patient():
+        return build_patient_out(patient, user, doctor_id=doctor_id)
+
+    fetchers = {
+        "patient": _patient,
+        "notes": lambda: _notes(patient, doctor_id, notes_limit),
+        "appointments": lambda: _appointments(patient, user, doctor_id, current.name, appointments_limit),
+        "gallery": lambda: _gallery(patient, doctor_id, gallery_limit),
+        "dental_chart": lambda: _dental_chart(patient, doctor_id),
+        "implant_stages": lambda: _implant_stages(patient, doctor_id),
+        "chat": lambda: _chat(patient, doctor_id, chat_limit),
+    }
+    results = await asyncio.gather(*(fetchers[name]() for name in wanted), return_exceptions=True)
+
+    bundle = PatientChartOut(patient_id=str(patient.id), sections=wanted)
+    for name, result in zip(wanted, results):
+        if isinstance(result, BaseException):
+            if not isinstance(result, HTTPException):
+                logger.error("Patient chart section %s failed for patient %s: %s", name, patient_id, result)
+            bundle.errors[name] = result.detail if isinstance(result, HTTPException) else "Failed to load section"
+            continue
+        setattr(bundle, name, result)
+
+    body = bundle.model_dump_json().encode()
+    etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -2,16 +2,17 @@ from fastapi import APIRouter, Depends, UploadFile, File, Query, HTTPException,
 from beanie.operators import In
 from datetime import datetime, timezone
 
-from app.schemas import GalleryOut, GalleryCreate, PatientOut
+from app.schemas import GalleryBatchOut, GalleryOut, GalleryCreate, PatientOut
 from app.security import require_roles, get_current_user
 from app.constants import Role
 from app.services.patient_service import create_gallery_image
-from app.utils.r2_clinic import upload_clinic_image
+from app.services.gallery_uploads import upload_gallery_batch
+from app.services.image_variants import variant_fields
+from app.utils.r2_clinic import upload_clinic_file
 from app.models import Patient, User
 from app.utils.patient_out import build_patient_out, patient_name_hint_for_id
 
 IMAGE_TYPES = ("image/jpeg", "image/png", "image/webp")
-MAX_IMAGE_MB = 10
 
 router = APIRouter(prefix="/photographer", tags=["photographer"], dependencies=[Depends(require_roles([Role.PHOTOGRAPHER]))])
 
@@ -45,12 +46,11 @@ async def upload_patient_image(
             status_code=400,
             detail=f"Unsupported file type. Allowed types: {', '.join(IMAGE_TYPES)}",
         )
-    file_bytes = await image.read()
     patient_name_hint = await patient_name_hint_for_id(patient_id)
-    image_path = await upload_clinic_image(
+    image_path = await upload_clinic_file(
         patient_id=patient_id,
         folder="gallery",
-        file_bytes=file_bytes,
+        upload=image,
         content_type=image.content_type,
         name_hint=patient_name_hint,
     )
@@ -59,11 +59,33 @@ async def upload_patient_image(
         uploaded_by_user_id=str(current.id),
         image_path=image_path,
         note=note,
+        uploaded_by_role=current.role,
     )
     return GalleryOut(
         id=str(gi.id),
         patient_id=str(gi.patient_id),
         image_path=gi.image_path,
+        **variant_fields(gi),
         note=gi.note,
         created_at=gi.created_at.isoformat() if gi.created_at else datetime.now(timezone.utc).isoformat(),
     )
+
+
+@router.post("/patients/{patient_id}/gallery/batch", response_model=GalleryBatchOut)
+async def upload_patient_images_batch(
+    patient_id: str,
+    images: list[UploadFile] = File(...),
+    idempotency_keys: list[str] | None = Form(None),
+    note: str | None = Form(None),
+    current=Depends(get_current_user),
+):
+    """رفع جلسة تصوير كاملة في طلب واحد (مفتاح idempotency لكل صورة، نتيجة لكل صورة)."""
+    return await upload_gallery_batch(
+        patient_id=patient_id,
+        images=images,
+        uploaded_by_user_id=str(current.id),
+        uploaded_by_role=current.role,
+        allowed_types=IMAGE_TYPES,
+        idempotency_keys=idempotency_keys,
+        note=note,
+    )
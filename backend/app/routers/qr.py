@@ -1,13 +1,21 @@
-from fastapi import APIRouter, Depends
+import hashlib
+import re
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from beanie.operators import In
 
 from app.schemas import QRScanOut, DoctorOut
 from app.security import require_roles
 from app.constants import Role
+from app.rate_limit import limiter
+from app.utils.media_serving import IMMUTABLE_CACHE, etag_matches
 from app.utils.patient_out import build_patient_out
+from app.utils.qrcode_gen import QR_FORMATS, get_patient_by_qr, qr_image_bytes
 
 router = APIRouter(prefix="/qr", tags=["qr"])
 
+_QR_CODE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
 
 @router.get("/scan", response_model=QRScanOut)
 async def scan(code: str, current=Depends(require_roles([Role.ADMIN, Role.DOCTOR, Role.RECEPTIONIST]))):
@@ -57,3 +65,28 @@ async def scan(code: str, current=Depends(require_roles([Role.ADMIN, Role.DOCTOR
         "patient": build_patient_out(patient, u),
         "doctors": doctors_list,
     }
+
+
+@router.get("/{code}.{fmt}")
+@limiter.limit("60/minute")
+async def qr_image(code: str, fmt: str, request: Request):
+    """صورة QR (png أو svg) تُولَّد عند أول طلب ثم تُقدَّم من الكاش.
+
+    الصورة تعتمد على الكود فقط فتُرسل مع `immutable` و ETag. لا تكشف أي بيانات
+    عن المريض (نفس القيمة المطبوعة داخل الرمز).
+
+    لا يُولَّد إلا رمز مريض موجود (404 لغيره) حتى لا يملأ أي زائر كاش الصور
+    بأكواد عشوائية.
+    """
+    media_type = QR_FORMATS.get(fmt)
+    if media_type is None or not _QR_CODE.match(code) or code.startswith("tmp-"):
+        raise HTTPException(status_code=404, detail="QR image not found")
+    if not await get_patient_by_qr(code):
+        raise HTTPException(status_code=404, detail="QR image not found")
+
+    body = await qr_image_bytes(code, fmt)
+    etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE_CACHE}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
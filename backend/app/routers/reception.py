@@ -15,6 +15,7 @@ from app.schemas import (
     ReceptionAppointmentOut,
     WorkingHoursOut,
     GalleryOut,
+    GalleryBatchOut,
     CallCenterAppointmentOut,
     ReceptionQueueSyncIn,
     ReceptionQueueDayOut,
@@ -27,9 +28,11 @@ from app.models.reception_queue import ReceptionQueueDay, ReceptionQueueEntry
 from app.services.staff_appointment_service import list_staff_appointments
 from app.services.stats_service import parse_dates
 from app.services import patient_service
+from app.services.image_variants import variant_fields
+from app.services.gallery_uploads import upload_gallery_batch
 from app.services.admin_service import create_patient
 from app.services.doctor_working_hours_service import DoctorWorkingHoursService
-from app.utils.r2_clinic import upload_clinic_image
+from app.utils.r2_clinic import upload_clinic_file
 from app.utils.patient_profile import build_doctor_profile_map
 from app.utils.patient_out import build_patient_out, patient_name_hint_for_id, build_patient_out_from_agg
 from app.utils.logger import get_logger
@@ -296,11 +299,10 @@ async def upload_patient_profile_image(
     if not u:
         raise HTTPException(status_code=404, detail="User not found")
 
-    file_bytes = await image.read()
-    image_path = await upload_clinic_image(
+    image_path = await upload_clinic_file(
         patient_id=str(p.id),
         folder="profile",
-        file_bytes=file_bytes,
+        upload=image,
         content_type=image.content_type,
         name_hint=p.name or u.name,
     )
@@ -382,6 +384,7 @@ async def upload_patient_gallery_image(
                     id=str(existing.id),
                     patient_id=str(existing.patient_id),
                     image_path=existing.image_path,
+                    **variant_fields(existing),
                     note=existing.note,
                     created_at=existing.created_at.isoformat()
                     if existing.created_at
@@ -395,15 +398,11 @@ async def upload_patient_gallery_image(
                 detail=f"Unsupported file type. Allowed types: {', '.join(IMAGE_TYPES)}",
             )
 
-        file_bytes = await image.read()
-        if not file_bytes:
-            raise HTTPException(status_code=400, detail="Empty image file")
-
         patient_name_hint = await patient_name_hint_for_id(patient_id)
-        image_path = await upload_clinic_image(
+        image_path = await upload_clinic_file(
             patient_id=patient_id,
             folder="gallery",
-            file_bytes=file_bytes,
+            upload=image,
             content_type=content_type,
             name_hint=patient_name_hint,
         )
@@ -414,11 +413,13 @@ async def upload_patient_gallery_image(
             note=note,
             doctor_id=None,
             client_operation_id=x_idempotency_key,
+            uploaded_by_role=current.role,
         )
         return GalleryOut(
             id=str(gi.id),
             patient_id=str(gi.patient_id),
             image_path=gi.image_path,
+            **variant_fields(gi),
             note=gi.note,
             created_at=gi.created_at.isoformat()
             if gi.created_at
@@ -439,6 +440,32 @@ async def upload_patient_gallery_image(
         )
 
 
+@router.post("/patients/{patient_id}/gallery/batch", response_model=GalleryBatchOut)
+async def upload_patient_gallery_batch(
+    patient_id: str,
+    images: List[UploadFile] = File(...),
+    idempotency_keys: Optional[List[str]] = Form(None),
+    note: str | None = Form(None),
+    current=Depends(get_current_user),
+):
+    """
+    رفع عدة صور إلى معرض المريض في طلب واحد (جلسة تصوير كاملة).
+
+    - idempotency_keys: مفتاح لكل صورة بنفس الترتيب (اختياري)؛ إعادة إرسال الدفعة
+      ترجع السجلات الموجودة بدون إعادة الرفع.
+    - النتيجة لكل صورة: created / existing / failed.
+    """
+    return await upload_gallery_batch(
+        patient_id=patient_id,
+        images=images,
+        uploaded_by_user_id=str(current.id),
+        uploaded_by_role=current.role,
+        allowed_types=IMAGE_TYPES,
+        idempotency_keys=idempotency_keys,
+        note=note,
+    )
+
+
 @router.get("/patients/{patient_id}/gallery", response_model=List[GalleryOut])
 async def list_my_uploaded_gallery_images(
     patient_id: str,
@@ -465,6 +492,7 @@ async def list_my_uploaded_gallery_images(
                     id=str(g.id),
                     patient_id=str(g.patient_id),
                     image_path=g.image_path,
+                    **variant_fields(g),
                     note=g.note,
                     created_at=g.created_at.isoformat()
                     if g.created_at
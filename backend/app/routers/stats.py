@@ -1,9 +1,8 @@
 from fastapi import APIRouter, Depends, Query, HTTPException
 from typing import Optional
 
-from app.security import require_roles, get_current_user
+from app.security import require_roles, get_current_user, get_current_doctor_id
 from app.constants import Role
-from app.models import Doctor
 from app.services.stats_service import (
     get_overview_stats,
     get_users_stats,
@@ -28,8 +27,7 @@ router = APIRouter(prefix="/stats", tags=["statistics"])
 async def _ensure_doctor_stats_access(doctor_id: str, current) -> None:
     if current.role == Role.ADMIN:
         return
-    doctor = await Doctor.find_one(Doctor.user_id == current.id)
-    if not doctor or str(doctor.id) != doctor_id:
+    if await get_current_doctor_id(current) != doctor_id:
         raise HTTPException(status_code=403, detail="Forbidden")
 
 
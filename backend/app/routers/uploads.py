@@ -0,0 +1,195 @@
+"""Two-phase direct uploads: the client PUTs the image straight to R2.
+
+1) POST /uploads/presign  -> object key (same layout as upload_clinic_file:
+   patients/{patient_dir}/{media_folder}/{timestamp}{ext}) + presigned PUT URL
+2) client PUTs the bytes to upload_url with the returned headers
+3) POST /uploads/gallery/confirm or /uploads/notes/confirm with the key(s) and
+   an idempotency key -> the object is checked (exists, size) and the
+   GalleryImage / TreatmentNote is created; retries return the same record.
+
+A presigned PUT cannot carry a size limit on R2, so the size is only checked
+at confirm. Every presigned key is recorded in `pending_uploads`; keys that are
+never confirmed are deleted by the `abandoned_upload_gc` job once the URL has
+expired plus PRESIGNED_UPLOAD_GRACE_SECONDS.
+
+The image bytes never pass through the API workers. Needs R2 (or an
+S3-compatible R2_ENDPOINT_URL); without it clients keep using the multipart
+endpoints.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from beanie import PydanticObjectId as OID
+from fastapi import APIRouter, Depends, HTTPException
+
+from app.config import get_settings
+from app.constants import Role
+from app.models import Patient, PendingUpload, User
+from app.schemas import ConfirmUploadIn, GalleryOut, NoteOut, PresignUploadIn, PresignUploadOut
+from app.security import get_current_doctor_id, require_roles
+from app.services import patient_service
+from app.services.image_variants import variant_fields
+from app.services.media_storage import (
+    delete_object,
+    head_object,
+    is_remote_enabled,
+    presign_put,
+    public_url,
+)
+from app.utils.patient_out import patient_name_hint_for_id
+from app.utils.r2_clinic import build_media_key, build_patient_dir_label, resolve_media_folder
+from app.utils.uploads import MAX_IMAGE_MB, normalize_content_type
+
+settings = get_settings()
+
+IMAGE_TYPES = ("image/jpeg", "image/png", "image/webp", "image/heic", "image/heif")
+UPLOAD_ROLES = [Role.DOCTOR, Role.RECEPTIONIST, Role.PHOTOGRAPHER, Role.ADMIN]
+
+router = APIRouter(prefix="/uploads", tags=["uploads"])
+
+
+async def _patient_access(current: User, patient_id: str, folder: str) -> tuple[Patient, str | None]:
+    """المريض + doctor_id (للطبيب). الطبيب لمرضاه فقط، والسجلات (notes) للطبيب فقط."""
+    try:
+        patient = await Patient.get(OID(patient_id))
+    except Exception:
+        patient = None
+    if not patient:
+        raise HTTPException(status_code=404, detail="Patient not found")
+
+    if current.role == Role.DOCTOR:
+        doctor_id = await get_current_doctor_id(current)
+        if not doctor_id:
+            raise HTTPException(status_code=404, detail="Doctor profile not found")
+        if OID(doctor_id) not in (patient.doctor_ids or []):
+            raise HTTPException(status_code=403, detail="Not your patient")
+        return patient, doctor_id
+    if folder == "notes":
+        raise HTTPException(status_code=403, detail="Only doctors can add notes")
+    return patient, None
+
+
+async def _key_prefix(patient_id: str, folder: str) -> str:
+    name_hint = await patient_name_hint_for_id(patient_id)
+    return f"patients/{build_patient_dir_label(name_hint, patient_id)}/{resolve_media_folder(folder)}/"
+
+
+async def _clear_pending(keys: list[str]) -> None:
+    await PendingUpload.get_motor_collection().delete_many({"key": {"$in": keys}})
+
+
+async def _verify_uploaded(patient_id: str, folder: str, keys: list[str]) -> list[str]:
+    """Check each key is in the patient's folder and was uploaded; returns public URLs."""
+    if not keys:
+        raise HTTPException(status_code=400, detail="No uploaded keys")
+    prefix = await _key_prefix(patient_id, folder)
+    limit = MAX_IMAGE_MB * 1024 * 1024
+    urls = []
+    for key in keys:
+        file_name = key[len(prefix):] if key.startswith(prefix) else ""
+        if not file_name or "/" in file_name or ".." in key:
+            raise HTTPException(status_code=400, detail=f"Key does not belong to this patient: {key}")
+        info = await head_object(key)
+        if info is None:
+            raise HTTPException(status_code=400, detail=f"Upload not found: {key}")
+        if info["size"] > limit:
+            await delete_object(key)
+            raise HTTPException(status_code=413, detail=f"Image is larger than {MAX_IMAGE_MB} MB")
+        urls.append(public_url(key))
+    return urls
+
+
+@router.post("/presign", response_model=PresignUploadOut)
+async def presign_upload(
+    payload: PresignUploadIn,
+    current: User = Depends(require_roles(UPLOAD_ROLES)),
+):
+    """رابط PUT موقّع لرفع صورة مباشرة إلى التخزين (بدون المرور بالـ API)."""
+    if not is_remote_enabled():
+        raise HTTPException(status_code=503, detail="Direct uploads need R2 storage; use the multipart endpoint")
+    content_type = normalize_content_type(payload.content_type)
+    if content_type not in IMAGE_TYPES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported file type. Allowed types: {', '.join(IMAGE_TYPES)}",
+        )
+    await _patient_access(current, payload.patient_id, payload.folder)
+
+    name_hint = await patient_name_hint_for_id(payload.patient_id)
+    key = build_media_key(payload.patient_id, payload.folder, content_type, name_hint)
+    expires_in = settings.PRESIGNED_UPLOAD_EXPIRE_SECONDS
+    # يُحذف عند التأكيد؛ وإلا تحذف مهمة abandoned_upload_gc الملف لاحقاً
+    await PendingUpload(
+        key=key,
+        patient_id=OID(payload.patient_id),
+        folder=payload.folder,
+        uploaded_by_user_id=current.id,
+        expires_at=datetime.now(timezone.utc) + timedelta(seconds=expires_in),
+    ).insert()
+    return PresignUploadOut(
+        key=key,
+        upload_url=presign_put(key, content_type, expires_in),
+        headers={"Content-Type": content_type},
+        expires_in=expires_in,
+    )
+
+
+@router.post("/gallery/confirm", response_model=GalleryOut)
+async def confirm_gallery_upload(
+    payload: ConfirmUploadIn,
+    current: User = Depends(require_roles(UPLOAD_ROLES)),
+):
+    """تأكيد رفع صورة المعرض وإنشاء السجل (نفس idempotency_key يرجع نفس السجل)."""
+    _, doctor_id = await _patient_access(current, payload.patient_id, "gallery")
+    if len(payload.keys) != 1:
+        raise HTTPException(status_code=400, detail="Gallery upload takes exactly one key")
+    (image_path,) = await _verify_uploaded(payload.patient_id, "gallery", payload.keys)
+
+    gi = await patient_service.create_gallery_image(
+        patient_id=payload.patient_id,
+        uploaded_by_user_id=str(current.id),
+        image_path=image_path,
+        note=payload.note,
+        doctor_id=doctor_id,
+        client_operation_id=payload.idempotency_key,
+        uploaded_by_role=current.role,
+    )
+    await _clear_pending(payload.keys)
+    return GalleryOut(
+        id=str(gi.id),
+        patient_id=str(gi.patient_id),
+        image_path=gi.image_path,
+        **variant_fields(gi),
+        note=gi.note,
+        created_at=gi.created_at.isoformat() if gi.created_at else datetime.now(timezone.utc).isoformat(),
+    )
+
+
+@router.post("/notes/confirm", response_model=NoteOut)
+async def confirm_note_upload(
+    payload: ConfirmUploadIn,
+    current: User = Depends(require_roles([Role.DOCTOR])),
+):
+    """تأكيد رفع صور سجل علاجي وإنشاء السجل."""
+    _, doctor_id = await _patient_access(current, payload.patient_id, "notes")
+    image_paths = await _verify_uploaded(payload.patient_id, "notes", payload.keys)
+
+    note_obj = await patient_service.create_note(
+        patient_id=payload.patient_id,
+        doctor_id=doctor_id,
+        note=payload.note,
+        image_path=image_paths[0],
+        image_paths=image_paths,
+        client_operation_id=payload.idempotency_key,
+    )
+    await _clear_pending(payload.keys)
+    return NoteOut(
+        id=str(note_obj.id),
+        patient_id=str(note_obj.patient_id),
+        doctor_id=str(note_obj.doctor_id),
+        note=note_obj.note,
+        image_path=note_obj.image_path,
+        **variant_fields(note_obj),
+        image_paths=note_obj.image_paths if note_obj.image_paths else None,
+        created_at=note_obj.created_at.isoformat() if note_obj.created_at else datetime.now(timezone.utc).isoformat(),
+    )
@@ -257,6 +257,13 @@ class AppointmentDateTimeUpdate(BaseModel):
                 return v
         raise ValueError("scheduled_at يجب أن يتضمن التاريخ والوقت مثل 2025-11-01T14:30")
 
+class ImageVariantsOut(BaseModel):
+    original: str
+    thumb: Optional[str] = None
+    medium: Optional[str] = None
+    display: Optional[str] = None
+
+
 class AppointmentOut(BaseModel):
     id: str
     patient_id: str
@@ -268,6 +275,10 @@ class AppointmentOut(BaseModel):
     note: Optional[str] = None
     image_path: Optional[str] = None  # للتوافق مع البيانات القديمة
     image_paths: List[str] = []  # قائمة الصور الجديدة
+    # نسخ مصغّرة للقوائم (None حتى تجهز — استخدم image_path)
+    thumb_path: Optional[str] = None
+    medium_path: Optional[str] = None
+    image_variants: List[ImageVariantsOut] = []
     status: str
     is_late: bool = False
     kind: str = "regular"
@@ -313,6 +324,9 @@ class NoteOut(BaseModel):
     note: Optional[str]
     image_path: Optional[str]
     image_paths: Optional[List[str]] = None
+    thumb_path: Optional[str] = None
+    medium_path: Optional[str] = None
+    image_variants: List[ImageVariantsOut] = []
     created_at: str
 
     class Config:
@@ -329,12 +343,49 @@ class GalleryOut(BaseModel):
     id: str
     patient_id: str
     image_path: str
+    thumb_path: Optional[str] = None
+    medium_path: Optional[str] = None
+    image_variants: List[ImageVariantsOut] = []
     note: Optional[str] = None
     created_at: str
 
     class Config:
         from_attributes = True
 
+class GalleryBatchItemOut(BaseModel):
+    index: int
+    filename: Optional[str] = None
+    idempotency_key: Optional[str] = None
+    status: Literal["created", "existing", "failed"]
+    image: Optional[GalleryOut] = None
+    error: Optional[str] = None
+
+class GalleryBatchOut(BaseModel):
+    patient_id: str
+    created: int
+    existing: int
+    failed: int
+    results: List[GalleryBatchItemOut]
+
+class PresignUploadIn(BaseModel):
+    patient_id: str
+    folder: Literal["gallery", "notes"]
+    content_type: str
+
+class PresignUploadOut(BaseModel):
+    key: str
+    upload_url: str
+    method: str = "PUT"
+    # يجب إرسالها كما هي مع طلب PUT (التوقيع يشملها)
+    headers: Dict[str, str] = {}
+    expires_in: int
+
+class ConfirmUploadIn(BaseModel):
+    patient_id: str
+    keys: List[str]
+    idempotency_key: str
+    note: Optional[str] = None
+
 # -------------------- Notifications --------------------
 
 class DeviceTokenIn(BaseModel):
@@ -368,6 +419,22 @@ class GeneralNotificationIn(BaseModel):
 class BroadcastResultOut(BaseModel):
     sent_count: int
 
+# -------------------- Background jobs --------------------
+
+class JobStatusOut(BaseModel):
+    """حالة مهمة دورية: القفل الحالي + نتيجة آخر تشغيل."""
+    name: str
+    owner: Optional[str] = None
+    lease_expires_at: Optional[str] = None
+    heartbeat_at: Optional[str] = None
+    last_started_at: Optional[str] = None
+    last_finished_at: Optional[str] = None
+    last_duration_ms: Optional[int] = None
+    last_outcome: Optional[str] = None
+    last_error: Optional[str] = None
+    last_owner: Optional[str] = None
+    run_count: int = 0
+
 # -------------------- Chat --------------------
 
 class ChatMessageIn(BaseModel):
@@ -392,6 +459,13 @@ class ChatMessageIn(BaseModel):
     content: Optional[str] = None
     imageUrl: Optional[str] = None
 
+class ChatHistoryOut(BaseModel):
+    """صفحة من تاريخ المحادثة بمؤشر (created_at, _id)."""
+    messages: List[ChatMessageOut]
+    # مؤشر لمتابعة نفس الاتجاه (في وضع after: آخر رسالة مستلمة، لاستخدامه بعد إعادة الاتصال)
+    next_cursor: Optional[str] = None
+    has_more: bool = False
+
 class ChatListItemOut(BaseModel):
     """Schema for chat list item with last message and unread count."""
     patient_id: str
@@ -484,6 +558,23 @@ class DentalChartOut(BaseModel):
         from_attributes = True
 
 
+# -------------------- Doctor: Patient Chart Bundle --------------------
+
+class PatientChartOut(BaseModel):
+    """كل ما تحتاجه شاشة المريض عند الطبيب في استجابة واحدة (الأقسام غير المطلوبة = null)."""
+    patient_id: str
+    sections: List[str]
+    patient: Optional[PatientOut] = None
+    notes: Optional[List[NoteOut]] = None
+    appointments: Optional[List[AppointmentOut]] = None
+    gallery: Optional[List[GalleryOut]] = None
+    dental_chart: Optional[DentalChartOut] = None
+    implant_stages: Optional[List[ImplantStageOut]] = None
+    chat: Optional[ChatHistoryOut] = None
+    # القسم الذي فشل جلبه → رسالة الخطأ (باقي الأقسام تُرجع عادي)
+    errors: Dict[str, str] = {}
+
+
 # -------------------- Reception: Daily Queue Archive --------------------
 
 class ReceptionQueueEntryIn(BaseModel):
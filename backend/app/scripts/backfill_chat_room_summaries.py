@@ -0,0 +1,34 @@
+"""
+Backfill ChatRoom summary fields used by /chat/list.
+
+What it does:
+1) Fill missing patient_user_id / doctor_user_id on legacy rooms
+2) Recompute last_message_* from chat_messages
+3) Recompute unread_for_doctor / unread_for_patient
+
+The same backfill runs once automatically on startup (job
+"chat_room_summary_backfill"); use this script to force a full recompute.
+
+Run:
+    python -m app.scripts.backfill_chat_room_summaries
+"""
+
+from __future__ import annotations
+
+import asyncio
+
+from app.database import init_db
+from app.utils.chat_helpers import backfill_chat_room_summaries
+
+
+async def run() -> None:
+    await init_db()
+
+    updated = await backfill_chat_room_summaries()
+
+    print("=== Chat room summary backfill completed ===")
+    print(f"Rooms updated: {updated}")
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
@@ -0,0 +1,37 @@
+"""
+Backfill GalleryImage.uploaded_by_role for images uploaded before it was stored.
+
+What it does:
+1) Collect the uploaders of gallery images that have no uploaded_by_role
+2) Load their current roles in one query
+3) Set uploaded_by_role with one update_many per role
+
+Images whose uploader no longer exists keep no role, so they stay hidden from
+the patient and doctor gallery views as before.
+
+The same backfill runs once automatically on startup (job
+"gallery_uploader_role_backfill"); use this script to run it on demand.
+
+Run:
+    python -m app.scripts.backfill_gallery_uploader_roles
+"""
+
+from __future__ import annotations
+
+import asyncio
+
+from app.database import init_db
+from app.services.patient_service import backfill_gallery_uploader_roles
+
+
+async def run() -> None:
+    await init_db()
+
+    updated = await backfill_gallery_uploader_roles()
+
+    print("=== Gallery uploader role backfill completed ===")
+    print(f"Images updated: {updated}")
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
@@ -0,0 +1,119 @@
+"""
+Backfill thumb/medium/display variants for media uploaded before the pipeline.
+
+What it does:
+1) Find gallery images, treatment notes and appointments whose images have
+   fewer variants than originals (newest first), including legacy notes and
+   appointments that only have a single image_path
+2) Render the missing variants on the image process pool and store them next
+   to the originals (.../variants/), EXIF stripped
+3) $push the variant URLs onto each record's image_variants
+
+Records are processed --concurrency at a time; the process pool size
+(IMAGE_PROCESS_WORKERS) bounds the CPU used. Safe to re-run: originals that
+already have variants are skipped.
+
+Run:
+    python -m app.scripts.backfill_image_variants
+    python -m app.scripts.backfill_image_variants --only gallery --limit 500 --dry-run
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+
+from app.database import init_db
+from app.models import Appointment, GalleryImage, TreatmentNote
+from app.services.image_variants import attach_variants, shutdown_image_variants
+
+COLLECTIONS = {
+    "gallery": (GalleryImage, "image_path"),
+    "notes": (TreatmentNote, "image_paths"),
+    "appointments": (Appointment, "image_paths"),
+}
+
+
+def _missing_filter(field: str) -> dict:
+    if field == "image_path":
+        return {"image_path": {"$nin": [None, ""]}, "image_variants.0": {"$exists": False}}
+    return {
+        "$or": [
+            # عدد النسخ أقل من عدد الصور
+            {
+                "$expr": {
+                    "$lt": [
+                        {"$size": {"$ifNull": ["$image_variants", []]}},
+                        {"$size": {"$ifNull": ["$image_paths", []]}},
+                    ]
+                }
+            },
+            # سجلات قديمة فيها image_path فقط
+            {
+                "image_paths": {"$in": [None, []]},
+                "image_path": {"$nin": [None, ""]},
+                "image_variants.0": {"$exists": False},
+            },
+        ]
+    }
+
+
+async def _backfill(name: str, limit: int | None, concurrency: int, dry_run: bool) -> tuple[int, int]:
+    model, field = COLLECTIONS[name]
+    cursor = model.get_motor_collection().find(
+        _missing_filter(field), {"image_path": 1, "image_paths": 1}
+    ).sort("_id", -1)
+    if limit:
+        cursor = cursor.limit(limit)
+
+    records = 0
+    attached = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(doc: dict) -> None:
+        nonlocal attached
+        urls = doc.get("image_paths") or ([doc["image_path"]] if doc.get("image_path") else [])
+        async with semaphore:
+            attached += await attach_variants(model, doc["_id"], urls)
+
+    batch: list[asyncio.Task] = []
+    async for doc in cursor:
+        records += 1
+        if dry_run:
+            continue
+        batch.append(asyncio.create_task(one(doc)))
+        if len(batch) >= concurrency * 4:
+            await asyncio.gather(*batch)
+            batch = []
+    if batch:
+        await asyncio.gather(*batch)
+    return records, attached
+
+
+async def run(only: str | None, limit: int | None, concurrency: int, dry_run: bool) -> None:
+    await init_db()
+
+    names = [only] if only else list(COLLECTIONS)
+    try:
+        for name in names:
+            started = time.perf_counter()
+            records, attached = await _backfill(name, limit, concurrency, dry_run)
+            print(
+                f"{name:<13} records needing variants: {records:6d}  "
+                f"images processed: {attached:6d}  ({time.perf_counter() - started:.1f}s)"
+            )
+    finally:
+        shutdown_image_variants()
+
+    print("=== Image variant backfill completed" + (" (dry run)" if dry_run else "") + " ===")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--only", choices=sorted(COLLECTIONS))
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(run(args.only, args.limit, args.concurrency, args.dry_run))
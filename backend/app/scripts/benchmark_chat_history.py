@@ -0,0 +1,121 @@
+"""
+Benchmark chat history paging on a large room.
+
+What it does:
+1) Seed a throwaway room with N messages (default 50k, many sharing created_at)
+2) Walk the whole room backwards with (created_at, _id) cursors and report
+   per-page latency (p50/p95/max), plus a forward "after" catch-up page
+3) Check that no message was skipped or duplicated and print the query plan
+4) Delete the seeded messages
+
+Run:
+    python -m app.scripts.benchmark_chat_history --messages 50000 --page 50
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+from beanie import PydanticObjectId as OID
+
+from app.database import init_db
+from app.models import ChatMessage
+from app.utils.chat_helpers import MESSAGE_PROJECTION, fetch_room_messages
+
+INSERT_BATCH = 5000
+
+
+async def _seed(room_id: OID, count: int) -> None:
+    collection = ChatMessage.get_motor_collection()
+    start = datetime.now(timezone.utc) - timedelta(days=30)
+    batch: list[dict] = []
+    for i in range(count):
+        batch.append(
+            {
+                "room_id": room_id,
+                "sender_user_id": None,
+                "sender_role": "patient",
+                "content": f"benchmark message {i}",
+                "imageUrl": None,
+                "is_read": True,
+                # 5 messages per millisecond so the _id tiebreaker is exercised
+                "created_at": start + timedelta(milliseconds=i // 5),
+            }
+        )
+        if len(batch) >= INSERT_BATCH:
+            await collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await collection.insert_many(batch, ordered=False)
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+async def run(messages: int, page: int) -> None:
+    await init_db()
+
+    room_id = OID()
+    print(f"Seeding {messages} messages into room {room_id} ...")
+    started = time.perf_counter()
+    await _seed(room_id, messages)
+    print(f"Seeded in {time.perf_counter() - started:.1f}s")
+
+    try:
+        latencies: list[float] = []
+        seen: set = set()
+        cursor = None
+        has_more = True
+        while has_more:
+            t0 = time.perf_counter()
+            docs, has_more = await fetch_room_messages(room_id, cursor=cursor, limit=page)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            for doc in docs:
+                seen.add(doc["_id"])
+            if docs:
+                cursor = (docs[-1]["created_at"].replace(tzinfo=timezone.utc), docs[-1]["_id"])
+
+        print("=== before (backward walk) ===")
+        print(f"Pages: {len(latencies)}  page size: {page}")
+        print(
+            f"Latency ms: p50={statistics.median(latencies):.2f} "
+            f"p95={_percentile(latencies, 0.95):.2f} max={max(latencies):.2f}"
+        )
+        print(f"Messages returned: {len(seen)} / {messages} (duplicates/skips: {messages - len(seen)})")
+
+        # Catch-up from the middle of the room, as after a reconnect.
+        middle = await ChatMessage.get_motor_collection().find(
+            {"room_id": room_id}, {"created_at": 1}
+        ).sort([("created_at", -1), ("_id", -1)]).skip(messages // 2).limit(1).to_list(1)
+        if middle:
+            t0 = time.perf_counter()
+            await fetch_room_messages(
+                room_id,
+                cursor=(middle[0]["created_at"].replace(tzinfo=timezone.utc), middle[0]["_id"]),
+                direction="after",
+                limit=page,
+            )
+            print(f"=== after (catch-up from middle) === {((time.perf_counter() - t0) * 1000):.2f} ms")
+
+        plan = await ChatMessage.get_motor_collection().find(
+            {"room_id": room_id}, MESSAGE_PROJECTION
+        ).sort([("created_at", -1), ("_id", -1)]).limit(page + 1).explain()
+        winning = plan.get("queryPlanner", {}).get("winningPlan", {})
+        print(f"Winning plan: {winning}")
+    finally:
+        result = await ChatMessage.get_motor_collection().delete_many({"room_id": room_id})
+        print(f"Cleaned up {result.deleted_count} seeded messages")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=50000)
+    parser.add_argument("--page", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(args.messages, args.page))
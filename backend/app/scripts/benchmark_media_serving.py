@@ -0,0 +1,150 @@
+"""
+Benchmark repeated gallery loads through /media.
+
+What it does:
+1) Write a fake patient gallery into the local media folder (default 40
+   thumbnails of 30 KiB + 40 photos of 1.5 MiB, timestamped names like
+   upload_clinic_file)
+2) Serve it through two in-process apps: the old handler (exists()/is_file()
+   + plain FileResponse) and utils/media_serving.serve_local_media
+3) Load the whole gallery once, then --reloads more times the way an app
+   reopening the gallery does: revalidating with If-None-Match when the
+   previous response had an ETag and was not `immutable`, skipping the
+   request entirely when it was
+4) Print requests sent, bytes received and wall time per run, then delete the
+   benchmark files
+
+No database, R2 or network needed (httpx ASGITransport).
+
+Run:
+    python -m app.scripts.benchmark_media_serving --thumbs 40 --photos 40 --reloads 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import shutil
+import time
+from pathlib import Path
+
+import httpx
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import FileResponse
+
+from app.services.media_storage import MEDIA_DIR
+from app.utils.media_serving import hot_cache, serve_local_media
+
+GALLERY_DIR = Path("patients") / "benchmark_000000" / "gallery"
+
+
+def _write_gallery(thumbs: int, photos: int, thumb_kb: int, photo_mb: float) -> list[str]:
+    folder = MEDIA_DIR / GALLERY_DIR
+    folder.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i, size in enumerate([thumb_kb * 1024] * thumbs + [int(photo_mb * 1024 * 1024)] * photos):
+        name = f"{20250101000000000000 + i}.jpg"
+        (folder / name).write_bytes(os.urandom(size))
+        paths.append(f"{GALLERY_DIR.as_posix()}/{name}")
+    return paths
+
+
+def _legacy_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/media/{file_path:path}")
+    async def serve_media(file_path: str):
+        local_file_path = MEDIA_DIR / file_path
+        if local_file_path.exists() and local_file_path.is_file():
+            return FileResponse(str(local_file_path))
+        raise HTTPException(status_code=404, detail="Media file not found")
+
+    return app
+
+
+def _cached_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/media/{file_path:path}")
+    async def serve_media(file_path: str, request: Request):
+        response = await serve_local_media(request, file_path)
+        if response is None:
+            raise HTTPException(status_code=404, detail="Media file not found")
+        return response
+
+    return app
+
+
+async def _load(client: httpx.AsyncClient, paths: list[str], validators: dict) -> tuple[int, int]:
+    """One gallery load; `validators` is the client's cache (path -> (etag, immutable))."""
+    requests = 0
+    received = 0
+
+    async def one(path: str) -> None:
+        nonlocal requests, received
+        etag, immutable = validators.get(path, (None, False))
+        if immutable:
+            return
+        headers = {"If-None-Match": etag} if etag else {}
+        response = await client.get(f"/media/{path}", headers=headers)
+        requests += 1
+        received += len(response.content)
+        if response.status_code == 200:
+            cache_control = response.headers.get("cache-control", "")
+            validators[path] = (response.headers.get("etag"), "immutable" in cache_control)
+
+    await asyncio.gather(*(one(p) for p in paths))
+    return requests, received
+
+
+async def _run_app(label: str, app: FastAPI, paths: list[str], reloads: int) -> None:
+    validators: dict = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for run in range(reloads + 1):
+            started = time.perf_counter()
+            requests, received = await _load(client, paths, validators)
+            elapsed = (time.perf_counter() - started) * 1000
+            kind = "first load" if run == 0 else f"reload {run}"
+            print(
+                f"{label:<8} {kind:<10} requests: {requests:4d}  "
+                f"received: {received / 1024 / 1024:8.2f} MiB  time: {elapsed:8.1f} ms"
+            )
+
+
+async def run(thumbs: int, photos: int, thumb_kb: int, photo_mb: float, reloads: int, revalidate: bool) -> None:
+    paths = _write_gallery(thumbs, photos, thumb_kb, photo_mb)
+    print(f"=== gallery of {thumbs} x {thumb_kb} KiB + {photos} x {photo_mb} MiB, {reloads} reloads ===")
+    try:
+        if revalidate:
+            # Rename to non-timestamped keys so every reload revalidates (304) instead of skipping.
+            folder = MEDIA_DIR / GALLERY_DIR
+            renamed = []
+            for p in paths:
+                name = p.rsplit("/", 1)[-1]
+                (folder / name).rename(folder / f"img_{name}")
+                renamed.append(f"{GALLERY_DIR.as_posix()}/img_{name}")
+            paths = renamed
+        await _run_app("old", _legacy_app(), paths, reloads)
+        hot_cache.clear()
+        await _run_app("cached", _cached_app(), paths, reloads)
+        print(f"hot cache: {len(hot_cache._items)} files, {hot_cache.bytes / 1024:.0f} KiB")
+    finally:
+        shutil.rmtree(MEDIA_DIR / GALLERY_DIR.parent, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--thumbs", type=int, default=40)
+    parser.add_argument("--photos", type=int, default=40)
+    parser.add_argument("--thumb-kb", type=int, default=30)
+    parser.add_argument("--photo-mb", type=float, default=1.5)
+    parser.add_argument("--reloads", type=int, default=5)
+    parser.add_argument(
+        "--revalidate",
+        action="store_true",
+        help="use non-timestamped names so reloads send If-None-Match instead of trusting `immutable`",
+    )
+    args = parser.parse_args()
+    asyncio.run(run(args.thumbs, args.photos, args.thumb_kb, args.photo_mb, args.reloads, args.revalidate))
@@ -0,0 +1,137 @@
+"""
+Benchmark media uploads against R2 or a local S3 stand-in.
+
+What it does:
+1) Upload N objects (default 100 x 2 MiB) concurrently the old way: a new
+   boto3 session/client per upload and a blocking put_object on the event loop
+2) Upload the same objects through media_storage.store_object (shared pooled
+   client, bounded upload pool, retries, multipart above the threshold)
+3) While each run is going, a 10ms ticker measures how late the loop wakes up
+4) Print wall time, loop lag and the upload latency metrics, then delete the
+   benchmark objects
+
+Against MinIO or moto server, point the R2 settings at it, e.g.:
+    moto_server -p 5000   (or: docker run -p 9000:9000 minio/minio server /data)
+    R2_ENDPOINT_URL=http://localhost:5000 R2_ACCESS_KEY_ID=test \
+    R2_SECRET_ACCESS_KEY=test R2_BUCKET_NAME=bench R2_PUBLIC_BASE=http://localhost:5000/bench \
+    python -m app.scripts.benchmark_media_upload --uploads 100 --size-mb 2 --create-bucket
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+import uuid
+
+from app.config import get_settings
+from app.services import media_storage
+
+settings = get_settings()
+
+TICK = 0.01
+
+
+async def _ticker(lags: list[float], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(max(0.0, (time.perf_counter() - started - TICK) * 1000))
+
+
+def _pct(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def _legacy_put(key: str, body: bytes) -> None:
+    import boto3
+
+    session = boto3.session.Session()
+    client = session.client(
+        "s3",
+        endpoint_url=media_storage._endpoint_url(),
+        aws_access_key_id=settings.R2_ACCESS_KEY_ID,
+        aws_secret_access_key=settings.R2_SECRET_ACCESS_KEY,
+        region_name="auto",
+    )
+    client.put_object(Bucket=settings.R2_BUCKET_NAME, Key=key, Body=body, ContentType="image/jpeg")
+
+
+async def _run(label: str, uploads: int, upload) -> None:
+    lags: list[float] = []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(_ticker(lags, stop))
+    await asyncio.sleep(TICK * 2)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(upload(i) for i in range(uploads)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await ticker
+    print(
+        f"{label:<8} wall={elapsed:6.2f}s "
+        f"loop lag ms: p50={statistics.median(lags) if lags else 0:7.1f} "
+        f"p99={_pct(lags, 0.99):7.1f} max={max(lags) if lags else 0:7.1f}"
+    )
+
+
+async def run(uploads: int, size_mb: float, create_bucket: bool, skip_legacy: bool) -> None:
+    client = media_storage.get_s3_client()
+    if client is None:
+        raise SystemExit("R2 is not configured (set R2_ENDPOINT_URL / credentials / bucket / public base)")
+    if create_bucket:
+        try:
+            client.create_bucket(Bucket=settings.R2_BUCKET_NAME)
+        except Exception as exc:
+            print(f"create_bucket: {exc}")
+
+    body = os.urandom(int(size_mb * 1024 * 1024))
+    prefix = f"benchmark/{uuid.uuid4().hex}"
+    print(
+        f"=== {uploads} uploads x {size_mb} MiB -> {media_storage._endpoint_url()} "
+        f"(workers={settings.MEDIA_UPLOAD_WORKERS}, pool={settings.R2_MAX_POOL_CONNECTIONS}) ==="
+    )
+
+    try:
+        if not skip_legacy:
+            async def legacy_upload(i: int) -> None:
+                _legacy_put(f"{prefix}/legacy/{i}.jpg", body)
+
+            await _run("legacy", uploads, legacy_upload)
+
+        async def pooled_upload(i: int) -> None:
+            await media_storage.store_object(f"{prefix}/pooled/{i}.jpg", body, "image/jpeg")
+
+        await _run("pooled", uploads, pooled_upload)
+        print(f"Upload metrics: {media_storage.upload_metrics()}")
+    finally:
+        keys = [
+            obj["Key"]
+            for page in client.get_paginator("list_objects_v2").paginate(
+                Bucket=settings.R2_BUCKET_NAME, Prefix=prefix
+            )
+            for obj in page.get("Contents", [])
+        ]
+        for i in range(0, len(keys), 1000):
+            client.delete_objects(
+                Bucket=settings.R2_BUCKET_NAME,
+                Delete={"Objects": [{"Key": k} for k in keys[i:i + 1000]]},
+            )
+        print(f"Cleaned up {len(keys)} benchmark objects")
+        media_storage.shutdown_media_storage()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--uploads", type=int, default=100)
+    parser.add_argument("--size-mb", type=float, default=2.0)
+    parser.add_argument("--create-bucket", action="store_true")
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(run(args.uploads, args.size_mb, args.create_bucket, args.skip_legacy))
@@ -0,0 +1,89 @@
+"""
+Benchmark event-loop stalls during a burst of staff logins.
+
+What it does:
+1) Hash one password with the configured bcrypt cost (BCRYPT_ROUNDS)
+2) Fire N concurrent verifications (default 50, a shift-start burst) twice:
+   inline on the event loop (old behaviour) and through the bcrypt pool
+3) While each burst runs, a 10ms ticker measures how late the loop wakes up
+4) Print burst wall time and loop lag p50/p99/max for both modes
+
+No database or server is needed.
+
+Run:
+    python -m app.scripts.benchmark_password_hashing --logins 50
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from app.config import get_settings
+from app.security import pwd_context, verify_and_update_password, verify_password
+
+settings = get_settings()
+
+TICK = 0.01
+
+
+async def _ticker(lags: list[float], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(max(0.0, (time.perf_counter() - started - TICK) * 1000))
+
+
+def _pct(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+async def _burst(label: str, logins: int, login) -> None:
+    lags: list[float] = []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(_ticker(lags, stop))
+    await asyncio.sleep(TICK * 2)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await ticker
+    ok = sum(1 for r in results if r)
+    print(
+        f"{label:<10} wall={elapsed:6.2f}s ok={ok}/{logins} "
+        f"loop lag ms: p50={statistics.median(lags) if lags else 0:7.1f} "
+        f"p99={_pct(lags, 0.99):7.1f} max={max(lags) if lags else 0:7.1f} ticks={len(lags)}"
+    )
+
+
+async def run(logins: int) -> None:
+    password = "shift-start-password"
+    hashed = pwd_context.hash(password)
+    print(
+        f"=== {logins} concurrent staff logins, bcrypt rounds={settings.BCRYPT_ROUNDS}, "
+        f"pool workers={settings.PASSWORD_HASH_WORKERS} ==="
+    )
+
+    async def inline_login() -> bool:
+        return verify_password(password, hashed)
+
+    async def pooled_login() -> bool:
+        valid, _ = await verify_and_update_password(password, hashed)
+        return valid
+
+    await _burst("inline", logins, inline_login)
+    await _burst("pooled", logins, pooled_login)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--logins", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(args.logins))
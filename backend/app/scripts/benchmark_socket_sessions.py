@@ -0,0 +1,81 @@
+"""
+Memory benchmark for per-socket session records.
+
+What it does:
+1) Simulate N connected sockets (default 10k) the old way: a dict per socket
+   holding the full User document
+2) Simulate the same sockets with SocketSession (__slots__: user_id, role, name)
+3) Print the traced memory of each layout and the per-socket cost
+
+No database or server is needed; the User documents are built in memory.
+
+Run:
+    python -m app.scripts.benchmark_socket_sessions --connections 10000
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import tracemalloc
+from typing import Callable
+
+from beanie import PydanticObjectId as OID
+
+from app.constants import Role
+from app.models import User
+from app.services.socket_service import SocketSession
+
+
+def _make_user(i: int) -> User:
+    return User(
+        id=OID(),
+        name=f"مريض تجريبي {i}",
+        phone=f"0770{i:07d}",
+        role=Role.PATIENT if i % 10 else Role.DOCTOR,
+        gender="female",
+        age=30,
+        city="بغداد",
+        imageUrl=f"https://media.example.com/profiles/{i}.jpg",
+        password_hash="$2b$12$" + "x" * 53,
+    )
+
+
+def _measure(label: str, build: Callable[[], dict]) -> int:
+    gc.collect()
+    tracemalloc.start()
+    store = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<28} {current / 1024 / 1024:8.2f} MiB  {current / max(len(store), 1):8.0f} B/socket")
+    del store
+    return current
+
+
+def run(connections: int) -> None:
+    def legacy_records() -> dict:
+        store: dict = {}
+        for i in range(connections):
+            user = _make_user(i)
+            store[f"sid-{i}"] = {"user_id": str(user.id), "user": user, "role": user.role.value}
+        return store
+
+    def session_records() -> dict:
+        store: dict = {}
+        for i in range(connections):
+            role = Role.PATIENT if i % 10 else Role.DOCTOR
+            store[f"sid-{i}"] = SocketSession(OID(), role, f"مريض تجريبي {i}")
+        return store
+
+    print(f"=== {connections} simulated socket connections ===")
+    legacy = _measure("dict + full User document", legacy_records)
+    lean = _measure("SocketSession (__slots__)", session_records)
+    if lean:
+        print(f"Reduction: {legacy / lean:.1f}x ({(legacy - lean) / 1024 / 1024:.2f} MiB saved)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--connections", type=int, default=10000)
+    args = parser.parse_args()
+    run(args.connections)
@@ -0,0 +1,105 @@
+"""
+Benchmark peak memory of concurrent image uploads.
+
+What it does:
+1) Build N spooled uploads (default 20 x 8 MiB), the same SpooledTemporaryFile
+   objects Starlette hands to the routers (in memory up to 1 MiB, disk beyond)
+2) Upload them concurrently the old way: `await image.read()` then bytes to storage
+3) Upload them again the way upload_clinic_file does (stage_upload: chunked
+   size check + SHA-256, then the spooled file is streamed to storage)
+4) Print the traced peak memory of each run
+
+Uses whatever storage is configured (local media/ folder when R2 is not set);
+the uploaded benchmark files are not cleaned up from R2.
+
+Run:
+    python -m app.scripts.benchmark_upload_memory --uploads 20 --size-mb 8
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import tracemalloc
+
+from fastapi import UploadFile
+from starlette.datastructures import Headers
+
+from app.services.media_storage import MEDIA_DIR, shutdown_media_storage, store_object
+from app.utils.r2_clinic import build_media_key
+from app.utils.uploads import stage_upload
+
+SPOOL_MAX = 1024 * 1024  # Starlette's multipart spool threshold
+PATIENT_ID = "benchmark000000"
+
+
+def _key() -> str:
+    return build_media_key(PATIENT_ID, "gallery", "image/jpeg", "benchmark")
+
+
+def _make_uploads(count: int, payload: bytes) -> list[UploadFile]:
+    uploads = []
+    for i in range(count):
+        spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX)
+        spooled.write(payload)
+        spooled.seek(0)
+        uploads.append(
+            UploadFile(
+                spooled,
+                size=len(payload),
+                filename=f"{i}.jpg",
+                headers=Headers({"content-type": "image/jpeg"}),
+            )
+        )
+    return uploads
+
+
+async def _measure(label: str, coro_factory) -> None:
+    tracemalloc.start()
+    await coro_factory()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<10} peak traced memory: {peak / 1024 / 1024:8.2f} MiB")
+
+
+async def run(uploads: int, size_mb: float) -> None:
+    payload = os.urandom(int(size_mb * 1024 * 1024))
+    print(f"=== {uploads} concurrent uploads x {size_mb} MiB ===")
+
+    legacy_files = _make_uploads(uploads, payload)
+    streamed_files = _make_uploads(uploads, payload)
+    del payload
+
+    async def legacy() -> None:
+        async def one(image: UploadFile) -> None:
+            file_bytes = await image.read()
+            await store_object(_key(), file_bytes, "image/jpeg")
+
+        await asyncio.gather(*(one(f) for f in legacy_files))
+
+    async def streamed() -> None:
+        async def one(image: UploadFile) -> None:
+            staged = await stage_upload(image)
+            await store_object(_key(), staged.file, staged.content_type, staged.size)
+
+        await asyncio.gather(*(one(f) for f in streamed_files))
+
+    try:
+        await _measure("read()", legacy)
+        await _measure("streamed", streamed)
+    finally:
+        for f in legacy_files + streamed_files:
+            f.file.close()
+        shutil.rmtree(MEDIA_DIR / "patients" / "benchmark_000000", ignore_errors=True)
+        shutdown_media_storage()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--uploads", type=int, default=20)
+    parser.add_argument("--size-mb", type=float, default=8.0)
+    args = parser.parse_args()
+    asyncio.run(run(args.uploads, args.size_mb))
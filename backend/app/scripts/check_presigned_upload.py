@@ -0,0 +1,69 @@
+"""
+Round-trip check of presigned direct uploads against R2 or a local S3 stand-in.
+
+What it does:
+1) Build a key with the same layout as /uploads/presign and sign a PUT URL
+2) PUT a small JPEG-sized payload to it with httpx, exactly as the apps do
+3) HEAD the object (what /uploads/*/confirm checks) and compare the size
+4) Check that a PUT with a different Content-Type is rejected by the signature
+5) Delete the object
+
+No database is needed. Against moto server or MinIO:
+    R2_ENDPOINT_URL=http://localhost:5000 R2_ACCESS_KEY_ID=test \
+    R2_SECRET_ACCESS_KEY=test R2_BUCKET_NAME=bench R2_PUBLIC_BASE=http://localhost:5000/bench \
+    python -m app.scripts.check_presigned_upload --create-bucket
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+
+import httpx
+
+from app.config import get_settings
+from app.services import media_storage
+from app.utils.r2_clinic import build_media_key
+
+settings = get_settings()
+
+
+async def run(create_bucket: bool, size_kb: int) -> None:
+    client = media_storage.get_s3_client()
+    if client is None:
+        raise SystemExit("R2 is not configured (set R2_ENDPOINT_URL / credentials / bucket / public base)")
+    if create_bucket:
+        try:
+            client.create_bucket(Bucket=settings.R2_BUCKET_NAME)
+        except Exception as exc:
+            print(f"create_bucket: {exc}")
+
+    key = build_media_key("presigncheck0001", "gallery", "image/jpeg", "presign check")
+    url = media_storage.presign_put(key, "image/jpeg", settings.PRESIGNED_UPLOAD_EXPIRE_SECONDS)
+    body = os.urandom(size_kb * 1024)
+    print(f"Key: {key}")
+
+    try:
+        async with httpx.AsyncClient(timeout=30) as http:
+            response = await http.put(url, content=body, headers={"Content-Type": "image/jpeg"})
+            print(f"PUT with signed Content-Type: {response.status_code}")
+            response.raise_for_status()
+
+            info = await media_storage.head_object(key)
+            ok = info is not None and info["size"] == len(body)
+            print(f"HEAD: {info} -> {'OK' if ok else 'MISMATCH'}")
+
+            tampered = await http.put(url, content=body, headers={"Content-Type": "text/html"})
+            print(f"PUT with other Content-Type: {tampered.status_code} (expected 403)")
+    finally:
+        await media_storage.delete_object(key)
+        media_storage.shutdown_media_storage()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--create-bucket", action="store_true")
+    parser.add_argument("--size-kb", type=int, default=512)
+    args = parser.parse_args()
+    asyncio.run(run(args.create_bucket, args.size_kb))
@@ -0,0 +1,143 @@
+"""
+Pre-render and store QR images for patients that only have the lazy /qr link.
+
+What it does:
+1) Give a real qr_code_data to patients still on a temporary (tmp-...) or empty code
+2) Find patients whose qr_image_path is empty or the lazy /qr/{code}.png link
+   (newest first)
+3) Render the PNGs on a process pool (--workers), --batch patients at a time
+4) Upload each through upload_clinic_image (QRcode folder) and set
+   qr_image_path, only if the patient's code did not change meanwhile
+
+Not needed for the app to work: GET /qr/{code}.png renders on first request.
+Use it to move QR images to R2 ahead of printing or bulk sends. Safe to re-run.
+
+Run:
+    python -m app.scripts.prerender_qr_codes
+    python -m app.scripts.prerender_qr_codes --limit 1000 --workers 4 --dry-run
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import multiprocessing
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from app.config import get_settings
+from app.database import init_db
+from app.models import Patient
+from app.services.media_storage import shutdown_media_storage
+from app.utils.image_ops import render_qr
+from app.utils.qrcode_gen import lazy_qr_url, new_qr_code
+from app.utils.r2_clinic import upload_clinic_image
+
+settings = get_settings()
+
+_TMP_CODE = re.compile(r"^tmp-")
+
+
+async def _assign_missing_codes(dry_run: bool) -> int:
+    collection = Patient.get_motor_collection()
+    cursor = collection.find(
+        {"$or": [{"qr_code_data": {"$in": [None, ""]}}, {"qr_code_data": _TMP_CODE}]},
+        {"qr_code_data": 1},
+    )
+    assigned = 0
+    async for doc in cursor:
+        assigned += 1
+        if dry_run:
+            continue
+        code = new_qr_code(doc["_id"])
+        await collection.update_one(
+            {"_id": doc["_id"], "qr_code_data": doc.get("qr_code_data")},
+            {"$set": {"qr_code_data": code, "qr_image_path": lazy_qr_url(code)}},
+        )
+    return assigned
+
+
+async def _store_batch(pool: ProcessPoolExecutor, docs: list[dict]) -> int:
+    loop = asyncio.get_running_loop()
+    images = await asyncio.gather(
+        *(loop.run_in_executor(pool, render_qr, doc["qr_code_data"], "png") for doc in docs)
+    )
+
+    async def one(doc: dict, png: bytes) -> int:
+        url = await upload_clinic_image(
+            patient_id=str(doc["_id"]),
+            folder="qr",
+            file_bytes=png,
+            content_type="image/png",
+            name_hint=doc.get("name"),
+        )
+        result = await Patient.get_motor_collection().update_one(
+            {"_id": doc["_id"], "qr_code_data": doc["qr_code_data"]},
+            {"$set": {"qr_image_path": url}},
+        )
+        return result.modified_count
+
+    results = await asyncio.gather(*(one(d, png) for d, png in zip(docs, images)), return_exceptions=True)
+    for doc, result in zip(docs, results):
+        if isinstance(result, Exception):
+            print(f"  failed for patient {doc['_id']}: {result}")
+    return sum(r for r in results if isinstance(r, int))
+
+
+async def _prerender(limit: int | None, workers: int, batch: int, dry_run: bool) -> tuple[int, int]:
+    cursor = Patient.get_motor_collection().find(
+        {
+            "qr_code_data": {"$nin": [None, ""], "$not": _TMP_CODE},
+            "$or": [{"qr_image_path": {"$in": [None, ""]}}, {"qr_image_path": re.compile(r"^/qr/")}],
+        },
+        {"qr_code_data": 1, "name": 1},
+    ).sort("_id", -1)
+    if limit:
+        cursor = cursor.limit(limit)
+
+    found = 0
+    stored = 0
+    pending: list[dict] = []
+    # spawn: لا نورّث threads/sockets الـ event loop إلى العمليات الفرعية
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        async for doc in cursor:
+            found += 1
+            if dry_run:
+                continue
+            pending.append(doc)
+            if len(pending) >= batch:
+                stored += await _store_batch(pool, pending)
+                pending = []
+        if pending:
+            stored += await _store_batch(pool, pending)
+    return found, stored
+
+
+async def run(limit: int | None, workers: int, batch: int, dry_run: bool) -> None:
+    await init_db()
+
+    started = time.perf_counter()
+    try:
+        assigned = await _assign_missing_codes(dry_run)
+        print(f"patients given a QR code:      {assigned:6d}")
+        found, stored = await _prerender(limit, workers, batch, dry_run)
+        print(f"patients without a stored QR:  {found:6d}  stored: {stored:6d}")
+    finally:
+        shutdown_media_storage()
+
+    print(
+        f"=== QR pre-render completed in {time.perf_counter() - started:.1f}s"
+        + (" (dry run)" if dry_run else "")
+        + " ==="
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=settings.IMAGE_PROCESS_WORKERS)
+    parser.add_argument("--batch", type=int, default=200)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(run(args.limit, args.workers, args.batch, args.dry_run))
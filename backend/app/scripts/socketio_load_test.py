@@ -0,0 +1,444 @@
+"""
+Load test for the Socket.IO chat layer (fan-out, read receipts, presence).
+
+What it does:
+1) Seed N doctors and M patients per doctor (tagged "loadtest") plus their chat rooms
+2) Connect every user with the python-socketio client to a running server
+3) Patients join_conversation, doctors join_room_by_id, both sides send_message
+   on a timer and receivers mark_read; doctors periodically drop and reconnect
+   (some inside SOCKET_PRESENCE_GRACE_SECONDS, some after it) to exercise presence
+4) Report p50/p95/p99 emit-to-receive latency, messages/sec, delivery ratio,
+   presence events, client event-loop lag, /healthz latency (a proxy for the
+   server event loop) and server RSS when --server-pid is given
+5) Delete everything it seeded (unless --keep-data)
+
+Profiles:
+    smoke  small and short; exits non-zero if deliveries are lost or p99 is too high,
+           so it can gate CI
+    soak   hundreds of sockets for 30 minutes to surface leaks and drift
+
+Needs a server on --url using the same MONGODB_URI / JWT_SECRET as this
+process, and the async client extra: pip install "python-socketio[asyncio_client]"
+
+Run:
+    python -m app.scripts.socketio_load_test --profile smoke --url http://127.0.0.1:8000
+    python -m app.scripts.socketio_load_test --profile soak --server-pid $(pgrep -f uvicorn)
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+import uuid
+from dataclasses import dataclass, field, replace
+
+import httpx
+import socketio
+
+from app.config import get_settings
+from app.constants import Role
+from app.database import init_db
+from app.models import ChatMessage, ChatRoom, Doctor, Patient, User
+from app.security import create_access_token, token_claims
+from app.utils.chat_helpers import get_or_create_chat_room
+
+settings = get_settings()
+
+MESSAGE_TAG = "lt"
+
+
+@dataclass
+class Profile:
+    doctors: int
+    patients_per_doctor: int
+    duration: float  # seconds
+    message_interval: float  # seconds between sends per client
+    churn_interval: float  # seconds between doctor reconnects
+    max_p99_ms: float | None = None
+    min_delivery_ratio: float | None = None
+
+
+PROFILES = {
+    "smoke": Profile(
+        doctors=2,
+        patients_per_doctor=5,
+        duration=20,
+        message_interval=1.0,
+        churn_interval=8,
+        max_p99_ms=500,
+        min_delivery_ratio=0.98,
+    ),
+    "soak": Profile(
+        doctors=20,
+        patients_per_doctor=25,
+        duration=30 * 60,
+        message_interval=5.0,
+        churn_interval=30,
+    ),
+}
+
+
+@dataclass
+class Stats:
+    latencies_ms: list[float] = field(default_factory=list)
+    sent: int = 0
+    delivered: int = 0
+    marked_read: int = 0
+    errors: int = 0
+    presence_changed: int = 0
+    reconnects: int = 0
+    loop_lag_ms: list[float] = field(default_factory=list)
+    healthz_ms: list[float] = field(default_factory=list)
+    server_rss_kb: list[int] = field(default_factory=list)
+
+
+@dataclass
+class Seeded:
+    user_ids: list = field(default_factory=list)
+    doctor_ids: list = field(default_factory=list)
+    patient_ids: list = field(default_factory=list)
+    room_ids: list = field(default_factory=list)
+
+
+class SimUser:
+    """One simulated app instance (doctor or patient) with its own socket."""
+
+    def __init__(self, *, user: User, url: str, stats: Stats, rooms: list[dict]):
+        self.user = user
+        self.user_id = str(user.id)
+        self.role = user.role
+        self.url = url
+        self.stats = stats
+        # [{"room_id", "patient_id", "doctor_id"}]
+        self.rooms = rooms
+        self.token = create_access_token(token_claims(user))
+        self.client = self._new_client()
+        self._seen: set[str] = set()
+        self._joined = 0
+        # room_id -> SimUser on the other side (filled in by run())
+        self.peers: dict[str, "SimUser"] = {}
+
+    def _new_client(self) -> socketio.AsyncClient:
+        client = socketio.AsyncClient(reconnection=False)
+        client.on("message_received", self._on_message)
+        client.on("presence_changed", self._on_presence)
+        client.on("joined_conversation", self._on_joined)
+        client.on("marked_read", self._on_marked_read)
+        client.on("error", self._on_error)
+        return client
+
+    async def _on_message(self, data):
+        message = (data or {}).get("message") or {}
+        content = message.get("content") or ""
+        if message.get("sender_user_id") == self.user_id or not content.startswith(MESSAGE_TAG + ":"):
+            return
+        # The receiver gets the message in the room and in its user_ room; count once.
+        if message.get("id") in self._seen:
+            return
+        self._seen.add(message.get("id"))
+        _, _, sent_ns = content.split(":", 2)
+        self.stats.latencies_ms.append((time.perf_counter_ns() - int(sent_ns)) / 1e6)
+        self.stats.delivered += 1
+        if self.stats.delivered % 5 == 0:
+            await self.client.emit("mark_read", {"room_id": message.get("room_id")})
+
+    async def _on_presence(self, data):
+        self.stats.presence_changed += 1
+
+    async def _on_joined(self, data):
+        self._joined += 1
+
+    async def _on_marked_read(self, data):
+        self.stats.marked_read += 1
+
+    async def _on_error(self, data):
+        self.stats.errors += 1
+
+    async def connect(self) -> None:
+        await self.client.connect(
+            self.url,
+            auth={"token": self.token},
+            socketio_path="/socket.io",
+            transports=["websocket"],
+        )
+        for room in self.rooms:
+            if self.role == Role.PATIENT:
+                await self.client.emit(
+                    "join_conversation",
+                    {"patient_id": room["patient_id"], "doctor_id": room["doctor_id"]},
+                )
+            else:
+                await self.client.emit("join_room_by_id", {"room_id": room["room_id"]})
+
+    async def reconnect(self, pause: float) -> None:
+        await self.client.disconnect()
+        await asyncio.sleep(pause)
+        self.client = self._new_client()
+        self._seen.clear()
+        await self.connect()
+        self.stats.reconnects += 1
+
+    async def send_forever(self, interval: float, stop_at: float) -> None:
+        await asyncio.sleep(random.uniform(0, interval))
+        i = 0
+        while time.monotonic() < stop_at:
+            room = self.rooms[i % len(self.rooms)]
+            i += 1
+            peer = self.peers.get(room["room_id"])
+            # Skip while the receiver is mid-reconnect so the delivery ratio
+            # measures the server, not the churn.
+            if self.client.connected and (peer is None or peer.client.connected):
+                try:
+                    await self.client.emit(
+                        "send_message",
+                        {
+                            "room_id": room["room_id"],
+                            "content": f"{MESSAGE_TAG}:{uuid.uuid4().hex[:8]}:{time.perf_counter_ns()}",
+                        },
+                    )
+                    self.stats.sent += 1
+                except Exception:
+                    self.stats.errors += 1
+            await asyncio.sleep(interval)
+
+    async def close(self) -> None:
+        if self.client.connected:
+            await self.client.disconnect()
+
+
+async def _seed(profile: Profile) -> tuple[Seeded, list[User], list[User], list[dict]]:
+    seeded = Seeded()
+    doctors_users: list[User] = []
+    patient_users: list[User] = []
+    rooms: list[dict] = []
+    run_tag = uuid.uuid4().hex[:6]
+    for d in range(profile.doctors):
+        doctor_user = User(
+            name=f"loadtest doctor {d}",
+            phone=f"loadtest-{run_tag}-d{d}",
+            username=f"loadtest-{run_tag}-d{d}",
+            role=Role.DOCTOR,
+        )
+        await doctor_user.insert()
+        doctor = Doctor(user_id=doctor_user.id)
+        await doctor.insert()
+        seeded.user_ids.append(doctor_user.id)
+        seeded.doctor_ids.append(doctor.id)
+        doctors_users.append(doctor_user)
+
+        for p in range(profile.patients_per_doctor):
+            patient_user = User(
+                name=f"loadtest patient {d}-{p}",
+                phone=f"loadtest-{run_tag}-p{d}-{p}",
+                role=Role.PATIENT,
+            )
+            await patient_user.insert()
+            patient = Patient(
+                user_id=patient_user.id,
+                name=patient_user.name,
+                doctor_ids=[doctor.id],
+                qr_code_data=f"loadtest-{uuid.uuid4().hex}",
+            )
+            await patient.insert()
+            room = await get_or_create_chat_room(patient=patient, doctor=doctor)
+            seeded.user_ids.append(patient_user.id)
+            seeded.patient_ids.append(patient.id)
+            seeded.room_ids.append(room.id)
+            patient_users.append(patient_user)
+            rooms.append(
+                {
+                    "room_id": str(room.id),
+                    "patient_id": str(patient.id),
+                    "doctor_id": str(doctor.id),
+                    "doctor_user_id": str(doctor_user.id),
+                    "patient_user_id": str(patient_user.id),
+                }
+            )
+    return seeded, doctors_users, patient_users, rooms
+
+
+async def _cleanup(seeded: Seeded) -> None:
+    await ChatMessage.get_motor_collection().delete_many({"room_id": {"$in": seeded.room_ids}})
+    await ChatRoom.get_motor_collection().delete_many({"_id": {"$in": seeded.room_ids}})
+    await Patient.get_motor_collection().delete_many({"_id": {"$in": seeded.patient_ids}})
+    await Doctor.get_motor_collection().delete_many({"_id": {"$in": seeded.doctor_ids}})
+    await User.get_motor_collection().delete_many({"_id": {"$in": seeded.user_ids}})
+
+
+def _read_rss_kb(pid: int) -> int | None:
+    try:
+        with open(f"/proc/{pid}/status") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+async def _monitor(url: str, server_pid: int | None, stats: Stats, stop_at: float) -> None:
+    """Client loop lag every 100ms; /healthz latency and server RSS every second."""
+    interval = 0.1
+    ticks = 0
+    async with httpx.AsyncClient(base_url=url, timeout=5) as http:
+        while time.monotonic() < stop_at:
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            stats.loop_lag_ms.append(max(0.0, (time.perf_counter() - started - interval) * 1000))
+            ticks += 1
+            if ticks % 10:
+                continue
+            t0 = time.perf_counter()
+            try:
+                await http.get("/healthz")
+                stats.healthz_ms.append((time.perf_counter() - t0) * 1000)
+            except Exception:
+                stats.errors += 1
+            if server_pid:
+                rss = _read_rss_kb(server_pid)
+                if rss is not None:
+                    stats.server_rss_kb.append(rss)
+
+
+async def _churn_doctors(doctors: list[SimUser], interval: float, stop_at: float) -> None:
+    """Reconnect a random doctor; alternate between inside and outside the grace window."""
+    grace = settings.SOCKET_PRESENCE_GRACE_SECONDS
+    inside = True
+    while True:
+        await asyncio.sleep(interval)
+        if time.monotonic() >= stop_at or not doctors:
+            return
+        pause = grace / 2 if inside else grace + 1
+        inside = not inside
+        try:
+            await random.choice(doctors).reconnect(pause)
+        except Exception:
+            pass
+
+
+def _pct(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def _report(profile_name: str, stats: Stats, elapsed: float, sockets: int) -> None:
+    lat = stats.latencies_ms
+    print(f"=== Socket.IO load test ({profile_name}) ===")
+    print(f"Sockets: {sockets}  duration: {elapsed:.0f}s  reconnects: {stats.reconnects}")
+    print(f"Messages sent: {stats.sent}  delivered: {stats.delivered}  mark_read acks: {stats.marked_read}")
+    print(f"Throughput: {stats.sent / elapsed:.1f} msgs/s sent, {stats.delivered / elapsed:.1f} msgs/s delivered")
+    print(
+        f"Emit->receive latency ms: p50={_pct(lat, 0.50):.1f} p95={_pct(lat, 0.95):.1f} "
+        f"p99={_pct(lat, 0.99):.1f} max={max(lat) if lat else 0:.1f}"
+    )
+    print(f"presence_changed received: {stats.presence_changed}  errors: {stats.errors}")
+    print(
+        f"Client loop lag ms: p99={_pct(stats.loop_lag_ms, 0.99):.1f} "
+        f"max={max(stats.loop_lag_ms) if stats.loop_lag_ms else 0:.1f}"
+    )
+    if stats.healthz_ms:
+        print(
+            f"/healthz ms (server loop proxy): p50={statistics.median(stats.healthz_ms):.1f} "
+            f"p99={_pct(stats.healthz_ms, 0.99):.1f}"
+        )
+    if stats.server_rss_kb:
+        rss = stats.server_rss_kb
+        print(
+            f"Server RSS MiB: start={rss[0] / 1024:.1f} end={rss[-1] / 1024:.1f} "
+            f"peak={max(rss) / 1024:.1f}"
+        )
+
+
+async def run(profile_name: str, profile: Profile, url: str, server_pid: int | None, keep_data: bool) -> int:
+    await init_db()
+    seeded, doctor_users, patient_users, rooms = await _seed(profile)
+    stats = Stats()
+    sims: list[SimUser] = []
+    try:
+        doctors = [
+            SimUser(
+                user=u,
+                url=url,
+                stats=stats,
+                rooms=[r for r in rooms if r["doctor_user_id"] == str(u.id)],
+            )
+            for u in doctor_users
+        ]
+        patients = [
+            SimUser(
+                user=u,
+                url=url,
+                stats=stats,
+                rooms=[r for r in rooms if r["patient_user_id"] == str(u.id)],
+            )
+            for u in patient_users
+        ]
+        sims = doctors + patients
+        by_user = {sim.user_id: sim for sim in sims}
+        for sim in sims:
+            for room in sim.rooms:
+                peer_id = room["patient_user_id"] if sim.role == Role.DOCTOR else room["doctor_user_id"]
+                sim.peers[room["room_id"]] = by_user[peer_id]
+        for sim in sims:
+            await sim.connect()
+        await asyncio.sleep(1)
+
+        started = time.monotonic()
+        stop_at = started + profile.duration
+        await asyncio.gather(
+            _monitor(url, server_pid, stats, stop_at),
+            _churn_doctors(doctors, profile.churn_interval, stop_at),
+            *(sim.send_forever(profile.message_interval, stop_at) for sim in sims),
+        )
+        # Let in-flight messages arrive.
+        await asyncio.sleep(2)
+        elapsed = time.monotonic() - started
+        _report(profile_name, stats, elapsed, len(sims))
+    finally:
+        for sim in sims:
+            try:
+                await sim.close()
+            except Exception:
+                pass
+        if not keep_data:
+            await _cleanup(seeded)
+
+    failed = False
+    if profile.min_delivery_ratio is not None and stats.sent:
+        ratio = stats.delivered / stats.sent
+        if ratio < profile.min_delivery_ratio:
+            print(f"FAIL: delivery ratio {ratio:.3f}")
+            failed = True
+    if profile.max_p99_ms is not None and _pct(stats.latencies_ms, 0.99) > profile.max_p99_ms:
+        print(f"FAIL: p99 latency above {profile.max_p99_ms}ms")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="smoke")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--server-pid", type=int, default=None)
+    parser.add_argument("--doctors", type=int)
+    parser.add_argument("--patients-per-doctor", type=int)
+    parser.add_argument("--duration", type=float, help="seconds")
+    parser.add_argument("--interval", type=float, help="seconds between messages per client")
+    parser.add_argument("--keep-data", action="store_true")
+    args = parser.parse_args()
+
+    selected = PROFILES[args.profile]
+    overrides = {
+        "doctors": args.doctors,
+        "patients_per_doctor": args.patients_per_doctor,
+        "duration": args.duration,
+        "message_interval": args.interval,
+    }
+    selected = replace(selected, **{k: v for k, v in overrides.items() if v is not None})
+    sys.exit(asyncio.run(run(args.profile, selected, args.url, args.server_pid, args.keep_data)))
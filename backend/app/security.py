@@ -1,3 +1,7 @@
+import asyncio
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import List, Optional, Callable
 
@@ -19,24 +23,79 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/staff-login")
 
 # ------------------------ Password hashing helpers ------------------------
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt__min_rounds: أي hash بتكلفة أقل من BCRYPT_ROUNDS يُعاد تشفيره عند تسجيل الدخول.
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+)
+
+# bcrypt يحرر الـ GIL، لذلك يكفي thread pool صغير لإبعاده عن الـ event loop.
+# حجم الـ pool هو حد التزامن: بقية الطلبات تنتظر دون حجز الـ loop.
+_password_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt"
+)
 
 
 def hash_password(password: str) -> str:
-    """تشفير كلمة المرور باستخدام bcrypt."""
+    """تشفير كلمة المرور باستخدام bcrypt (متزامن — للسكربتات)."""
     return pwd_context.hash(password)
 
 
 def verify_password(plain_password: str, hashed_password: str | None) -> bool:
-    """التحقق من كلمة المرور، يرجع False إذا لم يوجد hash."""
+    """التحقق من كلمة المرور، يرجع False إذا لم يوجد hash (متزامن — للسكربتات)."""
     if not hashed_password:
         return False
     return pwd_context.verify(plain_password, hashed_password)
 
 
+async def hash_password_async(password: str) -> str:
+    """hash_password على pool الـ bcrypt دون حجز الـ event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_password_executor, pwd_context.hash, password)
+
+
+async def verify_and_update_password(
+    plain_password: str, hashed_password: str | None
+) -> tuple[bool, str | None]:
+    """
+    التحقق من كلمة المرور على pool الـ bcrypt.
+    يرجع (صحيحة؟، hash جديد إذا تغيّرت إعدادات التكلفة وإلا None).
+    """
+    if not hashed_password:
+        return False, None
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(
+            _password_executor, pwd_context.verify_and_update, plain_password, hashed_password
+        )
+    except ValueError:
+        # hash تالف أو بصيغة غير معروفة
+        return False, None
+
+
 # ------------------------ JWT helpers ------------------------
 
 
+def token_claims(user: User, doctor_id: str | None = None) -> dict:
+    """Claims shared by access/refresh tokens (sockets authorize from these).
+
+    doctor_id (doctors only) lets get_current_user skip the Doctor lookup.
+    """
+    claims = {
+        "sub": str(user.id),
+        "role": user.role,
+        "phone": user.phone,
+        "name": user.name,
+    }
+    if user.username:
+        claims["username"] = user.username
+    if doctor_id:
+        claims["doctor_id"] = doctor_id
+    return claims
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create a signed JWT access token (short-lived - 1 hour by default)."""
     to_encode = data.copy()
@@ -77,12 +136,95 @@ def decode_token(token: str, token_type: str = "access") -> dict:
         )
 
 
+# ------------------------ Principal cache ------------------------
+
+
+class Principal:
+    """Cached identity of an authenticated user: the User plus, for doctors,
+    the Doctor profile id and manager flag (loaded on first use)."""
+
+    __slots__ = ("user", "doctor_id", "is_doctor_manager", "doctor_loaded", "expires_at")
+
+    def __init__(self, user: User, expires_at: float):
+        self.user = user
+        self.doctor_id: str | None = None
+        self.is_doctor_manager = False
+        self.doctor_loaded = False
+        self.expires_at = expires_at
+
+
+# user_id -> Principal, least recently used first
+_principals: "OrderedDict[str, Principal]" = OrderedDict()
+
+
+def invalidate_principal(user_id: OID | str | None) -> None:
+    """Drop the cached principal after the user or its Doctor profile changed."""
+    if user_id is not None:
+        _principals.pop(str(user_id), None)
+
+
+def clear_principal_cache() -> None:
+    _principals.clear()
+
+
+async def _load_principal(user_id: str) -> Principal | None:
+    now = time.monotonic()
+    principal = _principals.get(user_id)
+    if principal is not None and principal.expires_at > now:
+        _principals.move_to_end(user_id)
+        return principal
+    try:
+        user = await User.get(OID(user_id))
+    except Exception:
+        user = None
+    if not user:
+        _principals.pop(user_id, None)
+        return None
+    principal = Principal(user, now + settings.PRINCIPAL_CACHE_TTL_SECONDS)
+    _principals[user_id] = principal
+    _principals.move_to_end(user_id)
+    while len(_principals) > settings.PRINCIPAL_CACHE_MAX_ENTRIES:
+        _principals.popitem(last=False)
+    return principal
+
+
+async def _load_doctor_profile(principal: Principal) -> Principal:
+    if not principal.doctor_loaded:
+        from app.models.doctor import Doctor
+
+        doctor = await Doctor.find_one(Doctor.user_id == principal.user.id)
+        principal.doctor_id = str(doctor.id) if doctor else None
+        principal.is_doctor_manager = bool(getattr(doctor, "is_manager", False)) if doctor else False
+        principal.doctor_loaded = True
+    return principal
+
+
+async def get_current_doctor_id(user: User) -> str | None:
+    """Doctor profile id of a user (token claim or cached lookup)."""
+    principal = await _load_principal(str(user.id))
+    if principal is None:
+        return None
+    if principal.doctor_id is None:
+        await _load_doctor_profile(principal)
+    return principal.doctor_id
+
+
+async def get_doctor_profile(user: User) -> tuple[str | None, bool]:
+    """(doctor_id, is_manager) for a user, served from the principal cache."""
+    principal = await _load_principal(str(user.id))
+    if principal is None:
+        return None, False
+    await _load_doctor_profile(principal)
+    return principal.doctor_id, principal.is_doctor_manager
+
+
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
 ) -> User:
-    """Decode JWT access token and fetch current user from MongoDB.
-    Raises 401 if token invalid, expired, or user not found.
-    Only accepts access tokens, not refresh tokens.
+    """Decode JWT access token and resolve the current user.
+    The user comes from the in-process principal cache (TTL + LRU), so most
+    requests don't touch MongoDB. Raises 401 if token invalid, expired, or
+    user not found. Only accepts access tokens, not refresh tokens.
     """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -100,13 +242,13 @@ async def get_current_user(
     except Exception:
         raise credentials_exception
 
-    try:
-        user = await User.get(OID(user_id))
-    except Exception:
-        user = None
-    if not user:
+    principal = await _load_principal(user_id)
+    if principal is None:
         raise credentials_exception
-    return user
+    if not principal.doctor_loaded and payload.get("doctor_id"):
+        principal.doctor_id = payload["doctor_id"]
+    # A shallow copy so request handlers can't mutate the cached document.
+    return principal.user.model_copy()
 
 
 # ------------------------ RBAC helpers ------------------------
@@ -5,8 +5,8 @@ from beanie import PydanticObjectId as OID
 
 from app.constants import Role
 from app.models import User, Doctor, Patient
-from app.security import hash_password
-from app.utils.qrcode_gen import ensure_patient_qr
+from app.security import hash_password_async
+from app.utils.qrcode_gen import lazy_qr_url, new_qr_code
 
 
 async def create_staff_user(
@@ -32,7 +32,7 @@ async def create_staff_user(
         name=name,
         role=role,
         username=username,
-        password_hash=hash_password(password),
+        password_hash=await hash_password_async(password),
         imageUrl=imageUrl,
     )
     await user.insert()
@@ -56,16 +56,17 @@ async def create_patient_profile_for_user(
     relationship: Optional[str] = None,
 ) -> Patient:
     """Create a new medical profile under an existing login account (family member)."""
-    from os import urandom
-
     existing_count = await Patient.find(Patient.user_id == user_id).count()
     if existing_count == 0:
         is_primary = True
         if not relationship:
             relationship = "self"
 
-    tmp_qr = f"tmp-{urandom(8).hex()}"
+    # المعرف يُولَّد مسبقاً ليُبنى منه qr_code_data: إدخال واحد، والصورة تُولَّد عند أول طلب
+    patient_id = OID()
+    qr_code = new_qr_code(patient_id)
     patient = Patient(
+        id=patient_id,
         user_id=user_id,
         name=name,
         gender=gender,
@@ -73,12 +74,12 @@ async def create_patient_profile_for_user(
         city=city,
         is_primary=is_primary,
         relationship=relationship or ("self" if is_primary else "child"),
-        qr_code_data=tmp_qr,
+        qr_code_data=qr_code,
+        qr_image_path=lazy_qr_url(qr_code),
         visit_type=visit_type,
         consultation_type=consultation_type,
     )
     await patient.insert()
-    await ensure_patient_qr(patient)
     return patient
 
 
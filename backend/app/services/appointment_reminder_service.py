@@ -1,24 +1,54 @@
 """
-خدمة تذكير المواعيد — إشعارات تلقائية للمريض:
-- قبل الموعد بيوم واحد (9:00 صباحاً بتوقيت العراق)
-- في يوم الموعد (9:00 صباحاً بتوقيت العراق)
+خدمة تذكير المواعيد — إشعارات تلقائية للمريض في وقت محدد لكل موعد:
+- 3d: قبل الموعد بثلاثة أيام (9:00 صباحاً بتوقيت العراق)
+- 1d: قبل الموعد بيوم واحد (9:00 صباحاً بتوقيت العراق)
+- day: في يوم الموعد (9:00 صباحاً بتوقيت العراق)
+- 2h: قبل الموعد بساعتين
+الأنواع المفعّلة تُضبط عبر REMINDER_KINDS (الافتراضي: 1d,day).
+
+عند إنشاء الموعد أو تعديل وقته أو حالته تُحدَّث سجلاته في reminder_schedule،
+ثم يلتقط poller خفيف السجلات المستحقة فقط عبر find_one_and_update
+(بدل مسح كل مواعيد الأيام القادمة كل ساعة).
 """
 from __future__ import annotations
 
-from datetime import datetime, timezone, timedelta
+from datetime import datetime, time, timezone, timedelta
 from zoneinfo import ZoneInfo
 
 from beanie import PydanticObjectId as OID
-
-from app.models import Appointment, Patient, User, Doctor
-from app.services.notification_service import notify_user
+from beanie.operators import In
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.config import get_settings
+from app.models import Appointment, Patient, User, Doctor, ReminderSchedule
+from app.services.job_runner import WORKER_ID
+from app.services.notification_service import notify_users_bulk
 from app.utils.patient_out import resolve_patient_name
 from app.utils.logger import get_logger
 
 logger = get_logger("appointment_reminder")
+settings = get_settings()
 
 IRAQ_TZ = ZoneInfo("Asia/Baghdad")
 REMINDER_HOUR = 9  # 9:00 صباحاً بتوقيت بغداد
+# أقصى عدد إشعارات Push متزامنة أثناء دورة التذكير
+SEND_CONCURRENCY = 10
+# أقصى عدد سجلات يلتقطها الـ poller في الدورة الواحدة
+POLL_BATCH_SIZE = 200
+# سجل ملتقط لم يكتمل خلال هذه المدة (عامل توقف) يُعاد التقاطه
+CLAIM_TIMEOUT = timedelta(minutes=10)
+MAX_ATTEMPTS = 3
+# لا نرسل تذكيراً تأخر أكثر من هذا (مثلاً بعد توقف الخادم) حتى لا يصل "غداً" في يوم الموعد
+MAX_LATENESS = timedelta(hours=6)
+
+# reminder kind -> (appointment flag, title, when label)
+_REMINDER_KINDS: dict[str, tuple[str, str, str]] = {
+    "3d": ("remind_3d_sent", "تذكير موعد قريب", "بعد 3 أيام"),
+    "1d": ("remind_1d_sent", "تذكير موعد غداً", "غداً"),
+    "day": ("remind_day_sent", "تذكير موعد اليوم", "اليوم"),
+    "2h": ("remind_2h_sent", "تذكير موعد بعد ساعتين", "بعد ساعتين"),
+}
 
 
 def reset_appointment_reminder_flags(appointment: Appointment) -> None:
@@ -26,6 +56,17 @@ def reset_appointment_reminder_flags(appointment: Appointment) -> None:
     appointment.remind_1d_sent = False
     appointment.remind_day_sent = False
     appointment.remind_3d_sent = False
+    appointment.remind_2h_sent = False
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _as_utc(dt: datetime) -> datetime:
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
 
 
 def _to_iraq(dt: datetime) -> datetime:
@@ -34,101 +75,378 @@ def _to_iraq(dt: datetime) -> datetime:
     return dt.astimezone(IRAQ_TZ)
 
 
-def _iraq_now() -> datetime:
-    return datetime.now(IRAQ_TZ)
-
-
 def _format_when(dt: datetime) -> str:
     local = _to_iraq(dt)
     return local.strftime("%d-%m-%Y الساعة %I:%M %p")
 
 
-async def check_and_send_reminders() -> None:
-    """
-    يُستدعى كل ساعة عبر APScheduler.
-    الإرسال الفعلي يتم فقط الساعة 9:00 صباحاً بتوقيت العراق.
+def _at_reminder_hour(scheduled_at: datetime, days_before: int) -> datetime:
+    local_day = _to_iraq(scheduled_at).date() - timedelta(days=days_before)
+    return datetime.combine(
+        local_day, time(hour=REMINDER_HOUR), tzinfo=IRAQ_TZ
+    ).astimezone(timezone.utc)
+
+
+def reminder_due_at(kind: str, scheduled_at: datetime) -> datetime | None:
+    """UTC time at which the given reminder kind should go out.
+
+    None when that time is not before the appointment, e.g. the "day" reminder
+    (09:00) for an appointment earlier than 09:00: it is skipped, never sent late.
     """
+    scheduled_at = _as_utc(scheduled_at)
+    if kind == "3d":
+        due_at = _at_reminder_hour(scheduled_at, 3)
+    elif kind == "1d":
+        due_at = _at_reminder_hour(scheduled_at, 1)
+    elif kind == "day":
+        due_at = _at_reminder_hour(scheduled_at, 0)
+    elif kind == "2h":
+        due_at = scheduled_at - timedelta(hours=2)
+    else:
+        raise ValueError(f"Unknown reminder kind: {kind}")
+    return due_at if due_at < scheduled_at else None
+
+
+def _enabled_kinds() -> set[str]:
+    return {k for k in settings.reminder_kinds if k in _REMINDER_KINDS}
+
+
+def _schedule_ops(
+    appointment: Appointment, now: datetime
+) -> tuple[list[UpdateOne], list[str]]:
+    """Upserts for reminders still to send, plus kinds that must not fire."""
+    ops: list[UpdateOne] = []
+    stale_kinds: list[str] = []
+    enabled = _enabled_kinds()
+    scheduled_at = _as_utc(appointment.scheduled_at)
+
+    for kind, (flag, _, _) in _REMINDER_KINDS.items():
+        due_at = reminder_due_at(kind, scheduled_at)
+        if (
+            appointment.status != "pending"
+            or kind not in enabled
+            or getattr(appointment, flag, False)
+            or due_at is None
+            or due_at <= now
+        ):
+            stale_kinds.append(kind)
+            continue
+        ops.append(
+            UpdateOne(
+                # لا نلمس سجلاً قيد الإرسال الآن (claimed)
+                {"appointment_id": appointment.id, "kind": kind, "status": {"$ne": "claimed"}},
+                {
+                    "$set": {
+                        "due_at": due_at,
+                        "status": "pending",
+                        "claimed_by": None,
+                        "claimed_at": None,
+                        "attempts": 0,
+                        "updated_at": now,
+                    },
+                    "$unset": {"pending_due_at": ""},
+                    "$setOnInsert": {"created_at": now},
+                },
+                upsert=True,
+            )
+        )
+        # السجل ملتقط الآن: نحفظ الموعد الجديد ويطبّقه العامل عند تحريره (_release_claims)
+        ops.append(
+            UpdateOne(
+                {"appointment_id": appointment.id, "kind": kind, "status": "claimed"},
+                {"$set": {"pending_due_at": due_at, "updated_at": now}},
+            )
+        )
+    return ops, stale_kinds
+
+
+async def _bulk_upsert(ops: list[UpdateOne]) -> None:
     try:
-        now_iraq = _iraq_now()
-        if now_iraq.hour != REMINDER_HOUR:
-            return
-
-        today = now_iraq.date()
-        tomorrow = today + timedelta(days=1)
-
-        # مواعيد اليوم وغداً (مع هامش للتحويل الزمني)
-        window_start = datetime.combine(
-            today - timedelta(days=1),
-            datetime.min.time(),
-            tzinfo=IRAQ_TZ,
-        ).astimezone(timezone.utc)
-        window_end = datetime.combine(
-            tomorrow + timedelta(days=1),
-            datetime.max.time(),
-            tzinfo=IRAQ_TZ,
-        ).astimezone(timezone.utc)
-
-        upcoming = await Appointment.find(
-            Appointment.scheduled_at >= window_start,
-            Appointment.scheduled_at <= window_end,
-            Appointment.status == "pending",
-        ).to_list()
-
-        logger.info(
-            "Checking %s pending appointments for reminders (Iraq date=%s)",
-            len(upcoming),
-            today.isoformat(),
+        await ReminderSchedule.get_motor_collection().bulk_write(ops, ordered=False)
+    except BulkWriteError as exc:
+        # 11000: السجل ملتقط حالياً لدى عامل آخر فاصطدم الـ upsert بالفهرس الفريد؛
+        # الموعد الجديد سُجّل في pending_due_at بالعملية المرافقة
+        errors = [e for e in exc.details.get("writeErrors", []) if e.get("code") != 11000]
+        if errors:
+            raise
+
+
+async def cancel_appointment_reminders(appointment_id: OID) -> None:
+    """إلغاء كل التذكيرات المعلقة لموعد (حذف/إلغاء)."""
+    await ReminderSchedule.get_motor_collection().update_many(
+        {"appointment_id": appointment_id, "status": "pending"},
+        {"$set": {"status": "cancelled", "updated_at": _utcnow()}},
+    )
+
+
+async def schedule_appointment_reminders(appointment: Appointment) -> None:
+    """Bring the appointment's reminder_schedule entries in line with its current state."""
+    now = _utcnow()
+    ops, stale_kinds = _schedule_ops(appointment, now)
+    if stale_kinds:
+        await ReminderSchedule.get_motor_collection().update_many(
+            {
+                "appointment_id": appointment.id,
+                "kind": {"$in": stale_kinds},
+                "status": "pending",
+            },
+            {"$set": {"status": "cancelled", "updated_at": now}},
         )
+    if ops:
+        await _bulk_upsert(ops)
+
 
-        sent_count = 0
-        for appointment in upcoming:
-            try:
-                appt_local = _to_iraq(appointment.scheduled_at)
-                appt_date = appt_local.date()
-
-                if appt_date == tomorrow and not appointment.remind_1d_sent:
-                    if await _send_1d_reminder(appointment):
-                        sent_count += 1
-
-                if appt_date == today and not appointment.remind_day_sent:
-                    if await _send_day_reminder(appointment):
-                        sent_count += 1
-            except Exception as exc:
-                logger.error("Error processing appointment %s: %s", appointment.id, exc)
-
-        if sent_count:
-            logger.info("Sent %s appointment reminder(s)", sent_count)
-        else:
-            logger.info("No appointment reminders to send at this time")
+async def sync_appointment_reminders(appointment: Appointment) -> None:
+    """Hook for appointment create/update paths — never fails the caller."""
+    try:
+        await schedule_appointment_reminders(appointment)
     except Exception as exc:
-        logger.error("Error in check_and_send_reminders: %s", exc)
+        logger.error("Failed to schedule reminders for appointment %s: %s", appointment.id, exc)
+
+
+async def backfill_reminder_schedule() -> int:
+    """Create schedule entries for pending future appointments (idempotent)."""
+    now = _utcnow()
+    ops: list[UpdateOne] = []
+    total = 0
+    async for appointment in Appointment.find(
+        Appointment.status == "pending",
+        Appointment.scheduled_at > now,
+    ):
+        appointment_ops, _ = _schedule_ops(appointment, now)
+        ops.extend(appointment_ops)
+        total += len(appointment_ops) // 2  # upsert + pending_due_at لكل نوع
+        if len(ops) >= 1000:
+            await _bulk_upsert(ops)
+            ops = []
+    if ops:
+        await _bulk_upsert(ops)
+    logger.info("Reminder schedule backfill: %s entries upserted", total)
+    return total
+
+
+async def _claim_next_due(now: datetime) -> dict | None:
+    return await ReminderSchedule.get_motor_collection().find_one_and_update(
+        {
+            "$or": [
+                {"status": "pending", "due_at": {"$lte": now}},
+                {
+                    "status": "claimed",
+                    "claimed_at": {"$lte": now - CLAIM_TIMEOUT},
+                    "attempts": {"$lt": MAX_ATTEMPTS},
+                },
+            ]
+        },
+        {
+            "$set": {
+                "status": "claimed",
+                "claimed_by": WORKER_ID,
+                "claimed_at": now,
+                "updated_at": now,
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("due_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
 
 
-async def _doctor_display_name(doctor_id: OID | str) -> str | None:
-    try:
-        doctor = await Doctor.get(OID(str(doctor_id)))
-        if not doctor or not doctor.user_id:
-            return None
-        user = await User.get(doctor.user_id)
-        if user and user.name:
-            name = user.name.strip()
-            return name if name.startswith("د.") else f"د. {name}"
-    except Exception:
-        pass
+async def _release_claims(query: dict, status: str, now: datetime, **fields) -> int:
+    """تحرير سجلات ملتقطة إلى `status`.
+
+    إن عُدّل وقت الموعد أثناء الالتقاط (pending_due_at) يعود السجل pending
+    بالوقت الجديد بدل ذلك، في نفس التحديث الذري.
+    """
+    rescheduled = {"$gt": ["$pending_due_at", None]}
+    result = await ReminderSchedule.get_motor_collection().update_many(
+        query,
+        [
+            {
+                "$set": {
+                    **{
+                        name: {"$cond": [rescheduled, f"${name}", {"$literal": value}]}
+                        for name, value in fields.items()
+                    },
+                    "status": {"$cond": [rescheduled, "pending", status]},
+                    "due_at": {"$ifNull": ["$pending_due_at", "$due_at"]},
+                    "claimed_by": {"$cond": [rescheduled, None, "$claimed_by"]},
+                    "claimed_at": {"$cond": [rescheduled, None, "$claimed_at"]},
+                    "attempts": {"$cond": [rescheduled, 0, "$attempts"]},
+                    "updated_at": now,
+                }
+            },
+            {"$unset": "pending_due_at"},
+        ],
+    )
+    return result.modified_count
+
+
+async def _fail_exhausted_claims(now: datetime) -> int:
+    """سجلات ملتقطة انتهت مهلتها بعد MAX_ATTEMPTS محاولات: تُعلَّم failed.
+
+    بدون ذلك تبقى claimed إلى الأبد ولا يعيد ضبطها تعديل الموعد (الـ upsert
+    يتجاهل السجلات الملتقطة).
+    """
+    released = await _release_claims(
+        {
+            "status": "claimed",
+            "claimed_at": {"$lte": now - CLAIM_TIMEOUT},
+            "attempts": {"$gte": MAX_ATTEMPTS},
+        },
+        "failed",
+        now,
+    )
+    if released:
+        logger.warning(
+            "Released %s appointment reminder(s) stuck after %s attempts",
+            released,
+            MAX_ATTEMPTS,
+        )
+    return released
+
+
+async def process_due_reminders() -> int:
+    """
+    يُستدعى دورياً (كل REMINDER_POLL_SECONDS) عبر APScheduler.
+    يلتقط التذكيرات المستحقة فقط ويرسلها دفعة واحدة.
+    """
+    now = _utcnow()
+    await _fail_exhausted_claims(now)
+    claimed: list[dict] = []
+    while len(claimed) < POLL_BATCH_SIZE:
+        entry = await _claim_next_due(now)
+        if not entry:
+            break
+        claimed.append(entry)
+    if not claimed:
+        return 0
+
+    appointment_ids = list({entry["appointment_id"] for entry in claimed})
+    appointments = {
+        a.id: a
+        for a in await Appointment.find(In(Appointment.id, appointment_ids)).to_list()
+    }
+
+    due: list[tuple[Appointment, str]] = []
+    due_entry_ids: list = []
+    dropped_entry_ids: list = []
+    requeue: list[UpdateOne] = []
+    for entry in claimed:
+        appointment = appointments.get(entry["appointment_id"])
+        kind = entry.get("kind")
+        flag = _REMINDER_KINDS[kind][0] if kind in _REMINDER_KINDS else None
+        if (
+            appointment is None
+            or flag is None
+            or appointment.status != "pending"
+            or getattr(appointment, flag, False)
+            or _as_utc(appointment.scheduled_at) <= now
+            or _as_utc(entry["due_at"]) < now - MAX_LATENESS
+        ):
+            dropped_entry_ids.append(entry["_id"])
+            continue
+        # الموعد تغيّر بعد جدولة السجل (مثلاً أثناء التقاط سابق): لا نرسل بالوقت القديم
+        expected = reminder_due_at(kind, appointment.scheduled_at)
+        if expected is None or abs(expected - _as_utc(entry["due_at"])) > timedelta(seconds=1):
+            if expected is None or expected <= now:
+                dropped_entry_ids.append(entry["_id"])
+            else:
+                requeue.append(
+                    UpdateOne(
+                        {"_id": entry["_id"], "claimed_by": WORKER_ID},
+                        {
+                            "$set": {
+                                "status": "pending",
+                                "due_at": expected,
+                                "claimed_by": None,
+                                "claimed_at": None,
+                                "attempts": 0,
+                                "updated_at": now,
+                            },
+                            "$unset": {"pending_due_at": ""},
+                        },
+                    )
+                )
+            continue
+        due.append((appointment, kind))
+        due_entry_ids.append(entry["_id"])
+
+    if requeue:
+        await ReminderSchedule.get_motor_collection().bulk_write(requeue, ordered=False)
+    if dropped_entry_ids:
+        await _release_claims(
+            {"_id": {"$in": dropped_entry_ids}, "claimed_by": WORKER_ID}, "cancelled", now
+        )
+
+    sent_count = await _send_reminders(due) if due else 0
+
+    if due_entry_ids:
+        await _release_claims(
+            {"_id": {"$in": due_entry_ids}, "claimed_by": WORKER_ID},
+            "sent",
+            _utcnow(),
+            sent_at=_utcnow(),
+        )
+    if sent_count:
+        logger.info("Sent %s appointment reminder(s)", sent_count)
+    return sent_count
+
+
+class _ReminderContext:
+    """Patients, users and doctor names prefetched for one reminder run."""
+
+    def __init__(
+        self,
+        patients: dict[OID, Patient],
+        users: dict[OID, User],
+        doctor_names: dict[OID, str],
+    ) -> None:
+        self.patients = patients
+        self.users = users
+        self.doctor_names = doctor_names
+
+
+async def _load_reminder_context(appointments: list[Appointment]) -> _ReminderContext:
+    """Fetch everything needed to build reminder bodies in four queries."""
+    patient_ids = list({a.patient_id for a in appointments})
+    doctor_ids = list({a.doctor_id for a in appointments})
+
+    patients = await Patient.find(In(Patient.id, patient_ids)).to_list() if patient_ids else []
+    doctors = await Doctor.find(In(Doctor.id, doctor_ids)).to_list() if doctor_ids else []
+
+    user_ids = {p.user_id for p in patients if p.user_id}
+    user_ids.update(d.user_id for d in doctors if d.user_id)
+    users = await User.find(In(User.id, list(user_ids))).to_list() if user_ids else []
+    user_map = {u.id: u for u in users}
+
+    doctor_names: dict[OID, str] = {}
+    for doctor in doctors:
+        name = _doctor_display_name(user_map.get(doctor.user_id))
+        if name:
+            doctor_names[doctor.id] = name
+
+    return _ReminderContext(
+        patients={p.id: p for p in patients},
+        users=user_map,
+        doctor_names=doctor_names,
+    )
+
+
+def _doctor_display_name(user: User | None) -> str | None:
+    if user and user.name:
+        name = user.name.strip()
+        return name if name.startswith("د.") else f"د. {name}"
     return None
 
 
-async def _build_reminder_body(
+def _build_reminder_body(
     *,
-    patient: Patient,
+    patient_name: str | None,
+    doctor_name: str | None,
     when_label: str,
     scheduled_at: datetime,
-    doctor_id: OID | str,
 ) -> str:
-    user = await User.get(patient.user_id)
-    patient_name = resolve_patient_name(patient, user)
     when = _format_when(scheduled_at)
-    doctor_name = await _doctor_display_name(doctor_id)
 
     if patient_name and doctor_name:
         return f"تذكير: موعد {patient_name} {when_label} ({when}) مع {doctor_name}"
@@ -139,77 +457,58 @@ async def _build_reminder_body(
     return f"تذكير: لديك موعد {when_label} ({when})"
 
 
-async def _send_1d_reminder(appointment: Appointment) -> bool:
-    """إشعار قبل الموعد بيوم واحد."""
-    try:
-        patient = await Patient.get(appointment.patient_id)
-        if not patient:
-            logger.warning("Patient not found for appointment %s", appointment.id)
-            return False
+async def _send_reminders(due: list[tuple[Appointment, str]]) -> int:
+    """Send the given (appointment, kind) reminders and mark them as sent."""
+    ctx = await _load_reminder_context([appointment for appointment, _ in due])
 
-        body = await _build_reminder_body(
-            patient=patient,
-            when_label="غداً",
-            scheduled_at=appointment.scheduled_at,
-            doctor_id=appointment.doctor_id,
-        )
-
-        await notify_user(
-            user_id=patient.user_id,
-            title="تذكير موعد غداً",
-            body=body,
-            type="appointment_reminder",
-            patient_id=str(patient.id),
-            data={
-                "appointmentId": str(appointment.id),
-                "reminder": "1d",
-                "patientId": str(patient.id),
-                "doctorId": str(appointment.doctor_id),
-            },
-        )
-
-        appointment.remind_1d_sent = True
-        await appointment.save()
-        logger.info("Sent 1-day reminder for appointment %s", appointment.id)
-        return True
-    except Exception as exc:
-        logger.error("Error sending 1-day reminder: %s", exc)
-        return False
-
-
-async def _send_day_reminder(appointment: Appointment) -> bool:
-    """إشعار في يوم الموعد."""
-    try:
-        patient = await Patient.get(appointment.patient_id)
+    items: list[dict] = []
+    sent: list[tuple[Appointment, str]] = []
+    for appointment, kind in due:
+        patient = ctx.patients.get(appointment.patient_id)
         if not patient:
             logger.warning("Patient not found for appointment %s", appointment.id)
-            return False
-
-        body = await _build_reminder_body(
-            patient=patient,
-            when_label="اليوم",
+            continue
+        _, title, when_label = _REMINDER_KINDS[kind]
+        body = _build_reminder_body(
+            patient_name=resolve_patient_name(patient, ctx.users.get(patient.user_id)),
+            doctor_name=ctx.doctor_names.get(appointment.doctor_id),
+            when_label=when_label,
             scheduled_at=appointment.scheduled_at,
-            doctor_id=appointment.doctor_id,
         )
-
-        await notify_user(
-            user_id=patient.user_id,
-            title="تذكير موعد اليوم",
-            body=body,
-            type="appointment_reminder",
-            patient_id=str(patient.id),
-            data={
-                "appointmentId": str(appointment.id),
-                "reminder": "day",
-                "patientId": str(patient.id),
-                "doctorId": str(appointment.doctor_id),
-            },
+        items.append(
+            {
+                "user_id": patient.user_id,
+                "title": title,
+                "body": body,
+                "type": "appointment_reminder",
+                "patient_id": str(patient.id),
+                "data": {
+                    "appointmentId": str(appointment.id),
+                    "reminder": kind,
+                    "patientId": str(patient.id),
+                    "doctorId": str(appointment.doctor_id),
+                },
+            }
         )
-
-        appointment.remind_day_sent = True
-        await appointment.save()
-        logger.info("Sent same-day reminder for appointment %s", appointment.id)
-        return True
-    except Exception as exc:
-        logger.error("Error sending same-day reminder: %s", exc)
-        return False
+        sent.append((appointment, kind))
+
+    if not items:
+        return 0
+
+    await notify_users_bulk(items, concurrency=SEND_CONCURRENCY)
+
+    flags: dict[OID, dict[str, bool]] = {}
+    scheduled: dict[OID, datetime] = {}
+    for appointment, kind in sent:
+        flag_field = _REMINDER_KINDS[kind][0]
+        flags.setdefault(appointment.id, {})[flag_field] = True
+        scheduled[appointment.id] = appointment.scheduled_at
+    # إن عُدّل الموعد أثناء الإرسال لا نعلّم تذكير الوقت الجديد كمُرسل
+    await Appointment.get_motor_collection().bulk_write(
+        [
+            UpdateOne({"_id": appt_id, "scheduled_at": scheduled[appt_id]}, {"$set": fields})
+            for appt_id, fields in flags.items()
+        ],
+        ordered=False,
+    )
+    return len(sent)
@@ -1,8 +1,13 @@
 from fastapi import HTTPException
 
 from app.constants import Role
-from app.models import User
-from app.security import create_access_token, create_refresh_token, verify_password
+from app.models import Doctor, User
+from app.security import (
+    create_access_token,
+    create_refresh_token,
+    token_claims,
+    verify_and_update_password,
+)
 from app.services.otp_service import (
     create_otp_request,
     normalize_iraqi_phone,
@@ -10,6 +15,15 @@ from app.services.otp_service import (
 )
 from app.services.otpiq import OTPIQError, send_verification_otp
 
+async def _staff_token_claims(user: User) -> dict:
+    """token_claims مع doctor_id للأطباء حتى لا يبحث get_current_user عن ملف الطبيب."""
+    doctor_id = None
+    if user.role == Role.DOCTOR:
+        doctor = await Doctor.find_one(Doctor.user_id == user.id)
+        doctor_id = str(doctor.id) if doctor else None
+    return token_claims(user, doctor_id=doctor_id)
+
+
 async def request_otp(phone: str) -> None:
     """إنشاء وإرسال رمز OTP للهاتف (يحفظ آخر طلب)."""
     code, otp = await create_otp_request(phone=phone)
@@ -48,11 +62,7 @@ async def verify_otp_and_login(
         return None, None
 
     # إنشاء access_token و refresh_token
-    token_data = {
-        "sub": str(user.id),
-        "role": user.role,
-        "phone": user.phone,
-    }
+    token_data = token_claims(user)
     access_token = create_access_token(token_data)
     refresh_token = create_refresh_token(token_data)
     
@@ -92,23 +102,25 @@ async def staff_login_with_password(*, username: str, password: str) -> tuple[tu
     print(f"   ✅ Role is valid for staff login")
     print(f"   🔍 Verifying password...")
     
-    password_valid = verify_password(password, user.password_hash)
+    password_valid, new_hash = await verify_and_update_password(password, user.password_hash)
     print(f"   🔐 Password verification result: {password_valid}")
     
     if not password_valid:
         print(f"   ❌ Password verification failed")
         raise HTTPException(status_code=400, detail="Invalid credentials")
     
+    if new_hash:
+        # إعدادات bcrypt تغيّرت: نحدّث الـ hash بشكل شفاف
+        await User.get_motor_collection().update_one(
+            {"_id": user.id}, {"$set": {"password_hash": new_hash}}
+        )
+        user.password_hash = new_hash
+    
     print(f"   ✅ Password verified successfully")
     print(f"   🎫 Creating access token and refresh token...")
     
     # إنشاء access_token و refresh_token
-    token_data = {
-        "sub": str(user.id),
-        "role": user.role,
-        "phone": user.phone,
-        "username": user.username,
-    }
+    token_data = await _staff_token_claims(user)
     access_token = create_access_token(token_data)
     refresh_token = create_refresh_token(token_data)
     print(f"   ✅ Tokens created successfully")
@@ -138,13 +150,7 @@ async def refresh_access_token(refresh_token: str) -> tuple[str, str]:
             raise HTTPException(status_code=401, detail="User not found")
         
         # إنشاء tokens جديدة
-        token_data = {
-            "sub": str(user.id),
-            "role": user.role,
-            "phone": user.phone,
-        }
-        if user.username:
-            token_data["username"] = user.username
+        token_data = await _staff_token_claims(user)
         
         new_access_token = create_access_token(token_data)
         new_refresh_token = create_refresh_token(token_data)
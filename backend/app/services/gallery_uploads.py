@@ -0,0 +1,171 @@
+"""Batch gallery uploads: a whole photo session in one request.
+
+The patient (and its folder name) is resolved once. Files are then staged and
+stored GALLERY_BATCH_UPLOAD_CONCURRENCY at a time, and the shared upload pool
+bounds the actual storage writes. All new GalleryImage records are written
+with a single insert_many.
+
+Every file gets its own result. A failed file (wrong type, too large, storage
+error) does not fail the others. A file whose idempotency key was already used
+returns the existing record without being uploaded again, so a client can
+retry the whole batch after a timeout.
+"""
+
+import asyncio
+from datetime import datetime, timezone
+from typing import List, Optional, Sequence
+
+from beanie import PydanticObjectId as OID
+from beanie.operators import In
+from fastapi import HTTPException, UploadFile
+
+from app.config import get_settings
+from app.constants import Role
+from app.models import GalleryImage, Patient, User
+from app.schemas import GalleryBatchItemOut, GalleryBatchOut, GalleryOut
+from app.services import patient_service
+from app.services.image_variants import variant_fields
+from app.utils.logger import get_logger
+from app.utils.patient_out import resolve_patient_name
+from app.utils.r2_clinic import upload_clinic_file
+from app.utils.uploads import normalize_content_type
+
+settings = get_settings()
+logger = get_logger("gallery_uploads")
+
+
+def gallery_out(gi: GalleryImage) -> GalleryOut:
+    return GalleryOut(
+        id=str(gi.id),
+        patient_id=str(gi.patient_id),
+        image_path=gi.image_path,
+        **variant_fields(gi),
+        note=gi.note,
+        created_at=gi.created_at.isoformat() if gi.created_at else datetime.now(timezone.utc).isoformat(),
+    )
+
+
+def _normalize_keys(keys: Optional[Sequence[str]], count: int) -> List[Optional[str]]:
+    if not keys:
+        return [None] * count
+    if len(keys) != count:
+        raise HTTPException(status_code=400, detail="idempotency_keys must have one entry per image")
+    normalized = [(k or "").strip() or None for k in keys]
+    present = [k for k in normalized if k]
+    if len(set(present)) != len(present):
+        raise HTTPException(status_code=400, detail="Duplicate idempotency key in batch")
+    return normalized
+
+
+async def upload_gallery_batch(
+    *,
+    patient_id: str,
+    images: List[UploadFile],
+    uploaded_by_user_id: str,
+    allowed_types: Sequence[str],
+    uploaded_by_role: Optional[Role] = None,
+    idempotency_keys: Optional[Sequence[str]] = None,
+    note: Optional[str] = None,
+    doctor_id: Optional[str] = None,
+) -> GalleryBatchOut:
+    """Upload `images` to the patient's gallery and return one result per file (same order)."""
+    if not images:
+        raise HTTPException(status_code=400, detail="No images")
+    if len(images) > settings.GALLERY_BATCH_MAX_FILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.GALLERY_BATCH_MAX_FILES} images per batch",
+        )
+    keys = _normalize_keys(idempotency_keys, len(images))
+
+    try:
+        patient = await Patient.get(OID(patient_id))
+    except Exception:
+        patient = None
+    if not patient:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    user = await User.get(patient.user_id) if patient.user_id else None
+    name_hint = resolve_patient_name(patient, user)
+
+    results: List[Optional[GalleryBatchItemOut]] = [None] * len(images)
+
+    # المفاتيح المستخدمة مسبقاً: لا نرفع الملف مرة أخرى
+    used = [k for k in keys if k]
+    if used:
+        for gi in await GalleryImage.find(In(GalleryImage.client_operation_id, used)).to_list():
+            i = keys.index(gi.client_operation_id)
+            if gi.patient_id != patient.id:
+                results[i] = GalleryBatchItemOut(
+                    index=i,
+                    filename=images[i].filename,
+                    idempotency_key=keys[i],
+                    status="failed",
+                    error="Idempotency key already used for another patient",
+                )
+                continue
+            results[i] = GalleryBatchItemOut(
+                index=i,
+                filename=images[i].filename,
+                idempotency_key=keys[i],
+                status="existing",
+                image=gallery_out(gi),
+            )
+
+    semaphore = asyncio.Semaphore(settings.GALLERY_BATCH_UPLOAD_CONCURRENCY)
+    uploaded: dict[int, str] = {}
+
+    async def store(i: int, image: UploadFile) -> None:
+        content_type = normalize_content_type(image.content_type)
+        if content_type not in allowed_types:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unsupported file type. Allowed types: {', '.join(allowed_types)}",
+            )
+        async with semaphore:
+            uploaded[i] = await upload_clinic_file(
+                patient_id=patient_id,
+                folder="gallery",
+                upload=image,
+                content_type=content_type,
+                name_hint=name_hint,
+            )
+
+    pending = [i for i in range(len(images)) if results[i] is None]
+    outcomes = await asyncio.gather(*(store(i, images[i]) for i in pending), return_exceptions=True)
+    for i, outcome in zip(pending, outcomes):
+        if isinstance(outcome, BaseException):
+            if not isinstance(outcome, HTTPException):
+                logger.error("Gallery batch upload failed for patient %s (%s): %s", patient_id, images[i].filename, outcome)
+            results[i] = GalleryBatchItemOut(
+                index=i,
+                filename=images[i].filename,
+                idempotency_key=keys[i],
+                status="failed",
+                error=outcome.detail if isinstance(outcome, HTTPException) else "Upload failed",
+            )
+
+    order = sorted(uploaded)
+    if order:
+        records = await patient_service.create_gallery_images(
+            patient_id=patient_id,
+            uploaded_by_user_id=uploaded_by_user_id,
+            items=[(uploaded[i], note, keys[i]) for i in order],
+            doctor_id=doctor_id,
+            uploaded_by_role=uploaded_by_role,
+        )
+        for i, (gi, created) in zip(order, records):
+            results[i] = GalleryBatchItemOut(
+                index=i,
+                filename=images[i].filename,
+                idempotency_key=keys[i],
+                status="created" if created else "existing",
+                image=gallery_out(gi),
+            )
+
+    return GalleryBatchOut(
+        patient_id=patient_id,
+        created=sum(1 for r in results if r.status == "created"),
+        existing=sum(1 for r in results if r.status == "existing"),
+        failed=sum(1 for r in results if r.status == "failed"),
+        results=results,
+    )
@@ -0,0 +1,163 @@
+"""Thumbnail/medium/display variants for uploaded clinic photos.
+
+After an upload is recorded (gallery image, treatment note, appointment) the
+original is decoded once on a process pool (Pillow is CPU-bound and holds the
+GIL), downscaled to IMAGE_THUMB_PX / IMAGE_MEDIUM_PX, re-encoded as WebP/JPEG
+without EXIF, and stored next to the original under .../variants/. HEIC and
+very large JPEG originals also get a full-size "display" re-encode.
+
+The work runs as a background task so the upload request returns as soon as
+the original is stored; the variant URLs are $push-ed onto the record's
+`image_variants` when ready. List endpoints expose them through
+`variant_fields`, falling back to the original until they exist.
+"""
+
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Iterable, Optional, Type
+
+from beanie import Document
+from beanie import PydanticObjectId as OID
+
+from app.config import get_settings
+from app.models.media import ImageVariants
+from app.services.media_storage import fetch_object, key_from_url, local_path, store_object
+from app.utils.image_ops import init_worker, render_variants
+from app.utils.logger import get_logger
+
+settings = get_settings()
+logger = get_logger("image_variants")
+
+_MB = 1024 * 1024
+
+_pool: ProcessPoolExecutor | None = None
+# مراجع للمهام الخلفية حتى لا يجمعها الـ GC قبل انتهائها
+_pending: set[asyncio.Task] = set()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: لا نورّث threads/sockets الـ event loop إلى العمليات الفرعية
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.IMAGE_PROCESS_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+        )
+    return _pool
+
+
+def _variant_format() -> tuple[str, str, str]:
+    """(format for Pillow, file extension, content type)."""
+    if settings.IMAGE_VARIANT_FORMAT.lower() in ("jpg", "jpeg"):
+        return "jpeg", "jpg", "image/jpeg"
+    return "webp", "webp", "image/webp"
+
+
+def _variant_key(key: str, name: str, ext: str) -> str:
+    folder, _, file_name = key.rpartition("/")
+    stem = file_name.rsplit(".", 1)[0]
+    return f"{folder}/variants/{stem}_{name}.{ext}"
+
+
+async def build_variants(url: str) -> Optional[ImageVariants]:
+    """Render and store the variants of one original; None if it is not our object."""
+    key = key_from_url(url)
+    if not key:
+        return None
+    path = local_path(key)
+    # الملف المحلي يُقرأ داخل العملية الفرعية مباشرة؛ من R2 نجلب البايتات أولاً
+    source = str(path) if path is not None else await fetch_object(key)
+
+    fmt, ext, content_type = _variant_format()
+    loop = asyncio.get_running_loop()
+    rendered = await loop.run_in_executor(
+        _get_pool(),
+        partial(
+            render_variants,
+            source,
+            {"thumb": settings.IMAGE_THUMB_PX, "medium": settings.IMAGE_MEDIUM_PX},
+            fmt=fmt,
+            quality=settings.IMAGE_VARIANT_QUALITY,
+            display_px=settings.IMAGE_DISPLAY_PX,
+            transcode_over_bytes=int(settings.IMAGE_TRANSCODE_OVER_MB * _MB),
+        ),
+    )
+    urls = {}
+    for name, data in rendered.items():
+        urls[name] = await store_object(_variant_key(key, name, ext), data, content_type, len(data))
+    return ImageVariants(original=url, **urls)
+
+
+async def attach_variants(model: Type[Document], doc_id: OID, urls: Iterable[str]) -> int:
+    """Build variants for the given originals that the record does not have yet."""
+    doc = await model.get(doc_id)
+    if doc is None:
+        return 0
+    done = {v.original for v in (getattr(doc, "image_variants", None) or [])}
+    attached = 0
+    for url in urls:
+        if not url or url in done:
+            continue
+        try:
+            variants = await build_variants(url)
+        except Exception as exc:
+            logger.warning("Could not build variants for %s: %s", url, exc)
+            continue
+        if variants is None:
+            continue
+        await model.get_motor_collection().update_one(
+            {"_id": doc_id, "image_variants.original": {"$ne": url}},
+            {"$push": {"image_variants": variants.model_dump()}},
+        )
+        done.add(url)
+        attached += 1
+    return attached
+
+
+async def _attach_quietly(model: Type[Document], doc_id: OID, urls: list[str]) -> None:
+    try:
+        await attach_variants(model, doc_id, urls)
+    except Exception as exc:
+        logger.warning("Variant generation failed for %s %s: %s", model.__name__, doc_id, exc)
+
+
+def schedule_variants(model: Type[Document], doc_id: OID, urls: Iterable[Optional[str]]) -> None:
+    """Generate variants in the background (the request does not wait)."""
+    urls = [u for u in urls if u]
+    if not urls:
+        return
+    task = asyncio.create_task(_attach_quietly(model, doc_id, urls))
+    _pending.add(task)
+    task.add_done_callback(_pending.discard)
+
+
+def variant_fields(doc) -> dict:
+    """
+    image_variants / thumb_path / medium_path for the *Out schemas.
+    Only variants of the record's current images, in image order; thumb/medium
+    fall back to None so clients keep using image_path until they are ready.
+    """
+    paths = list(getattr(doc, "image_paths", None) or [])
+    if not paths and getattr(doc, "image_path", None):
+        paths = [doc.image_path]
+    by_original = {v.original: v for v in (getattr(doc, "image_variants", None) or [])}
+    variants = [by_original[p].model_dump() for p in paths if p in by_original]
+    first = by_original.get(paths[0]) if paths else None
+    return {
+        "image_variants": variants,
+        "thumb_path": first.thumb if first else None,
+        "medium_path": first.medium if first else None,
+    }
+
+
+def shutdown_image_variants() -> None:
+    """Stop the process pool (called from app shutdown)."""
+    global _pool
+    for task in list(_pending):
+        task.cancel()
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
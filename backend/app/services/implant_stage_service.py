@@ -6,6 +6,10 @@ from beanie.operators import Or
 from fastapi import HTTPException
 
 from app.models import ImplantStage, Appointment, Patient, DoctorWorkingHours
+from app.services.appointment_reminder_service import (
+    reset_appointment_reminder_flags,
+    sync_appointment_reminders,
+)
 
 # المراحل الثابتة لزراعة الأسنان
 IMPLANT_STAGES = [
@@ -82,6 +86,8 @@ async def _get_or_create_stage_appointment(
         )
 
     if candidate:
+        if candidate.scheduled_at != scheduled_at:
+            reset_appointment_reminder_flags(candidate)
         candidate.previous_scheduled_at = candidate.scheduled_at
         candidate.scheduled_at = scheduled_at
         candidate.updated_at = now
@@ -89,6 +95,7 @@ async def _get_or_create_stage_appointment(
         if candidate.status == "completed":
             candidate.status = "pending"
         await candidate.save()
+        await sync_appointment_reminders(candidate)
         if stage.appointment_id != candidate.id:
             stage.appointment_id = candidate.id
             stage.updated_at = now
@@ -107,6 +114,7 @@ async def _get_or_create_stage_appointment(
         updated_at=now,
     )
     await candidate.insert()
+    await sync_appointment_reminders(candidate)
     stage.appointment_id = candidate.id
     stage.updated_at = now
     await stage.save()
@@ -179,6 +187,7 @@ async def initialize_implant_stages(
         updated_at=now,
     )
     await appointment.insert()
+    await sync_appointment_reminders(appointment)
 
     # إنشاء ImplantStage للمرحلة الأولى فقط (مرتبطة بالطبيب الحالي)
     stage = ImplantStage(
@@ -197,15 +206,19 @@ async def initialize_implant_stages(
 async def get_implant_stages(
     patient_id: str,
     doctor_id: Optional[str] = None,
+    *,
+    patient: Optional[Patient] = None,
 ) -> List[ImplantStage]:
     """جلب مراحل زراعة الأسنان للمريض.
 
     - في حالة الطبيب: نعيد فقط المراحل المرتبطة بهذا الطبيب.
       مع ترقية السجلات القديمة (بدون doctor_id) لتُنسب للطبيب الذي يستخدمها أولاً.
     - في حالة المريض أو الاستقبال: نعيد جميع المراحل للمريض بغض النظر عن الطبيب.
+    - patient: مستند المريض إن كان محمّلاً مسبقاً (يوفّر استعلاماً).
     """
 
-    patient = await Patient.get(OID(patient_id))
+    if patient is None:
+        patient = await Patient.get(OID(patient_id))
     if not patient:
         raise HTTPException(status_code=404, detail="Patient not found")
 
@@ -489,6 +502,7 @@ async def complete_stage(
             appointment.status = "completed"
             appointment.updated_at = datetime.now(timezone.utc)
             await appointment.save()
+            await sync_appointment_reminders(appointment)
 
     # إنشاء / تحديث المرحلة التالية تلقائياً بناءً على موعد هذه المرحلة
     try:
@@ -621,6 +635,7 @@ async def uncomplete_stage(
             appointment.status = "pending"
             appointment.updated_at = datetime.now(timezone.utc)
             await appointment.save()
+            await sync_appointment_reminders(appointment)
 
     # إعادة حساب الموعد التلقائي للمرحلة التالية حسب النظام الحالي
     try:
@@ -664,6 +679,7 @@ async def uncomplete_stage(
                     next_appt.status = "pending"
                     next_appt.updated_at = datetime.now(timezone.utc)
                     await next_appt.save()
+                    await sync_appointment_reminders(next_appt)
     except ValueError:
         # إذا لم تكن المرحلة في القائمة، لا نعيد حساب المرحلة التالية
         pass
@@ -0,0 +1,187 @@
+"""
+تشغيل المهام الدورية مرة واحدة فقط عبر كل العمّال (uvicorn workers / replicas).
+
+كل عملية تشغّل APScheduler خاصاً بها، لذلك تُغلَّف كل مهمة بـ leased_job:
+- قبل التنفيذ يحاول العامل أخذ قفل في مجموعة job_leases (find_one_and_update ذري).
+- أثناء التنفيذ يجدّد العامل القفل دورياً (heartbeat) حتى لا ينتهي أثناء مهمة طويلة.
+- إن مات العامل ينتهي القفل تلقائياً بعد TTL ويستطيع عامل آخر أخذه.
+- min_interval يمنع عاملاً آخر من إعادة التشغيل لنفس الموعد بعد تحرير القفل مباشرة.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from app.models import JobLease
+from app.utils.logger import get_logger
+
+logger = get_logger("job_runner")
+
+# معرّف فريد لهذه العملية (host:pid:random)
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+DEFAULT_LEASE_TTL = timedelta(minutes=5)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+async def _try_acquire(
+    name: str,
+    *,
+    ttl: timedelta,
+    min_interval: timedelta | None,
+    run_once: bool = False,
+) -> bool:
+    """Take the lease for `name` if it is free/expired. Returns True on success."""
+    now = _utcnow()
+    conditions: list[dict] = [
+        {"$or": [{"owner": None}, {"lease_expires_at": {"$lte": now}}]},
+    ]
+    if run_once:
+        # ترحيلات لمرة واحدة: تُعاد فقط إن لم تنجح من قبل
+        conditions.append({"last_outcome": {"$ne": "success"}})
+    if min_interval:
+        conditions.append(
+            {
+                "$or": [
+                    {"last_started_at": None},
+                    {"last_started_at": {"$lte": now - min_interval}},
+                ]
+            }
+        )
+
+    try:
+        doc = await JobLease.get_motor_collection().find_one_and_update(
+            {"name": name, "$and": conditions},
+            {
+                "$set": {
+                    "owner": WORKER_ID,
+                    "lease_expires_at": now + ttl,
+                    "heartbeat_at": now,
+                    "last_started_at": now,
+                    "last_owner": WORKER_ID,
+                },
+                "$setOnInsert": {"created_at": now, "run_count": 0},
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        # السجل موجود لكن القفل محجوز (أو شُغّلت المهمة مؤخراً) — upsert اصطدم بالفهرس الفريد
+        return False
+    return bool(doc and doc.get("owner") == WORKER_ID)
+
+
+async def _heartbeat(name: str, ttl: timedelta) -> None:
+    """Extend the lease periodically while the job is running."""
+    interval = max(ttl.total_seconds() / 3, 1.0)
+    collection = JobLease.get_motor_collection()
+    while True:
+        await asyncio.sleep(interval)
+        now = _utcnow()
+        result = await collection.update_one(
+            {"name": name, "owner": WORKER_ID},
+            {"$set": {"lease_expires_at": now + ttl, "heartbeat_at": now}},
+        )
+        if result.matched_count == 0:
+            logger.warning("Lost lease for job %s (worker=%s)", name, WORKER_ID)
+            return
+
+
+async def _release(name: str, *, started: float, error: str | None) -> None:
+    now = _utcnow()
+    await JobLease.get_motor_collection().update_one(
+        {"name": name, "owner": WORKER_ID},
+        {
+            "$set": {
+                "owner": None,
+                "lease_expires_at": None,
+                "last_finished_at": now,
+                "last_duration_ms": int((time.monotonic() - started) * 1000),
+                "last_outcome": "error" if error else "success",
+                "last_error": error,
+            },
+            "$inc": {"run_count": 1},
+        },
+    )
+
+
+async def run_leased_job(
+    name: str,
+    func: Callable[[], Awaitable[object]],
+    *,
+    ttl: timedelta = DEFAULT_LEASE_TTL,
+    min_interval: timedelta | None = None,
+    run_once: bool = False,
+) -> bool:
+    """Run `func` only if this worker wins the lease. Returns True if it ran."""
+    try:
+        acquired = await _try_acquire(
+            name, ttl=ttl, min_interval=min_interval, run_once=run_once
+        )
+    except Exception as exc:
+        logger.error("Failed to acquire lease for job %s: %s", name, exc)
+        return False
+    if not acquired:
+        logger.debug("Job %s skipped on %s (lease held or ran recently)", name, WORKER_ID)
+        return False
+
+    logger.info("Job %s started on %s", name, WORKER_ID)
+    started = time.monotonic()
+    heartbeat = asyncio.create_task(_heartbeat(name, ttl))
+    error: str | None = None
+    try:
+        await func()
+    except Exception as exc:
+        error = str(exc) or exc.__class__.__name__
+        logger.error("Job %s failed: %s", name, exc, exc_info=True)
+    finally:
+        heartbeat.cancel()
+        try:
+            await _release(name, started=started, error=error)
+        except Exception as exc:
+            logger.error("Failed to release lease for job %s: %s", name, exc)
+    logger.info(
+        "Job %s finished in %.3fs (%s)",
+        name,
+        time.monotonic() - started,
+        "error" if error else "success",
+    )
+    return True
+
+
+def leased_job(
+    name: str,
+    func: Callable[[], Awaitable[object]],
+    *,
+    ttl: timedelta = DEFAULT_LEASE_TTL,
+    min_interval: timedelta | None = None,
+    run_once: bool = False,
+) -> Callable[[], Awaitable[bool]]:
+    """Wrap a periodic coroutine so APScheduler runs it on exactly one worker.
+
+    run_once=True turns it into a migration: skipped forever after one success.
+    """
+
+    async def _runner() -> bool:
+        return await run_leased_job(
+            name, func, ttl=ttl, min_interval=min_interval, run_once=run_once
+        )
+
+    _runner.__name__ = f"leased_{name}"
+    return _runner
+
+
+async def list_job_status() -> list[JobLease]:
+    """Lease + last-run info for every known periodic job."""
+    return await JobLease.find_all().sort(+JobLease.name).to_list()
@@ -0,0 +1,206 @@
+"""Content-addressed media: one stored object per (patient, SHA-256).
+
+Uploads are hashed while they are read (see utils/uploads.stage_upload). Before
+storing, `store_deduplicated` looks the hash up in `media_blobs`: a re-sent or
+retried photo of the same patient reuses the existing object and only bumps
+its reference count. Object keys stay timestamped (a hash is never reused as a
+key), so a blob being collected can never race with a fresh upload of the
+same bytes.
+
+Records that stop pointing at an object (deleted gallery image / note, note
+images replaced) call `release_media`. When the count reaches zero the blob is
+marked orphaned; `collect_orphaned_blobs` (periodic leased job) deletes the
+object and its variants after MEDIA_GC_GRACE_SECONDS, re-checking first that
+no record still references it. Media stored before this index existed has no
+blob row and is never collected.
+
+Direct uploads (routers/uploads.py) never go through the blob index: each
+presigned key is recorded in `pending_uploads` and removed when the upload is
+confirmed. `collect_abandoned_uploads` deletes the objects of keys that were
+never confirmed once the PUT URL has expired plus PRESIGNED_UPLOAD_GRACE_SECONDS.
+"""
+
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterable, Optional
+
+from beanie import PydanticObjectId as OID
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from app.config import get_settings
+from app.models import Appointment, GalleryImage, MediaBlob, PendingUpload, TreatmentNote
+from app.services.media_storage import Body, delete_object, key_from_url, public_url, store_object
+from app.utils.logger import get_logger
+
+settings = get_settings()
+logger = get_logger("media_blobs")
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+async def _acquire(patient_oid: OID, sha256: str) -> Optional[dict]:
+    return await MediaBlob.get_motor_collection().find_one_and_update(
+        {"patient_id": patient_oid, "sha256": sha256},
+        {
+            "$inc": {"ref_count": 1},
+            "$set": {"updated_at": _utcnow()},
+            "$unset": {"orphaned_at": ""},
+        },
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def store_deduplicated(
+    *,
+    patient_id: str,
+    sha256: str,
+    body: Body,
+    content_type: str,
+    size: int,
+    make_key: Callable[[], str],
+) -> str:
+    """Return the URL of this patient's copy of the content, storing it only if new."""
+    try:
+        patient_oid = OID(patient_id)
+    except Exception:
+        return await store_object(make_key(), body, content_type, size)
+
+    existing = await _acquire(patient_oid, sha256)
+    if existing:
+        logger.info("Reusing stored media %s for patient %s", existing["key"], patient_id)
+        return existing["url"]
+
+    key = make_key()
+    url = await store_object(key, body, content_type, size)
+    now = _utcnow()
+    try:
+        await MediaBlob.get_motor_collection().insert_one(
+            {
+                "patient_id": patient_oid,
+                "sha256": sha256,
+                "key": key,
+                "url": url,
+                "size": size,
+                "content_type": content_type,
+                "ref_count": 1,
+                "variant_keys": [],
+                "orphaned_at": None,
+                "created_at": now,
+                "updated_at": now,
+            }
+        )
+    except DuplicateKeyError:
+        # The same bytes were uploaded concurrently and the other request won.
+        existing = await _acquire(patient_oid, sha256)
+        if existing:
+            try:
+                await delete_object(key)
+            except Exception as exc:
+                logger.warning("Could not delete duplicate upload %s: %s", key, exc)
+            return existing["url"]
+    return url
+
+
+async def release_media(urls: Iterable[Optional[str]], variant_urls: Iterable[Optional[str]] = ()) -> int:
+    """Drop one reference per URL occurrence; blobs reaching zero are marked for collection.
+
+    A URL listed twice (e.g. two records of one batch that deduplicated to the
+    same blob) releases two references.
+    """
+    collection = MediaBlob.get_motor_collection()
+    variant_keys = [k for k in (key_from_url(u) for u in variant_urls) if k]
+    released = 0
+    for url, count in Counter(u for u in urls if u).items():
+        update: dict = {"$inc": {"ref_count": -count}, "$set": {"updated_at": _utcnow()}}
+        if variant_keys:
+            update["$addToSet"] = {"variant_keys": {"$each": variant_keys}}
+        blob = await collection.find_one_and_update(
+            {"url": url, "ref_count": {"$gt": 0}},
+            update,
+            return_document=ReturnDocument.AFTER,
+        )
+        if blob is None:
+            continue
+        released += count
+        if blob["ref_count"] <= 0:
+            await collection.update_one(
+                {"_id": blob["_id"], "ref_count": {"$lte": 0}},
+                {"$set": {"orphaned_at": _utcnow()}},
+            )
+    return released
+
+
+async def _still_referenced(patient_id: OID, url: str) -> bool:
+    if await GalleryImage.get_motor_collection().find_one(
+        {"patient_id": patient_id, "image_path": url}, {"_id": 1}
+    ):
+        return True
+    for model in (TreatmentNote, Appointment):
+        if await model.get_motor_collection().find_one(
+            {"patient_id": patient_id, "$or": [{"image_path": url}, {"image_paths": url}]},
+            {"_id": 1},
+        ):
+            return True
+    return False
+
+
+async def collect_orphaned_blobs(grace_seconds: int | None = None, limit: int = 500) -> int:
+    """Delete objects whose blobs have had no references for the grace period."""
+    grace = settings.MEDIA_GC_GRACE_SECONDS if grace_seconds is None else grace_seconds
+    cutoff = _utcnow() - timedelta(seconds=grace)
+    collection = MediaBlob.get_motor_collection()
+    candidates = await collection.find(
+        {"orphaned_at": {"$lte": cutoff}, "ref_count": {"$lte": 0}}
+    ).limit(limit).to_list(limit)
+
+    collected = 0
+    for blob in candidates:
+        if await _still_referenced(blob["patient_id"], blob["url"]):
+            # A record still points here (e.g. written before release ran): repair the count.
+            await collection.update_one(
+                {"_id": blob["_id"]}, {"$set": {"ref_count": 1}, "$unset": {"orphaned_at": ""}}
+            )
+            continue
+        # Remove the row first: a concurrent upload of the same bytes then stores a new object.
+        removed = await collection.find_one_and_delete({"_id": blob["_id"], "ref_count": {"$lte": 0}})
+        if removed is None:
+            continue
+        for key in [removed["key"], *removed.get("variant_keys", [])]:
+            try:
+                await delete_object(key)
+            except Exception as exc:
+                logger.warning("Could not delete orphaned media %s: %s", key, exc)
+        collected += 1
+    if collected:
+        logger.info("Collected %d orphaned media objects", collected)
+    return collected
+
+
+async def collect_abandoned_uploads(grace_seconds: int | None = None, limit: int = 500) -> int:
+    """Delete presigned uploads that were never confirmed (object + pending row)."""
+    grace = settings.PRESIGNED_UPLOAD_GRACE_SECONDS if grace_seconds is None else grace_seconds
+    cutoff = _utcnow() - timedelta(seconds=grace)
+    collection = PendingUpload.get_motor_collection()
+    candidates = await collection.find({"expires_at": {"$lte": cutoff}}).limit(limit).to_list(limit)
+
+    collected = 0
+    for pending in candidates:
+        # Claim the row first so two workers never both delete, and a confirm that
+        # created its record but failed to drop the row does not lose its image.
+        removed = await collection.find_one_and_delete({"_id": pending["_id"]})
+        if removed is None:
+            continue
+        if await _still_referenced(removed["patient_id"], public_url(removed["key"])):
+            continue
+        try:
+            await delete_object(removed["key"])
+        except Exception as exc:
+            logger.warning("Could not delete abandoned upload %s: %s", removed["key"], exc)
+            continue
+        collected += 1
+    if collected:
+        logger.info("Deleted %d abandoned direct uploads", collected)
+    return collected
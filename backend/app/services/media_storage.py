@@ -0,0 +1,350 @@
+"""Object storage for clinic media (Cloudflare R2, or the local media/ folder).
+
+One S3 client is built per process and shared: boto3 clients are thread-safe
+and keep their HTTP connections alive in a pool sized by R2_MAX_POOL_CONNECTIONS.
+Uploads run on a bounded thread pool (MEDIA_UPLOAD_WORKERS) so the event loop
+never waits on a transfer; extra uploads queue for a free worker.
+
+Bodies above R2_MULTIPART_THRESHOLD_MB go through boto3's managed transfer
+(multipart, parts uploaded in parallel). Transient failures are retried with
+exponential backoff on top of botocore's own retries.
+
+R2_ENDPOINT_URL points the client at any S3-compatible server (MinIO, moto
+server) for local testing; without it the R2 endpoint is derived from
+R2_ACCOUNT_ID.
+"""
+
+import asyncio
+import io
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import BinaryIO, Optional, Union
+
+from app.config import get_settings
+from app.utils.logger import get_logger
+
+settings = get_settings()
+logger = get_logger("media_storage")
+
+# Same folder r2_clinic has always written to: backend/media
+MEDIA_DIR = Path(__file__).resolve().parents[2] / "media"
+
+_MB = 1024 * 1024
+# آخر N عملية رفع تُستخدم لحساب p50/p95
+_LATENCY_WINDOW = 1000
+
+Body = Union[bytes, BinaryIO]
+
+_client = None
+_client_lock = threading.Lock()
+_transfer_config = None
+
+# الرفع يتم على threads محدودة العدد: بقية الطلبات تنتظر دون حجز الـ loop.
+_upload_executor = ThreadPoolExecutor(
+    max_workers=settings.MEDIA_UPLOAD_WORKERS, thread_name_prefix="media-upload"
+)
+
+
+class UploadMetrics:
+    """عدادات الرفع وزمن آخر العمليات (لكل عملية/worker)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.uploads = 0
+        self.failures = 0
+        self.retries = 0
+        self.multipart = 0
+        self.bytes = 0
+        self._latencies_ms: deque[float] = deque(maxlen=_LATENCY_WINDOW)
+
+    def record(self, *, ok: bool, size: int, elapsed_ms: float, attempts: int, multipart: bool) -> None:
+        with self._lock:
+            self.retries += max(0, attempts - 1)
+            if not ok:
+                self.failures += 1
+                return
+            self.uploads += 1
+            self.bytes += size
+            if multipart:
+                self.multipart += 1
+            self._latencies_ms.append(elapsed_ms)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            ordered = sorted(self._latencies_ms)
+            uploads, failures, retries = self.uploads, self.failures, self.retries
+            multipart, total_bytes = self.multipart, self.bytes
+
+        def pct(p: float) -> float:
+            if not ordered:
+                return 0.0
+            return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))], 1)
+
+        return {
+            "backend": "r2" if is_remote_enabled() else "local",
+            "uploads": uploads,
+            "failures": failures,
+            "retries": retries,
+            "multipart_uploads": multipart,
+            "bytes": total_bytes,
+            "latency_ms": {"p50": pct(0.5), "p95": pct(0.95), "p99": pct(0.99), "max": pct(1.0)},
+        }
+
+
+metrics = UploadMetrics()
+
+
+def is_remote_enabled() -> bool:
+    """R2 مفعّل إذا اكتملت بيانات الاعتماد والـ bucket والرابط العام."""
+    return bool(
+        (settings.R2_ENDPOINT_URL or settings.R2_ACCOUNT_ID)
+        and settings.R2_ACCESS_KEY_ID
+        and settings.R2_SECRET_ACCESS_KEY
+        and settings.R2_BUCKET_NAME
+        and settings.R2_PUBLIC_BASE
+    )
+
+
+def _endpoint_url() -> str:
+    if settings.R2_ENDPOINT_URL:
+        return settings.R2_ENDPOINT_URL.rstrip("/")
+    return f"https://{settings.R2_ACCOUNT_ID}.r2.cloudflarestorage.com"
+
+
+def get_s3_client():
+    """The shared S3 client (built once), or None when R2 is not configured."""
+    global _client, _transfer_config
+    if not is_remote_enabled():
+        return None
+    if _client is not None:
+        return _client
+    with _client_lock:
+        if _client is None:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+            from botocore.config import Config
+
+            _client = boto3.session.Session().client(
+                "s3",
+                endpoint_url=_endpoint_url(),
+                aws_access_key_id=settings.R2_ACCESS_KEY_ID,
+                aws_secret_access_key=settings.R2_SECRET_ACCESS_KEY,
+                region_name="auto",
+                config=Config(
+                    max_pool_connections=settings.R2_MAX_POOL_CONNECTIONS,
+                    tcp_keepalive=True,
+                    connect_timeout=5,
+                    read_timeout=60,
+                    retries={"max_attempts": 3, "mode": "standard"},
+                ),
+            )
+            _transfer_config = TransferConfig(
+                multipart_threshold=settings.R2_MULTIPART_THRESHOLD_MB * _MB,
+                multipart_chunksize=settings.R2_MULTIPART_CHUNK_MB * _MB,
+                max_concurrency=4,
+            )
+    return _client
+
+
+def public_url(key: str) -> str:
+    if is_remote_enabled():
+        return f"{settings.R2_PUBLIC_BASE.rstrip('/')}/{key}"
+    return f"/media/{key}"
+
+
+def key_from_url(url: Optional[str]) -> Optional[str]:
+    """Object key of a URL returned by store_object (R2 public URL or /media/...), else None."""
+    if not url:
+        return None
+    base = (settings.R2_PUBLIC_BASE or "").rstrip("/")
+    if base and url.startswith(base + "/"):
+        return url[len(base) + 1:]
+    if url.startswith("/media/"):
+        return url[len("/media/"):]
+    return None
+
+
+def local_path(key: str) -> Optional[Path]:
+    """Path of a locally stored object, if it exists on this machine."""
+    path = MEDIA_DIR / key
+    return path if path.is_file() else None
+
+
+def _get_remote(key: str) -> bytes:
+    response = get_s3_client().get_object(Bucket=settings.R2_BUCKET_NAME, Key=key)
+    return response["Body"].read()
+
+
+async def fetch_object(key: str) -> bytes:
+    """Read an object back (R2 GET on the upload pool, or the local file)."""
+    loop = asyncio.get_running_loop()
+    path = local_path(key)
+    if path is not None:
+        return await loop.run_in_executor(_upload_executor, path.read_bytes)
+    if not is_remote_enabled():
+        raise FileNotFoundError(key)
+    return await loop.run_in_executor(_upload_executor, _get_remote, key)
+
+
+def presign_put(key: str, content_type: str, expires_in: int) -> str:
+    """Presigned PUT URL for a direct client upload (signing is local, no network)."""
+    return get_s3_client().generate_presigned_url(
+        "put_object",
+        Params={"Bucket": settings.R2_BUCKET_NAME, "Key": key, "ContentType": content_type},
+        ExpiresIn=expires_in,
+    )
+
+
+def _head_remote(key: str) -> Optional[dict]:
+    from botocore.exceptions import ClientError
+
+    try:
+        response = get_s3_client().head_object(Bucket=settings.R2_BUCKET_NAME, Key=key)
+    except ClientError as exc:
+        if exc.response.get("ResponseMetadata", {}).get("HTTPStatusCode") == 404:
+            return None
+        raise
+    return {"size": response.get("ContentLength", 0), "content_type": response.get("ContentType")}
+
+
+async def head_object(key: str) -> Optional[dict]:
+    """{"size", "content_type"} of a stored object, or None if it does not exist."""
+    loop = asyncio.get_running_loop()
+    if not is_remote_enabled():
+        path = local_path(key)
+        return {"size": path.stat().st_size, "content_type": None} if path else None
+    return await loop.run_in_executor(_upload_executor, _head_remote, key)
+
+
+def _delete_remote(key: str) -> None:
+    get_s3_client().delete_object(Bucket=settings.R2_BUCKET_NAME, Key=key)
+
+
+async def delete_object(key: str) -> None:
+    """Delete a stored object (missing objects are not an error)."""
+    loop = asyncio.get_running_loop()
+    if not is_remote_enabled():
+        path = local_path(key)
+        if path is not None:
+            await loop.run_in_executor(_upload_executor, path.unlink)
+        return
+    await loop.run_in_executor(_upload_executor, _delete_remote, key)
+
+
+def _body_size(body: Body) -> int:
+    if isinstance(body, (bytes, bytearray, memoryview)):
+        return len(body)
+    position = body.tell()
+    body.seek(0, io.SEEK_END)
+    size = body.tell()
+    body.seek(position)
+    return size
+
+
+def _put_remote(key: str, body: Body, content_type: str, size: int) -> tuple[bool, int]:
+    """Upload with retries; returns (multipart?, attempts). Runs on the upload pool."""
+    client = get_s3_client()
+    multipart = size >= settings.R2_MULTIPART_THRESHOLD_MB * _MB
+    max_attempts = max(1, settings.R2_UPLOAD_MAX_ATTEMPTS)
+    for attempt in range(1, max_attempts + 1):
+        try:
+            if multipart:
+                fileobj = io.BytesIO(body) if isinstance(body, (bytes, bytearray, memoryview)) else body
+                fileobj.seek(0)
+                client.upload_fileobj(
+                    fileobj,
+                    settings.R2_BUCKET_NAME,
+                    key,
+                    ExtraArgs={"ContentType": content_type},
+                    Config=_transfer_config,
+                )
+            else:
+                if not isinstance(body, (bytes, bytearray, memoryview)):
+                    body.seek(0)
+                client.put_object(
+                    Bucket=settings.R2_BUCKET_NAME,
+                    Key=key,
+                    Body=body,
+                    ContentType=content_type,
+                    ContentLength=size,
+                )
+            return multipart, attempt
+        except Exception as exc:
+            if attempt >= max_attempts or not _is_retryable(exc):
+                exc.attempts = attempt  # type: ignore[attr-defined]
+                raise
+            delay = settings.R2_UPLOAD_BACKOFF_SECONDS * (2 ** (attempt - 1))
+            delay += random.uniform(0, delay / 2)
+            logger.warning("R2 upload of %s failed (attempt %s): %s — retrying in %.2fs", key, attempt, exc, delay)
+            time.sleep(delay)
+    raise RuntimeError("R2_UPLOAD_MAX_ATTEMPTS exhausted")
+
+
+def _is_retryable(exc: Exception) -> bool:
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    if isinstance(exc, ClientError):
+        status = exc.response.get("ResponseMetadata", {}).get("HTTPStatusCode") or 0
+        code = exc.response.get("Error", {}).get("Code", "")
+        return status >= 500 or status == 429 or code in ("SlowDown", "RequestTimeout")
+    return isinstance(exc, (BotoCoreError, ConnectionError, TimeoutError))
+
+
+def _write_local(key: str, body: Body) -> None:
+    path = MEDIA_DIR / key
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as f:
+        if isinstance(body, (bytes, bytearray, memoryview)):
+            f.write(body)
+        else:
+            body.seek(0)
+            while chunk := body.read(_MB):
+                f.write(chunk)
+
+
+async def store_object(key: str, body: Body, content_type: str, size: Optional[int] = None) -> str:
+    """
+    Store `body` (bytes or a seekable binary file) under `key` and return its public URL.
+    Raises the underlying exception after retries are exhausted.
+    """
+    if size is None:
+        size = _body_size(body)
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+
+    if not is_remote_enabled():
+        await loop.run_in_executor(_upload_executor, _write_local, key, body)
+        logger.info("Saved file locally to: %s", MEDIA_DIR / key)
+        return public_url(key)
+
+    try:
+        multipart, attempts = await loop.run_in_executor(
+            _upload_executor, _put_remote, key, body, content_type, size
+        )
+    except Exception as exc:
+        metrics.record(
+            ok=False, size=size, elapsed_ms=0.0, attempts=getattr(exc, "attempts", 1), multipart=False
+        )
+        raise
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    metrics.record(ok=True, size=size, elapsed_ms=elapsed_ms, attempts=attempts, multipart=multipart)
+    safe_key = key.encode("ascii", "ignore").decode("ascii")
+    logger.info(
+        "Uploaded file to R2: %s (%d bytes, %.0f ms%s)",
+        safe_key or key, size, elapsed_ms, ", multipart" if multipart else "",
+    )
+    return public_url(key)
+
+
+def upload_metrics() -> dict:
+    """Counters and recent latency percentiles for uploads on this worker."""
+    return metrics.snapshot()
+
+
+def shutdown_media_storage() -> None:
+    """Let queued uploads finish, then stop the pool (called from app shutdown)."""
+    _upload_executor.shutdown(wait=True)
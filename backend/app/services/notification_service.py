@@ -1,5 +1,7 @@
+import asyncio
 from typing import Optional, Any
 from beanie import PydanticObjectId as OID
+from beanie.operators import In
 
 from app.models import DeviceToken, Notification, User, Patient
 from app.constants import Role
@@ -129,17 +131,16 @@ async def notify_push_only(
     return await send_firebase_message(tokens, title, body, data=fcm_data)
 
 
-async def notify_user(
+def _build_notification(
     *,
-    user_id: str | OID,
+    user_id: OID,
     title: str,
     body: str,
-    type: str = "general",
-    data: Optional[dict[str, Any]] = None,
-    patient_id: str | OID | None = None,
+    type: str,
+    data: Optional[dict[str, Any]],
+    patient_id: str | OID | None,
 ) -> Notification:
-    """Create an in-app notification and send push to all user devices."""
-    uid = user_id if isinstance(user_id, OID) else OID(user_id)
+    """Notification غير محفوظ بعد: النوع والـ patientId موحّدان لكل طرق الإرسال."""
     notif_type = type if type in NOTIFICATION_TYPES else "general"
     payload = dict(data or {})
 
@@ -149,8 +150,9 @@ async def notify_user(
     if pid is not None:
         payload["patientId"] = str(pid)
 
-    notif = Notification(
-        user_id=uid,
+    return Notification(
+        id=OID(),
+        user_id=user_id,
         patient_id=pid,
         title=title,
         body=body,
@@ -158,20 +160,98 @@ async def notify_user(
         data=payload,
         is_read=False,
     )
+
+
+def _notification_fcm_data(notif: Notification) -> dict[str, str]:
+    return {
+        "type": notif.type,
+        "notification_id": str(notif.id),
+        **{k: str(v) for k, v in notif.data.items() if v is not None},
+    }
+
+
+async def notify_user(
+    *,
+    user_id: str | OID,
+    title: str,
+    body: str,
+    type: str = "general",
+    data: Optional[dict[str, Any]] = None,
+    patient_id: str | OID | None = None,
+) -> Notification:
+    """Create an in-app notification and send push to all user devices."""
+    uid = user_id if isinstance(user_id, OID) else OID(user_id)
+    notif = _build_notification(
+        user_id=uid, title=title, body=body, type=type, data=data, patient_id=patient_id
+    )
     await notif.insert()
 
     tokens = await _user_device_tokens(uid)
     if tokens:
-        fcm_data = {
-            "type": notif_type,
-            "notification_id": str(notif.id),
-            **{k: str(v) for k, v in payload.items() if v is not None},
-        }
-        await send_firebase_message(tokens, title, body, data=fcm_data)
+        await send_firebase_message(tokens, title, body, data=_notification_fcm_data(notif))
 
     return notif
 
 
+async def _device_tokens_by_user(user_ids: list[OID]) -> dict[OID, list[str]]:
+    """Active FCM tokens for many users in one query."""
+    if not user_ids:
+        return {}
+    tokens_docs = await DeviceToken.find(
+        In(DeviceToken.user_id, user_ids),
+        DeviceToken.active == True,  # noqa: E712
+    ).to_list()
+    by_user: dict[OID, list[str]] = {}
+    for dt in tokens_docs:
+        by_user.setdefault(dt.user_id, []).append(dt.token)
+    return by_user
+
+
+async def notify_users_bulk(
+    items: list[dict[str, Any]],
+    *,
+    concurrency: int = 10,
+) -> list[Notification]:
+    """Bulk variant of notify_user for scheduled jobs.
+
+    Each item takes the same keyword arguments as notify_user. All in-app
+    notifications are written with one insert_many, device tokens are loaded
+    with one query, and pushes go out with at most `concurrency` in flight.
+    """
+    notifs: list[Notification] = []
+    for item in items:
+        uid = _as_oid(item["user_id"])
+        if uid is None:
+            continue
+        notifs.append(
+            _build_notification(
+                user_id=uid,
+                title=item["title"],
+                body=item["body"],
+                type=item.get("type") or "general",
+                data=item.get("data"),
+                patient_id=item.get("patient_id"),
+            )
+        )
+
+    if not notifs:
+        return []
+    await Notification.insert_many(notifs)
+
+    tokens_by_user = await _device_tokens_by_user(list({n.user_id for n in notifs}))
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def _push(notif: Notification) -> None:
+        tokens = tokens_by_user.get(notif.user_id)
+        if not tokens:
+            return
+        async with semaphore:
+            await send_firebase_message(tokens, notif.title, notif.body, data=_notification_fcm_data(notif))
+
+    await asyncio.gather(*[_push(n) for n in notifs], return_exceptions=True)
+    return notifs
+
+
 async def list_user_notifications(
     *,
     user_id: str | OID,
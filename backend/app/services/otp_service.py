@@ -7,6 +7,7 @@ from passlib.context import CryptContext
 
 from app.config import get_settings
 from app.models.otp import OTPRequest
+from app.rate_limit import hit_or_raise
 
 
 _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -52,6 +53,7 @@ async def create_otp_request(*, phone: str) -> tuple[str, OTPRequest]:
     normalized = normalize_iraqi_phone(phone)
     if not normalized:
         raise HTTPException(status_code=400, detail="Invalid phone")
+    await hit_or_raise(settings.OTP_REQUEST_PHONE_LIMIT, "otp-request", normalized)
 
     code = generate_otp_code()
     now = datetime.now(timezone.utc)
@@ -76,10 +78,13 @@ async def verify_otp_or_raise(*, phone: str, code: str) -> OTPRequest:
     - checks attempts max 5
     - increments attempts on failure
     - marks verified_at on success
+    Attempts and verified_at are updated atomically so parallel requests on
+    different workers cannot exceed the attempt budget or reuse one code.
     """
     normalized = normalize_iraqi_phone(phone)
     if not normalized:
         raise HTTPException(status_code=400, detail="Invalid phone")
+    await hit_or_raise(get_settings().OTP_VERIFY_PHONE_LIMIT, "otp-verify", normalized)
 
     now = datetime.now(timezone.utc)
     otp = (
@@ -103,12 +108,20 @@ async def verify_otp_or_raise(*, phone: str, code: str) -> OTPRequest:
     if expires_at < now:
         raise HTTPException(status_code=400, detail="Invalid or expired code")
 
+    collection = OTPRequest.get_motor_collection()
     if not verify_hashed_otp(code.strip(), otp.code_hash):
-        otp.attempts = int(otp.attempts or 0) + 1
-        await otp.save()
+        await collection.update_one(
+            {"_id": otp.id, "attempts": {"$lt": _MAX_ATTEMPTS}},
+            {"$inc": {"attempts": 1}},
+        )
         raise HTTPException(status_code=400, detail="Invalid or expired code")
 
+    result = await collection.update_one(
+        {"_id": otp.id, "verified_at": None, "attempts": {"$lt": _MAX_ATTEMPTS}},
+        {"$set": {"verified_at": now}},
+    )
+    if result.modified_count == 0:
+        raise HTTPException(status_code=400, detail="Invalid or expired code")
     otp.verified_at = now
-    await otp.save()
     return otp
 
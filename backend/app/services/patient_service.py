@@ -1,13 +1,17 @@
-from collections import defaultdict
+from collections import Counter, defaultdict
 from datetime import datetime, timedelta, timezone
 from typing import Optional, List, Tuple
 from fastapi import HTTPException
 from beanie import PydanticObjectId as OID
 from beanie.operators import In, NotIn, And, Or
+from pymongo.errors import BulkWriteError
 
 from app.models import Patient, DoctorPatientProfile, User, Doctor, Appointment, TreatmentNote, GalleryImage
 from app.constants import Role
 from app.schemas import PatientUpdate
+from app.security import invalidate_principal
+from app.services.image_variants import schedule_variants
+from app.services.media_blobs import release_media
 
 # نرفع الحد الأقصى للصفحات إلى رقم كبير حتى لا نقيد النتائج بشكل قوي
 MAX_PAGE_SIZE = 100000
@@ -73,6 +77,25 @@ def _touch_doctor_last_action(patient: Patient, doctor_id: str) -> None:
     """
     return
 
+
+async def _revoke_chat_access(patient_id: OID, doctor_ids: List[OID] | None = None) -> None:
+    """إلغاء صلاحيات السوكيت المخزنة لغرف المريض مع الأطباء الذين فُكّ ربطهم (None = كل الغرف)."""
+    from app.models import ChatRoom
+    from app.services.socket_service import invalidate_room_access
+
+    try:
+        query = [ChatRoom.patient_id == patient_id]
+        if doctor_ids is not None:
+            if not doctor_ids:
+                return
+            query.append(In(ChatRoom.doctor_id, list(doctor_ids)))
+        rooms = await ChatRoom.find(*query).to_list()
+        if rooms:
+            await invalidate_room_access(room.id for room in rooms)
+    except Exception as e:
+        print(f"⚠️ Failed to revoke chat access for patient {patient_id}: {e}")
+
+
 async def get_patient_by_id(patient_id: str) -> Tuple[Patient, User]:
     """Fetch patient and its user info or 404."""
     patient = await Patient.get(OID(patient_id))
@@ -189,12 +212,14 @@ async def cleanup_inactive_new_patients_for_doctor(doctor_id: str) -> int:
                         f"⚠️ Warning: Failed to create InactivePatientLog for patient {patient.id}, doctor {removed_doctor_id}: {log_error}"
                     )
 
+            removed_doctor_ids = list(patient.doctor_ids or [])
             patient.doctor_ids = []
             patient.doctor_profiles = {}
             patient.activity_status = "inactive"
             patient.inactivated_at = now
 
             await patient.save()
+            await _revoke_chat_access(patient.id, removed_doctor_ids)
             removed_count += 1
 
         if removed_count:
@@ -273,11 +298,13 @@ async def cleanup_inactive_new_patients_global() -> int:
                         f"⚠️ Warning: Failed to create InactivePatientLog for patient {patient.id}, doctor {removed_doctor_id}: {log_error}"
                     )
 
+            removed_doctor_ids = list(patient.doctor_ids or [])
             patient.doctor_ids = []
             patient.doctor_profiles = {}
             patient.activity_status = "inactive"
             patient.inactivated_at = now
             await patient.save()
+            await _revoke_chat_access(patient.id, removed_doctor_ids)
             removed_count += 1
 
         if removed_count:
@@ -374,11 +401,13 @@ async def update_patient_activity_status_by_reception(*, patient_id: str, status
                     f"⚠️ Warning: Failed to create InactivePatientLog for patient {patient.id}, doctor {removed_doctor_id}: {log_error}"
                 )
 
+    removed_doctor_ids = list(patient.doctor_ids or [])
     patient.activity_status = "inactive"
     patient.inactivated_at = now
     patient.doctor_ids = []
     patient.doctor_profiles = {}
     await patient.save()
+    await _revoke_chat_access(patient.id, removed_doctor_ids)
     return patient
 
 
@@ -420,6 +449,7 @@ async def update_patient_by_admin(*, patient_id: str, data: PatientUpdate) -> Pa
             raise HTTPException(status_code=400, detail="Phone already exists")
         u.phone = data.phone
         await u.save()
+        invalidate_principal(u.id)
     if data.name is not None:
         patient.name = data.name
     if data.gender is not None:
@@ -448,12 +478,14 @@ async def delete_patient(*, actor_role: Role, patient_id: str, actor_doctor_id:
 
     user_id = patient.user_id
     await patient.delete()
+    await _revoke_chat_access(patient.id)
 
     remaining = await Patient.find(Patient.user_id == user_id).count()
     if remaining == 0:
         user = await User.get(user_id)
         if user:
             await user.delete()
+            invalidate_principal(user.id)
     return None
 
 async def assign_patient_doctors(
@@ -544,6 +576,8 @@ async def assign_patient_doctors(
     print(f"💾 [assign_patient_doctors] Saving patient...")
     await patient.save()
     print(f"✅ [assign_patient_doctors] Patient saved. doctor_ids: {patient.doctor_ids}")
+    if removed_doctors:
+        await _revoke_chat_access(patient.id, list(removed_doctors))
     
     # التحقق من الحفظ
     saved_patient = await Patient.get(patient.id)
@@ -612,6 +646,23 @@ async def set_payment_methods(*, patient_id: str, doctor_id: str, methods: List[
     await patient.save()
     return patient
 
+def _image_urls(doc) -> list[str]:
+    urls = list(getattr(doc, "image_paths", None) or [])
+    if getattr(doc, "image_path", None) and doc.image_path not in urls:
+        urls.append(doc.image_path)
+    return urls
+
+
+def _variant_urls(doc, originals: Optional[set] = None) -> list[str]:
+    return [
+        url
+        for v in (getattr(doc, "image_variants", None) or [])
+        if originals is None or v.original in originals
+        for url in (v.thumb, v.medium, v.display)
+        if url
+    ]
+
+
 async def create_note(
     *,
     patient_id: str,
@@ -634,6 +685,7 @@ async def create_note(
             TreatmentNote.client_operation_id == client_operation_id
         )
         if existing:
+            await release_media(image_paths or [image_path])
             return existing
     
     # للتوافق مع البيانات القديمة، نستخدم أول صورة كـ image_path
@@ -659,10 +711,13 @@ async def create_note(
                 TreatmentNote.client_operation_id == client_operation_id
             )
             if existing:
+                await release_media(image_paths or [image_path])
                 return existing
         raise
 
     await patient.save()
+    # thumb/medium بالخلفية حتى لا ينتظرها الطلب
+    schedule_variants(TreatmentNote, tn.id, tn.image_paths)
     return tn
 
 async def update_note(
@@ -683,11 +738,14 @@ async def update_note(
     if str(tn.doctor_id) != doctor_id:
         raise HTTPException(status_code=403, detail="Not your note")
     
+    replaced: list = []
     if note is not None:
         tn.note = note
     if image_paths is not None:
         # إذا كانت القائمة فارغة، نحتفظ بالصور القديمة
         if len(image_paths) > 0:
+            # كل تكرار يحمل مرجعاً في media_blobs
+            replaced = list((Counter(_image_urls(tn)) - Counter(image_paths)).elements())
             tn.image_paths = image_paths
             # للتوافق مع البيانات القديمة
             tn.image_path = image_paths[0] if image_paths else None
@@ -695,6 +753,10 @@ async def update_note(
     await patient.save()
 
     await tn.save()
+    if image_paths:
+        schedule_variants(TreatmentNote, tn.id, tn.image_paths)
+    if replaced:
+        await release_media(replaced, _variant_urls(tn, set(replaced) - set(image_paths)))
     return tn
 
 async def delete_note(
@@ -716,11 +778,20 @@ async def delete_note(
         raise HTTPException(status_code=403, detail="Not your note")
     
     await tn.delete()
+    # الملفات تُحذف لاحقاً بواسطة الـ GC إذا لم يعد أي سجل يشير إليها
+    await release_media(_image_urls(tn), _variant_urls(tn))
 
     await patient.save()
 
     return True
 
+async def _uploader_role(uploaded_by_user_id: str, role: Role | None) -> Role | None:
+    if role is not None:
+        return role
+    user = await User.get(OID(uploaded_by_user_id))
+    return user.role if user else None
+
+
 async def create_gallery_image(
     *,
     patient_id: str,
@@ -729,25 +800,33 @@ async def create_gallery_image(
     note: Optional[str],
     doctor_id: str | None = None,
     client_operation_id: Optional[str] = None,
+    uploaded_by_role: Role | None = None,
 ) -> GalleryImage:
     """
     إنشاء سجل صورة في معرض المريض.
 
     - uploaded_by_user_id: المستخدم (طبيب / استقبال / مصور) الذي رفع الصورة.
+    - uploaded_by_role: دوره (يُجلب من المستخدم إن لم يُمرَّر)؛ يُخزَّن لفلترة المعرض.
     - doctor_id: يتم تمريره فقط عندما تكون الصورة مرفوعة من قبل الطبيب لحساب النشاط.
     - client_operation_id: لمنع التكرار عند إعادة محاولة الرفع من العميل.
+
+    التكرار يُمنع بالمفتاح فقط؛ نفس الصورة بدون مفتاح تُنشئ سجلاً جديداً (الملف
+    المخزّن نفسه مشترك عبر media_blobs). عند إرجاع سجل موجود يُحرَّر المرجع
+    الذي أضافه الرفع الحالي.
     """
     if client_operation_id:
         existing = await GalleryImage.find_one(
             GalleryImage.client_operation_id == client_operation_id
         )
         if existing:
+            await release_media([image_path])
             return existing
 
     doctor_oid = OID(doctor_id) if doctor_id else None
     gi_kwargs: dict = {
         "patient_id": OID(patient_id),
         "uploaded_by_user_id": OID(uploaded_by_user_id),
+        "uploaded_by_role": await _uploader_role(uploaded_by_user_id, uploaded_by_role),
         "image_path": image_path,
         "note": note,
         "doctor_id": doctor_oid,
@@ -765,6 +844,7 @@ async def create_gallery_image(
                 GalleryImage.client_operation_id == client_operation_id
             )
             if existing:
+                await release_media([image_path])
                 return existing
         raise
 
@@ -772,8 +852,85 @@ async def create_gallery_image(
     if doctor_id:
         pass
 
+    schedule_variants(GalleryImage, gi.id, [gi.image_path])
     return gi
 
+
+async def create_gallery_images(
+    *,
+    patient_id: str,
+    uploaded_by_user_id: str,
+    items: List[Tuple[str, Optional[str], Optional[str]]],
+    doctor_id: str | None = None,
+    uploaded_by_role: Role | None = None,
+) -> List[Tuple[GalleryImage, bool]]:
+    """
+    نسخة دفعية من create_gallery_image: كل السجلات الجديدة تُكتب بـ insert_many واحد.
+
+    - items: (image_path, note, client_operation_id) لكل صورة.
+    - يرجع لكل عنصر (السجل، created) بنفس الترتيب؛ created=False عندما يكون
+      المفتاح مستخدماً مسبقاً (ويُحرَّر المرجع الإضافي).
+    """
+    patient_oid = OID(patient_id)
+    keys = [key for _, _, key in items if key]
+    by_key = (
+        {g.client_operation_id: g for g in await GalleryImage.find(In(GalleryImage.client_operation_id, keys)).to_list()}
+        if keys
+        else {}
+    )
+
+    doctor_oid = OID(doctor_id) if doctor_id else None
+    uploader_oid = OID(uploaded_by_user_id)
+    uploader_role = await _uploader_role(uploaded_by_user_id, uploaded_by_role)
+    results: List[Optional[Tuple[GalleryImage, bool]]] = [None] * len(items)
+    new_docs: List[GalleryImage] = []
+    new_index: List[int] = []
+    duplicates: List[str] = []
+    for i, (image_path, note, key) in enumerate(items):
+        existing = by_key.get(key) if key else None
+        if existing:
+            duplicates.append(image_path)
+            results[i] = (existing, False)
+            continue
+        gi_kwargs: dict = {
+            "id": OID(),
+            "patient_id": patient_oid,
+            "uploaded_by_user_id": uploader_oid,
+            "uploaded_by_role": uploader_role,
+            "image_path": image_path,
+            "note": note,
+            "doctor_id": doctor_oid,
+        }
+        if key:
+            gi_kwargs["client_operation_id"] = key
+        gi = GalleryImage(**gi_kwargs)
+        new_docs.append(gi)
+        new_index.append(i)
+        results[i] = (gi, True)
+
+    if new_docs:
+        try:
+            await GalleryImage.insert_many(new_docs, ordered=False)
+        except BulkWriteError as exc:
+            # طلب متزامن بنفس المفتاح سبقنا: نرجع سجله بدل السجل الذي لم يُكتب
+            for error in exc.details.get("writeErrors", []):
+                i = new_index[error["index"]]
+                image_path, _, key = items[i]
+                existing = (
+                    await GalleryImage.find_one(GalleryImage.client_operation_id == key) if key else None
+                )
+                if not existing:
+                    raise
+                duplicates.append(image_path)
+                results[i] = (existing, False)
+
+    if duplicates:
+        await release_media(duplicates)
+    for gi, created in results:
+        if created:
+            schedule_variants(GalleryImage, gi.id, [gi.image_path])
+    return results
+
 async def delete_gallery_image(*, gallery_image_id: str, patient_id: str, doctor_id: str | None = None) -> bool:
     """حذف صورة من المعرض. يتحقق من أن الصورة تخص المريض المحدد."""
     try:
@@ -789,6 +946,7 @@ async def delete_gallery_image(*, gallery_image_id: str, patient_id: str, doctor
                 raise HTTPException(status_code=403, detail="Not your gallery image")
 
         await gi.delete()
+        await release_media([gi.image_path], _variant_urls(gi))
 
         # لا نربط حذف الصورة بآلية تفعيل المرضى.
         if doctor_id:
@@ -838,6 +996,11 @@ async def create_appointment(
     await ap.insert()
 
     await patient.save()
+    schedule_variants(Appointment, ap.id, ap.image_paths)
+
+    from app.services.appointment_reminder_service import sync_appointment_reminders
+
+    await sync_appointment_reminders(ap)
 
     # Notify patient about new appointment (push + in-app)
     try:
@@ -1065,6 +1228,19 @@ async def delete_appointment(*, appointment_id: str, patient_id: str, doctor_id:
 
         await appointment.delete()
 
+        # صور الموعد مخزّنة عبر media_blobs: نحرر مراجعها مثل حذف السجل العلاجي
+        try:
+            await release_media(_image_urls(appointment), _variant_urls(appointment))
+        except Exception as e:
+            print(f"Failed to release media for appointment {appointment_id}: {e}")
+
+        from app.services.appointment_reminder_service import cancel_appointment_reminders
+
+        try:
+            await cancel_appointment_reminders(appointment.id)
+        except Exception as e:
+            print(f"Failed to cancel reminders for appointment {appointment_id}: {e}")
+
         # لا نربط حذف الموعد بآلية تفعيل المرضى.
         try:
             patient = await Patient.get(OID(patient_id))
@@ -1116,6 +1292,10 @@ async def update_appointment_status(
         appointment.updated_at = datetime.now(timezone.utc)
         await appointment.save()
 
+        from app.services.appointment_reminder_service import sync_appointment_reminders
+
+        await sync_appointment_reminders(appointment)
+
         if patient:
             await patient.save()
 
@@ -1155,7 +1335,10 @@ async def update_appointment_datetime(
         appointment.scheduled_at = scheduled_at
         appointment.updated_at = datetime.now(timezone.utc)
 
-        from app.services.appointment_reminder_service import reset_appointment_reminder_flags
+        from app.services.appointment_reminder_service import (
+            reset_appointment_reminder_flags,
+            sync_appointment_reminders,
+        )
 
         reset_appointment_reminder_flags(appointment)
         
@@ -1163,6 +1346,7 @@ async def update_appointment_datetime(
         appointment.status = _normalize_appointment_status(appointment.status)
 
         await appointment.save()
+        await sync_appointment_reminders(appointment)
 
         # لا نربط تعديل الموعد بآلية تفعيل المرضى.
         if patient:
@@ -1307,40 +1491,17 @@ async def list_gallery_for_patient_public(
     صور المعرض كما يراها المريض.
 
     - لا نعرض الصور التي رفعها الأطباء أو موظفو الاستقبال.
-    - حاليًا نسمح فقط بصور المصوّر (PHOTOGRAPHER)، ويمكن توسيعها لاحقًا.
+    - ولا الصور مجهولة الرافع (uploaded_by_role فارغ).
+    - استعلام واحد مع pagination على الفهرس (patient_id, uploaded_by_role, created_at).
     """
     skip, limit = _normalize_pagination(skip, limit)
-    pid = OID(patient_id)
-    # جميع الصور للمريض
-    images = await GalleryImage.find(GalleryImage.patient_id == pid).sort("-created_at").to_list()
-    if not images:
-        return []
-
-    # جمع معرّفات الرافعين
-    uploader_ids = {img.uploaded_by_user_id for img in images if img.uploaded_by_user_id}
-    if not uploader_ids:
-        return []
-
-    users = await User.find(In(User.id, list(uploader_ids))).to_list()
-    user_map: dict[OID, User] = {u.id: u for u in users}
-
-    allowed: list[GalleryImage] = []
-    for img in images:
-        u = user_map.get(img.uploaded_by_user_id)
-        if not u:
-            continue
-        # المريض لا يرى صور الأطباء أو الاستقبال
-        if u.role in (Role.DOCTOR, Role.RECEPTIONIST):
-            continue
-        # يسمح حاليًا بصور المصوّر أو أدوار أخرى غير الطبيب/الاستقبال
-        allowed.append(img)
-
-    # تطبيق الـ pagination بعد الفلترة
-    if skip:
-        allowed = allowed[skip:]
+    query = GalleryImage.find(
+        GalleryImage.patient_id == OID(patient_id),
+        NotIn(GalleryImage.uploaded_by_role, [Role.DOCTOR, Role.RECEPTIONIST, None]),
+    ).sort("-created_at").skip(skip)
     if limit is not None:
-        allowed = allowed[:limit]
-    return allowed
+        query = query.limit(limit)
+    return await query.to_list()
 
 
 async def list_gallery_for_doctor_view(
@@ -1363,41 +1524,45 @@ async def list_gallery_for_doctor_view(
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid id format: {e}")
 
-    # 1) صور هذا الطبيب
-    doctor_images = await GalleryImage.find(
+    query = GalleryImage.find(
         GalleryImage.patient_id == pid,
-        GalleryImage.doctor_id == did,
-    ).to_list()
-
-    # 2) صور الاستقبال (نحددهم عبر دور المستخدم)
-    receptionist_users = await User.find(User.role == Role.RECEPTIONIST).to_list()
-    rec_ids = [u.id for u in receptionist_users]
-    receptionist_images: list[GalleryImage] = []
-    if rec_ids:
-        receptionist_images = await GalleryImage.find(
-            GalleryImage.patient_id == pid,
-            In(GalleryImage.uploaded_by_user_id, rec_ids),
-        ).to_list()
+        Or(
+            GalleryImage.doctor_id == did,
+            GalleryImage.uploaded_by_role == Role.RECEPTIONIST,
+        ),
+    ).sort("-created_at").skip(skip)
+    if limit is not None:
+        query = query.limit(limit)
+    return await query.to_list()
 
-    combined = doctor_images + receptionist_images
-    # إزالة التكرارات إن وجدت
-    seen: set[str] = set()
-    unique: list[GalleryImage] = []
-    for img in combined:
-        key = str(img.id)
-        if key in seen:
-            continue
-        seen.add(key)
-        unique.append(img)
 
-    # ترتيب تنازلي حسب created_at
-    unique.sort(key=lambda x: x.created_at or datetime.now(timezone.utc), reverse=True)
+async def backfill_gallery_uploader_roles() -> int:
+    """
+    تعبئة uploaded_by_role للصور القديمة من دور المستخدم الرافع الحالي.
+    الصور التي لا يوجد رافعها تبقى بدون دور (لا تظهر للمريض ولا للطبيب كما سابقاً).
+    آمن لإعادة التشغيل (idempotent).
+    """
+    collection = GalleryImage.get_motor_collection()
+    missing = {"uploaded_by_role": {"$exists": False}}
+    uploader_ids = await collection.distinct(
+        "uploaded_by_user_id", {**missing, "uploaded_by_user_id": {"$ne": None}}
+    )
+    if not uploader_ids:
+        return 0
 
-    if skip:
-        unique = unique[skip:]
-    if limit is not None:
-        unique = unique[:limit]
-    return unique
+    ids_by_role: defaultdict[str, list] = defaultdict(list)
+    async for user in User.get_motor_collection().find({"_id": {"$in": uploader_ids}}, {"role": 1}):
+        if user.get("role"):
+            ids_by_role[user["role"]].append(user["_id"])
+
+    updated = 0
+    for role, ids in ids_by_role.items():
+        result = await collection.update_many(
+            {**missing, "uploaded_by_user_id": {"$in": ids}},
+            {"$set": {"uploaded_by_role": role}},
+        )
+        updated += result.modified_count
+    return updated
 
 
 async def list_gallery_for_patient_by_uploader(
@@ -1,14 +1,36 @@
-"""HTTP heartbeat presence for doctors (works when WebSocket/nginx upgrade fails)."""
+"""HTTP heartbeat presence for doctors (works when WebSocket/nginx upgrade fails).
 
+Heartbeats are recorded in memory and written behind to Mongo: a background
+task upserts the dirty rows in one bulk_write every PRESENCE_FLUSH_SECONDS and,
+in the same pass, reloads the recent rows written by other workers. Presence
+queries are answered from memory; Mongo is only read directly on a cold start.
+"""
+
+import asyncio
 from datetime import datetime, timedelta, timezone
 
 from beanie import PydanticObjectId as OID
+from pymongo import UpdateOne
 
+from app.config import get_settings
 from app.models.presence import DoctorPresence
+from app.utils.logger import get_logger
+
+settings = get_settings()
+logger = get_logger("presence")
 
 # Doctor is online if a heartbeat arrived within this window.
 ONLINE_TTL = timedelta(seconds=75)
 
+# user_id -> last heartbeat seen by this worker
+_local_heartbeats: dict[str, datetime] = {}
+# user_id -> heartbeat not yet flushed to Mongo
+_dirty: dict[str, datetime] = {}
+# user_id -> last_seen_at of recent rows in Mongo (all workers), None until loaded
+_shared_heartbeats: dict[str, datetime] | None = None
+
+_flush_task: asyncio.Task | None = None
+
 
 def _utcnow() -> datetime:
     return datetime.now(timezone.utc)
@@ -21,44 +43,105 @@ def _as_utc(value: datetime) -> datetime:
 
 
 async def touch_doctor_presence(user_id: str) -> None:
-    """Record that the doctor's desktop app is open."""
-    oid = OID(user_id)
+    """Record that the doctor's desktop app is open (no DB round-trip)."""
+    key = str(OID(user_id))
     now = _utcnow()
-    existing = await DoctorPresence.find_one(DoctorPresence.user_id == oid)
-    if existing:
-        existing.last_seen_at = now
-        await existing.save()
-        return
-    await DoctorPresence(user_id=oid, last_seen_at=now).insert()
+    _local_heartbeats[key] = now
+    _dirty[key] = now
+
+
+async def _load_shared_heartbeats() -> dict[str, datetime]:
+    global _shared_heartbeats
+    cutoff = _utcnow() - ONLINE_TTL
+    rows = await DoctorPresence.get_motor_collection().find(
+        {"last_seen_at": {"$gte": cutoff}}, {"user_id": 1, "last_seen_at": 1}
+    ).to_list(None)
+    _shared_heartbeats = {str(r["user_id"]): _as_utc(r["last_seen_at"]) for r in rows}
+    return _shared_heartbeats
+
+
+async def flush_presence() -> int:
+    """Upsert pending heartbeats in one bulk_write and refresh the shared view."""
+    pending = dict(_dirty)
+    if pending:
+        ops = [
+            UpdateOne(
+                {"user_id": OID(user_id)},
+                {"$max": {"last_seen_at": seen_at}},
+                upsert=True,
+            )
+            for user_id, seen_at in pending.items()
+        ]
+        await DoctorPresence.get_motor_collection().bulk_write(ops, ordered=False)
+        for user_id, seen_at in pending.items():
+            if _dirty.get(user_id) == seen_at:
+                _dirty.pop(user_id, None)
+
+    cutoff = _utcnow() - ONLINE_TTL
+    for user_id in [u for u, seen in _local_heartbeats.items() if seen < cutoff]:
+        _local_heartbeats.pop(user_id, None)
+    await _load_shared_heartbeats()
+    return len(pending)
+
+
+async def _flush_forever() -> None:
+    while True:
+        await asyncio.sleep(settings.PRESENCE_FLUSH_SECONDS)
+        try:
+            await flush_presence()
+        except Exception as exc:
+            logger.warning("Presence flush failed: %s", exc)
+
+
+def start_presence_flush() -> None:
+    """Start the periodic write-behind flush (called from app startup)."""
+    global _flush_task
+    if _flush_task is None or _flush_task.done():
+        _flush_task = asyncio.create_task(_flush_forever())
+
+
+async def stop_presence_flush() -> None:
+    """Stop the flush loop and write out whatever is still pending."""
+    global _flush_task
+    if _flush_task is not None:
+        _flush_task.cancel()
+        _flush_task = None
+    if _dirty:
+        try:
+            await flush_presence()
+        except Exception as exc:
+            logger.warning("Final presence flush failed: %s", exc)
+
+
+async def _heartbeat_online_user_ids() -> set[str]:
+    shared = _shared_heartbeats
+    if shared is None:
+        # Cold start: nothing flushed/loaded yet on this worker.
+        shared = await _load_shared_heartbeats()
+    cutoff = _utcnow() - ONLINE_TTL
+    online = {user_id for user_id, seen in shared.items() if seen >= cutoff}
+    online.update(user_id for user_id, seen in _local_heartbeats.items() if seen >= cutoff)
+    return online
 
 
 async def is_user_online(user_id: str) -> bool:
     """True if doctor has a live socket OR a recent HTTP heartbeat."""
     from app.services.socket_service import is_socket_online
 
-    if is_socket_online(user_id):
+    if await is_socket_online(user_id):
         return True
 
     try:
-        oid = OID(user_id)
+        key = str(OID(user_id))
     except Exception:
         return False
-
-    doc = await DoctorPresence.find_one(DoctorPresence.user_id == oid)
-    if not doc or not doc.last_seen_at:
-        return False
-    return (_utcnow() - _as_utc(doc.last_seen_at)) <= ONLINE_TTL
+    return key in await _heartbeat_online_user_ids()
 
 
 async def get_online_doctor_user_ids() -> list[str]:
     """Union of socket-online and heartbeat-online doctor user ids."""
     from app.services.socket_service import get_socket_online_doctor_user_ids
 
-    online: set[str] = set(get_socket_online_doctor_user_ids())
-    cutoff = _utcnow() - ONLINE_TTL
-    docs = await DoctorPresence.find(
-        DoctorPresence.last_seen_at >= cutoff
-    ).to_list()
-    for doc in docs:
-        online.add(str(doc.user_id))
+    online: set[str] = set(await get_socket_online_doctor_user_ids())
+    online.update(await _heartbeat_online_user_ids())
     return sorted(online)
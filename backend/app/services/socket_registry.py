@@ -0,0 +1,219 @@
+"""
+سجل اتصالات Socket.IO المشترك بين العمّال (workers / replicas).
+
+كل عامل يحتفظ ببيانات sockets الخاصة به محلياً (socket_users / socket_rooms)،
+لكن "من متصل الآن؟" يجب أن يكون صحيحاً على مستوى الكلاستر، لذلك يُخزَّن في
+سجل مشترك مع TTL:
+- LocalSocketRegistry: في الذاكرة — لعملية واحدة (dev) وللاختبارات.
+- RedisSocketRegistry: Redis (أو متوافق) — عند تشغيل عدة workers.
+
+كل socket له وقت انتهاء يُجدَّد دورياً من العامل الذي يملكه؛ إذا توقف العامل
+فجأة تنتهي صلاحية اتصالاته تلقائياً بدل أن يبقى الطبيب "متصلاً" للأبد.
+"""
+from __future__ import annotations
+
+import time
+from abc import ABC, abstractmethod
+from typing import Iterable
+
+from app.config import get_settings
+from app.utils.logger import get_logger
+
+logger = get_logger("socket_registry")
+settings = get_settings()
+
+# (sid, user_id, role)
+SocketEntry = tuple[str, str, str | None]
+
+
+class SocketRegistry(ABC):
+    """Interface for the cluster-wide connection/presence registry."""
+
+    def __init__(self, ttl_seconds: int) -> None:
+        self.ttl_seconds = ttl_seconds
+
+    @abstractmethod
+    async def add(self, sid: str, user_id: str, role: str | None) -> None:
+        ...
+
+    @abstractmethod
+    async def remove(self, sid: str, user_id: str, role: str | None) -> bool:
+        """Forget a socket. Returns True if the user still has other live sockets."""
+
+    @abstractmethod
+    async def refresh(self, entries: Iterable[SocketEntry]) -> None:
+        """Extend the TTL of sockets owned by this worker."""
+
+    @abstractmethod
+    async def is_online(self, user_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def online_user_ids(self, role: str) -> list[str]:
+        ...
+
+
+class LocalSocketRegistry(SocketRegistry):
+    """In-process stand-in with the same TTL semantics as the Redis backend."""
+
+    def __init__(self, ttl_seconds: int) -> None:
+        super().__init__(ttl_seconds)
+        # user_id -> {sid: expires_at}
+        self._user_sockets: dict[str, dict[str, float]] = {}
+        self._user_roles: dict[str, str | None] = {}
+        # role -> user_ids with live sockets, kept up to date on add/remove so
+        # online_user_ids() never scans every connection.
+        self._role_users: dict[str | None, set[str]] = {}
+
+    def _track(self, user_id: str, role: str | None) -> None:
+        previous = self._user_roles.get(user_id)
+        if previous != role and previous is not None:
+            self._role_users.get(previous, set()).discard(user_id)
+        self._user_roles[user_id] = role
+        self._role_users.setdefault(role, set()).add(user_id)
+
+    def _forget(self, user_id: str) -> None:
+        self._user_sockets.pop(user_id, None)
+        role = self._user_roles.pop(user_id, None)
+        self._role_users.get(role, set()).discard(user_id)
+
+    def _live_sockets(self, user_id: str, now: float) -> dict[str, float]:
+        sockets = self._user_sockets.get(user_id)
+        if not sockets:
+            self._forget(user_id)
+            return {}
+        for sid in [s for s, exp in sockets.items() if exp <= now]:
+            sockets.pop(sid, None)
+        if not sockets:
+            self._forget(user_id)
+            return {}
+        return sockets
+
+    async def add(self, sid: str, user_id: str, role: str | None) -> None:
+        self._user_sockets.setdefault(user_id, {})[sid] = time.time() + self.ttl_seconds
+        self._track(user_id, role)
+
+    async def remove(self, sid: str, user_id: str, role: str | None) -> bool:
+        sockets = self._user_sockets.get(user_id)
+        if sockets:
+            sockets.pop(sid, None)
+        return bool(self._live_sockets(user_id, time.time()))
+
+    async def refresh(self, entries: Iterable[SocketEntry]) -> None:
+        expires = time.time() + self.ttl_seconds
+        for sid, user_id, role in entries:
+            self._user_sockets.setdefault(user_id, {})[sid] = expires
+            self._track(user_id, role)
+
+    async def is_online(self, user_id: str) -> bool:
+        return bool(self._live_sockets(user_id, time.time()))
+
+    async def online_user_ids(self, role: str) -> list[str]:
+        now = time.time()
+        return [
+            user_id
+            for user_id in list(self._role_users.get(role, ()))
+            if self._live_sockets(user_id, now)
+        ]
+
+
+class RedisSocketRegistry(SocketRegistry):
+    """Redis-backed registry.
+
+    Keys:
+      {prefix}:user:{user_id}  ZSET sid -> expires_at
+      {prefix}:role:{role}     ZSET user_id -> expires_at
+    """
+
+    def __init__(self, url: str, ttl_seconds: int, prefix: str = "sio") -> None:
+        super().__init__(ttl_seconds)
+        import redis.asyncio as redis_asyncio
+
+        self._redis = redis_asyncio.from_url(url, decode_responses=True)
+        self._prefix = prefix
+
+    def _user_key(self, user_id: str) -> str:
+        return f"{self._prefix}:user:{user_id}"
+
+    def _role_key(self, role: str | None) -> str:
+        return f"{self._prefix}:role:{role or 'unknown'}"
+
+    async def add(self, sid: str, user_id: str, role: str | None) -> None:
+        expires = time.time() + self.ttl_seconds
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.zadd(self._user_key(user_id), {sid: expires})
+        pipe.expire(self._user_key(user_id), self.ttl_seconds)
+        pipe.zadd(self._role_key(role), {user_id: expires})
+        await pipe.execute()
+
+    async def remove(self, sid: str, user_id: str, role: str | None) -> bool:
+        user_key = self._user_key(user_id)
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.zrem(user_key, sid)
+        pipe.zremrangebyscore(user_key, "-inf", time.time())
+        pipe.zcard(user_key)
+        _, _, remaining = await pipe.execute()
+        if not remaining:
+            await self._redis.zrem(self._role_key(role), user_id)
+            return False
+        return True
+
+    async def refresh(self, entries: Iterable[SocketEntry]) -> None:
+        expires = time.time() + self.ttl_seconds
+        pipe = self._redis.pipeline(transaction=False)
+        count = 0
+        for sid, user_id, role in entries:
+            pipe.zadd(self._user_key(user_id), {sid: expires})
+            pipe.expire(self._user_key(user_id), self.ttl_seconds)
+            pipe.zadd(self._role_key(role), {user_id: expires})
+            count += 1
+        if count:
+            await pipe.execute()
+
+    async def is_online(self, user_id: str) -> bool:
+        return bool(await self._redis.zcount(self._user_key(user_id), time.time(), "+inf"))
+
+    async def online_user_ids(self, role: str) -> list[str]:
+        role_key = self._role_key(role)
+        now = time.time()
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.zremrangebyscore(role_key, "-inf", now)
+        pipe.zrangebyscore(role_key, now, "+inf")
+        _, user_ids = await pipe.execute()
+        return list(user_ids)
+
+
+def _is_redis_url(url: str | None) -> bool:
+    return bool(url) and url.split("://", 1)[0] in ("redis", "rediss", "unix")
+
+
+def build_socket_registry() -> SocketRegistry:
+    """Pick the registry backend from SOCKETIO_MESSAGE_QUEUE."""
+    ttl = settings.SOCKET_PRESENCE_TTL_SECONDS
+    url = settings.SOCKETIO_MESSAGE_QUEUE
+    if _is_redis_url(url):
+        return RedisSocketRegistry(url, ttl)
+    if url:
+        logger.warning(
+            "SOCKETIO_MESSAGE_QUEUE=%s is not Redis — presence registry stays process-local",
+            url.split("://", 1)[0],
+        )
+    return LocalSocketRegistry(ttl)
+
+
+def build_client_manager():
+    """Socket.IO pub/sub client manager so emits reach sockets on every worker.
+
+    None keeps python-socketio's default in-memory manager (single process).
+    """
+    url = settings.SOCKETIO_MESSAGE_QUEUE
+    if not url:
+        return None
+    import socketio
+
+    scheme = url.split("://", 1)[0]
+    if _is_redis_url(url):
+        return socketio.AsyncRedisManager(url)
+    if scheme in ("amqp", "amqps"):
+        return socketio.AsyncAioPikaManager(url)
+    raise ValueError(f"Unsupported SOCKETIO_MESSAGE_QUEUE scheme: {scheme}")
@@ -1,82 +1,319 @@
 """
 Socket.IO service for real-time chat communication.
+
+Cross-worker delivery goes through the pub/sub client manager selected by
+SOCKETIO_MESSAGE_QUEUE, and "who is online" lives in the shared
+socket_registry. socket_users / socket_rooms only describe sockets owned by
+this process.
+
+Room authorization is checked once, when a socket joins a room, and cached
+in socket_rooms so chat events don't re-read the ChatRoom. A cache entry is
+only trusted while the socket is still in the Socket.IO room;
+invalidate_room_access() closes the room cluster-wide when membership changes.
+
+Doctor presence is fanned out only to staff and to the doctor's own patients,
+and a disconnect is announced after a short grace window so flapping
+connections don't spam presence_changed.
 """
+import asyncio
+import time
 import socketio
-from typing import Dict, Set
+from typing import Dict, Iterable
 from beanie import PydanticObjectId as OID
+from beanie.operators import In
 from app.models import User, Patient, Doctor, ChatRoom, ChatMessage
 from app.constants import Role
-from app.utils.chat_helpers import ensure_chat_room_user_ids, get_chat_room
+from app.utils.chat_helpers import (
+    ensure_chat_room_user_ids,
+    get_chat_room,
+    mark_room_read,
+    record_room_message,
+    record_room_message_edit,
+)
+from app.services.socket_registry import build_client_manager, build_socket_registry
 from jose import jwt, JWTError
 from app.config import get_settings
+from app.utils.logger import get_logger
 
 settings = get_settings()
+logger = get_logger("socket")
 
 # Create Socket.IO server
 sio = socketio.AsyncServer(
+    client_manager=build_client_manager(),
     cors_allowed_origins="*",
     async_mode='asgi',
     logger=True,
     engineio_logger=True
 )
 
-# Store active connections: userId -> Set of socketIds
-active_connections: Dict[str, Set[str]] = {}
+# Cluster-wide connection/presence registry (userId -> live socketIds with TTL)
+registry = build_socket_registry()
+
+
+class RoomAccess:
+    """Authorized room membership cached on a socket after a successful join."""
+
+    __slots__ = ("id", "doctor_id", "patient_id", "doctor_user_id", "patient_user_id", "role")
+
+    def __init__(self, room: ChatRoom, role: str):
+        self.id = room.id
+        self.doctor_id = room.doctor_id
+        self.patient_id = room.patient_id
+        self.doctor_user_id = room.doctor_user_id
+        self.patient_user_id = room.patient_user_id
+        self.role = role
+
+
+# Store socket rooms: socketId -> {roomId: RoomAccess} (sockets owned by this worker)
+socket_rooms: Dict[str, Dict[str, RoomAccess]] = {}
+
+
+class SocketSession:
+    """What a socket needs to know about its user, taken from the JWT claims."""
+
+    __slots__ = ("user_id", "role", "name")
+
+    def __init__(self, user_id: OID, role: Role, name: str | None):
+        self.user_id = user_id
+        self.role = role
+        self.name = name
+
+
+# Store user session per socket: socketId -> SocketSession (sockets owned by this worker)
+socket_users: Dict[str, SocketSession] = {}
+
+# user_id -> (expires_at, SocketSession) for the optional user lookup on connect
+_session_cache: Dict[str, tuple[float, SocketSession]] = {}
+
+_registry_refresh_task: asyncio.Task | None = None
+
+# Doctor presence changes go to staff (every non-patient role) through this
+# room; patients only join presence_{doctor_user_id} for their own doctors.
+PRESENCE_STAFF_ROOM = "presence_staff"
+
+# user_id -> pending offline broadcast (debounced by SOCKET_PRESENCE_GRACE_SECONDS)
+_pending_offline: Dict[str, asyncio.Task] = {}
+
+
+async def is_socket_online(user_id: str) -> bool:
+    """Return True if the user has at least one active Socket.IO connection on any worker."""
+    return await registry.is_online(user_id)
+
+
+# Backward-compatible alias (socket-only check).
+async def is_user_online(user_id: str) -> bool:
+    return await is_socket_online(user_id)
+
+
+async def get_socket_online_doctor_user_ids() -> list[str]:
+    """Return user_ids of doctors that currently have an active socket on any worker."""
+    return await registry.online_user_ids(Role.DOCTOR.value)
+
+
+async def _refresh_registry_forever() -> None:
+    """Keep this worker's sockets alive in the shared registry."""
+    interval = max(registry.ttl_seconds / 3, 1)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await registry.refresh(
+                (sid, str(session.user_id), session.role.value)
+                for sid, session in list(socket_users.items())
+            )
+        except Exception as exc:
+            logger.warning("Socket registry refresh failed: %s", exc)
+
 
-# Store socket rooms: socketId -> Set of roomIds
-socket_rooms: Dict[str, Set[str]] = {}
+def start_registry_refresh() -> None:
+    """Start the periodic TTL refresh (called from app startup)."""
+    global _registry_refresh_task
+    if _registry_refresh_task is None or _registry_refresh_task.done():
+        _registry_refresh_task = asyncio.create_task(_refresh_registry_forever())
 
-# Store user data per socket: socketId -> user_data
-socket_users: Dict[str, dict] = {}
 
+def stop_registry_refresh() -> None:
+    global _registry_refresh_task
+    if _registry_refresh_task is not None:
+        _registry_refresh_task.cancel()
+        _registry_refresh_task = None
 
-def is_socket_online(user_id: str) -> bool:
-    """Return True if the user has at least one active Socket.IO connection."""
-    sockets = active_connections.get(user_id)
-    return bool(sockets)
 
+def _presence_watch_room(doctor_user_id: str) -> str:
+    """Room of patients watching one doctor's presence."""
+    return f"presence_{doctor_user_id}"
 
-# Backward-compatible alias (sync socket-only check).
-def is_user_online(user_id: str) -> bool:
-    return is_socket_online(user_id)
 
+async def _watched_doctor_user_ids(user: SocketSession) -> list[str]:
+    """Doctor user ids assigned to any patient profile of this (patient) account."""
+    doctor_ids: set[OID] = set()
+    async for patient in Patient.find(Patient.user_id == user.user_id):
+        doctor_ids.update(patient.doctor_ids or [])
+    if not doctor_ids:
+        return []
+    doctors = await Doctor.find(In(Doctor.id, list(doctor_ids))).to_list()
+    return [str(d.user_id) for d in doctors if d.user_id]
 
-def get_socket_online_doctor_user_ids() -> list[str]:
-    """Return user_ids of doctors that currently have an active socket."""
-    online: list[str] = []
-    for user_id, sockets in active_connections.items():
-        if not sockets:
-            continue
-        role = None
-        for sid in sockets:
-            data = socket_users.get(sid)
-            if data:
-                role = data.get("role")
-                break
-        if role == Role.DOCTOR.value:
-            online.append(user_id)
-    return online
+
+async def _join_presence_rooms(sid: str, user: SocketSession, role: str | None) -> list[str] | None:
+    """
+    Staff join PRESENCE_STAFF_ROOM; a patient joins one watch room per assigned
+    doctor. Returns the watched doctor user ids for patients (None for staff).
+    """
+    if role == Role.PATIENT.value:
+        watched = await _watched_doctor_user_ids(user)
+        for doctor_user_id in watched:
+            await sio.enter_room(sid, _presence_watch_room(doctor_user_id))
+        return watched
+    await sio.enter_room(sid, PRESENCE_STAFF_ROOM)
+    return None
 
 
 async def _broadcast_doctor_presence(user_id: str, is_online: bool) -> None:
-    """Notify all connected clients when a doctor goes online/offline."""
+    """Notify staff and the doctor's patients when a doctor goes online/offline."""
     await sio.emit(
         "presence_changed",
         {"user_id": user_id, "is_online": is_online},
+        room=[PRESENCE_STAFF_ROOM, _presence_watch_room(user_id)],
     )
 
 
-async def _emit_presence_snapshot(sid: str) -> None:
-    """Send current online doctors to a newly connected receptionist/doctor."""
+async def _broadcast_offline_after_grace(user_id: str) -> None:
+    try:
+        await asyncio.sleep(settings.SOCKET_PRESENCE_GRACE_SECONDS)
+        # The doctor may have reconnected to another worker meanwhile.
+        if not await is_socket_online(user_id):
+            await _broadcast_doctor_presence(user_id, False)
+    except asyncio.CancelledError:
+        raise
+    except Exception as exc:
+        logger.warning("Offline presence broadcast failed for %s: %s", user_id, exc)
+    finally:
+        if _pending_offline.get(user_id) is asyncio.current_task():
+            _pending_offline.pop(user_id, None)
+
+
+def _schedule_offline_broadcast(user_id: str) -> None:
+    """Debounce: announce offline only if the doctor stays away for the grace window."""
+    pending = _pending_offline.pop(user_id, None)
+    if pending is not None:
+        pending.cancel()
+    _pending_offline[user_id] = asyncio.create_task(_broadcast_offline_after_grace(user_id))
+
+
+async def _emit_presence_snapshot(sid: str, watched: list[str] | None = None) -> None:
+    """Send current online doctors to a newly connected client (patients: their doctors only)."""
     from app.services.presence_service import get_online_doctor_user_ids
 
+    online = await get_online_doctor_user_ids()
+    if watched is not None:
+        watched_set = set(watched)
+        online = [user_id for user_id in online if user_id in watched_set]
     await sio.emit(
         "presence_snapshot",
-        {"online_user_ids": await get_online_doctor_user_ids()},
+        {"online_user_ids": online},
         room=sid,
     )
 
 
+def _can_access_room(user: SocketSession, room: ChatRoom | RoomAccess) -> bool:
+    if user.role == Role.DOCTOR:
+        return room.doctor_user_id == user.user_id
+    if user.role == Role.PATIENT:
+        return room.patient_user_id == user.user_id
+    return False
+
+
+async def _cache_room_access(sid: str, room: ChatRoom, role: str) -> RoomAccess:
+    """Enter the Socket.IO room and remember the authorized membership."""
+    await sio.enter_room(sid, f"room_{room.id}")
+    access = RoomAccess(room, role)
+    socket_rooms.setdefault(sid, {})[str(room.id)] = access
+    return access
+
+
+async def _authorize_room(sid: str, user: SocketSession, room_id: str) -> RoomAccess | ChatRoom | None:
+    """
+    Resolve room access for a chat event.
+
+    Uses the membership cached on join while the socket is still in the room;
+    otherwise falls back to loading the ChatRoom (emitting the error itself).
+    """
+    access = socket_rooms.get(sid, {}).get(room_id)
+    if access is not None:
+        if f"room_{room_id}" in sio.rooms(sid):
+            return access
+        # The room was closed by invalidate_room_access() (maybe on another worker).
+        socket_rooms[sid].pop(room_id, None)
+
+    try:
+        room = await ChatRoom.get(OID(room_id))
+    except Exception:
+        room = None
+    if not room:
+        await sio.emit('error', {'message': 'المحادثة غير موجودة', 'code': 'E404'}, room=sid)
+        return None
+
+    room = await ensure_chat_room_user_ids(room)
+    if not _can_access_room(user, room):
+        await sio.emit('error', {'message': 'غير مصرح', 'code': 'E403'}, room=sid)
+        return None
+    return room
+
+
+async def invalidate_room_access(room_ids: Iterable[OID | str]) -> None:
+    """
+    Drop cached authorization for rooms whose membership changed (patient
+    transfer, doctor removal, deleted patient). Sockets are removed from the
+    Socket.IO room on every worker and must re-join to keep chatting.
+    """
+    for room_id in {str(rid) for rid in room_ids}:
+        room_key = f"room_{room_id}"
+        try:
+            await sio.emit('left_conversation', {'room_id': room_id}, room=room_key)
+            await sio.close_room(room_key)
+        except Exception as e:
+            logger.warning("Failed to close socket room %s: %s", room_key, e)
+        for rooms in socket_rooms.values():
+            rooms.pop(room_id, None)
+
+
+async def _lookup_session(user_id: OID) -> SocketSession | None:
+    """Load the user once and cache the compact session for SOCKET_USER_CACHE_SECONDS."""
+    key = str(user_id)
+    cached = _session_cache.get(key)
+    now = time.monotonic()
+    if cached and cached[0] > now:
+        return cached[1]
+    user = await User.get(user_id)
+    if not user:
+        _session_cache.pop(key, None)
+        return None
+    session = SocketSession(user.id, Role(user.role), user.name)
+    _session_cache[key] = (now + settings.SOCKET_USER_CACHE_SECONDS, session)
+    return session
+
+
+async def _session_from_claims(payload: dict) -> SocketSession | None:
+    """
+    Build the socket session from signed JWT claims (sub, role, name).
+    Falls back to a cached user lookup for tokens without role/name claims,
+    or always when SOCKET_VERIFY_USER is enabled.
+    """
+    try:
+        user_id = OID(payload.get("sub"))
+    except Exception:
+        return None
+    role_claim = payload.get("role")
+    if settings.SOCKET_VERIFY_USER or not role_claim or "name" not in payload:
+        return await _lookup_session(user_id)
+    try:
+        role = Role(role_claim)
+    except ValueError:
+        return None
+    return SocketSession(user_id, role, payload.get("name"))
+
+
 @sio.on('connect')
 async def connect(sid: str, environ: dict, auth: dict):
     """Handle socket connection with authentication."""
@@ -95,42 +332,35 @@ async def connect(sid: str, environ: dict, auth: dict):
             await sio.disconnect(sid)
             return False
         
-        # Decode JWT
+        # Decode JWT — the signed claims are enough to authorize the socket
         payload = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
-        user_id_str = payload.get("sub")
-        if not user_id_str:
-            print(f"❌ Connection rejected for {sid}: No user ID in token")
-            await sio.disconnect(sid)
-            return False
-        
-        user_id = OID(user_id_str)
-        user = await User.get(user_id)
+        user = await _session_from_claims(payload)
         if not user:
-            print(f"❌ Connection rejected for {sid}: User not found")
+            print(f"❌ Connection rejected for {sid}: Invalid token claims or user not found")
             await sio.disconnect(sid)
             return False
         
-        # Store user data
-        socket_users[sid] = {
-            'user_id': str(user.id),
-            'user': user,
-            'role': payload.get("role")
-        }
+        socket_users[sid] = user
         
         # Track active connection
-        user_id_key = str(user.id)
-        role = payload.get("role")
-        was_online = is_socket_online(user_id_key)
-        if user_id_key not in active_connections:
-            active_connections[user_id_key] = set()
-        active_connections[user_id_key].add(sid)
-        socket_rooms[sid] = set()
+        user_id_key = str(user.user_id)
+        role = user.role.value
+        was_online = await is_socket_online(user_id_key)
+        await registry.add(sid, user_id_key, role)
+        socket_rooms[sid] = {}
         
         # Join user's personal room
         await sio.enter_room(sid, f"user_{user_id_key}")
         
+        watched = await _join_presence_rooms(sid, user, role)
+        
         print(f"✅ User connected: {user_id_key} ({user.name}) - Socket: {sid}")
-        if role == Role.DOCTOR.value and not was_online:
+        # A reconnect inside the grace window cancels the pending offline
+        # broadcast; clients never saw the doctor leave, so nothing to announce.
+        pending_offline = _pending_offline.pop(user_id_key, None)
+        if pending_offline is not None:
+            pending_offline.cancel()
+        if role == Role.DOCTOR.value and not was_online and pending_offline is None:
             await _broadcast_doctor_presence(user_id_key, True)
         # Patients / reception / doctors need the current online roster.
         if role in (
@@ -138,7 +368,7 @@ async def connect(sid: str, environ: dict, auth: dict):
             Role.RECEPTIONIST.value,
             Role.PATIENT.value,
         ):
-            await _emit_presence_snapshot(sid)
+            await _emit_presence_snapshot(sid, watched)
         return True
     except Exception as e:
         print(f"❌ Connection error for {sid}: {e}")
@@ -150,17 +380,17 @@ async def connect(sid: str, environ: dict, auth: dict):
 async def disconnect(sid: str):
     """Handle socket disconnection."""
     # Get user data
-    user_data = socket_users.pop(sid, None)
-    user_id = user_data.get('user_id') if user_data else None
-    role = user_data.get('role') if user_data else None
+    session = socket_users.pop(sid, None)
+    user_id = str(session.user_id) if session else None
+    role = session.role.value if session else None
     
     # Remove from active connections
     still_online = False
-    if user_id and user_id in active_connections:
-        active_connections[user_id].discard(sid)
-        still_online = bool(active_connections[user_id])
-        if not still_online:
-            active_connections.pop(user_id, None)
+    if user_id:
+        try:
+            still_online = await registry.remove(sid, user_id, role)
+        except Exception as e:
+            print(f"⚠️ Failed to remove socket {sid} from registry: {e}")
     
     # Remove socket rooms
     socket_rooms.pop(sid, None)
@@ -168,7 +398,7 @@ async def disconnect(sid: str):
     if user_id:
         print(f"❌ User disconnected: {user_id} - Socket: {sid}")
         if role == Role.DOCTOR.value and not still_online:
-            await _broadcast_doctor_presence(user_id, False)
+            _schedule_offline_broadcast(user_id)
     else:
         print(f"❌ Socket disconnected: {sid}")
 
@@ -182,13 +412,12 @@ async def join_conversation(sid: str, data: dict):
             await sio.emit('error', {'message': 'معرف المريض مطلوب', 'code': 'E400'}, room=sid)
             return
         
-        user_data = socket_users.get(sid)
-        if not user_data:
+        user = socket_users.get(sid)
+        if not user:
             await sio.emit('error', {'message': 'غير مصرح', 'code': 'E401'}, room=sid)
             return
         
-        user_id = user_data['user_id']
-        user = user_data['user']
+        user_id = str(user.user_id)
         
         try:
             patient = await Patient.get(OID(patient_id))
@@ -202,13 +431,13 @@ async def join_conversation(sid: str, data: dict):
         patient_user_id = patient.user_id
 
         if user.role == Role.DOCTOR:
-            selected_doctor = await Doctor.find_one(Doctor.user_id == user.id)
+            selected_doctor = await Doctor.find_one(Doctor.user_id == user.user_id)
             if not selected_doctor or selected_doctor.id not in patient.doctor_ids:
                 await sio.emit('error', {'message': 'غير مصرح', 'code': 'E403'}, room=sid)
                 return
-            doctor_user_id = user.id
+            doctor_user_id = user.user_id
         elif user.role == Role.PATIENT:
-            if patient.user_id != user.id:
+            if patient.user_id != user.user_id:
                 await sio.emit('error', {'message': 'غير مصرح', 'code': 'E403'}, room=sid)
                 return
             if not patient.doctor_ids:
@@ -249,12 +478,7 @@ async def join_conversation(sid: str, data: dict):
         room = await get_chat_room(patient=patient, doctor=selected_doctor)
 
         if room:
-            room_key = f"room_{room.id}"
-            await sio.enter_room(sid, room_key)
-
-            if sid not in socket_rooms:
-                socket_rooms[sid] = set()
-            socket_rooms[sid].add(str(room.id))
+            await _cache_room_access(sid, room, user.role)
 
             print(f"👤 User {user_id} joined conversation {room.id} (patient={patient.id})")
             await sio.emit('joined_conversation', {
@@ -281,13 +505,12 @@ async def join_room_by_id(sid: str, data: dict):
             await sio.emit('error', {'message': 'معرف المحادثة مطلوب', 'code': 'E400'}, room=sid)
             return
 
-        user_data = socket_users.get(sid)
-        if not user_data:
+        user = socket_users.get(sid)
+        if not user:
             await sio.emit('error', {'message': 'غير مصرح', 'code': 'E401'}, room=sid)
             return
 
-        user_id = user_data['user_id']
-        user = user_data['user']
+        user_id = str(user.user_id)
 
         try:
             room = await ChatRoom.get(OID(room_id))
@@ -298,23 +521,18 @@ async def join_room_by_id(sid: str, data: dict):
         room = await ensure_chat_room_user_ids(room)
 
         if user.role == Role.DOCTOR:
-            if room.doctor_user_id != user.id:
+            if room.doctor_user_id != user.user_id:
                 await sio.emit('error', {'message': 'غير مصرح', 'code': 'E403'}, room=sid)
                 return
         elif user.role == Role.PATIENT:
-            if room.patient_user_id != user.id:
+            if room.patient_user_id != user.user_id:
                 await sio.emit('error', {'message': 'غير مصرح', 'code': 'E403'}, room=sid)
                 return
         else:
             await sio.emit('error', {'message': 'غير مصرح', 'code': 'E403'}, room=sid)
             return
 
-        room_key = f"room_{room.id}"
-        await sio.enter_room(sid, room_key)
-
-        if sid not in socket_rooms:
-            socket_rooms[sid] = set()
-        socket_rooms[sid].add(str(room.id))
+        await _cache_room_access(sid, room, user.role)
 
         patient_payload_id = str(room.patient_id) if room.patient_id else None
         if not patient_payload_id and room.patient_user_id:
@@ -343,7 +561,7 @@ async def leave_conversation(sid: str, data: dict):
             
             # Remove from tracking
             if sid in socket_rooms:
-                socket_rooms[sid].discard(room_id)
+                socket_rooms[sid].pop(room_id, None)
             
             print(f"👋 Socket {sid} left conversation {room_id}")
             await sio.emit('left_conversation', {'room_id': room_id}, room=sid)
@@ -368,44 +586,29 @@ async def send_message(sid: str, data: dict):
             return
         
         # Get user from socket
-        user_data = socket_users.get(sid)
-        if not user_data:
+        user = socket_users.get(sid)
+        if not user:
             await sio.emit('error', {'message': 'غير مصرح', 'code': 'E401'}, room=sid)
             return
         
-        user_id = user_data['user_id']
-        user = user_data['user']
+        user_id = str(user.user_id)
         
-        # Get room and verify access
-        try:
-            room = await ChatRoom.get(OID(room_id))
-        except Exception:
-            await sio.emit('error', {'message': 'المحادثة غير موجودة', 'code': 'E404'}, room=sid)
-            return
-        
-        room = await ensure_chat_room_user_ids(room)
-        if user.role == Role.DOCTOR:
-            if room.doctor_user_id != user.id:
-                await sio.emit('error', {'message': 'غير مصرح', 'code': 'E403'}, room=sid)
-                return
-        elif user.role == Role.PATIENT:
-            if room.patient_user_id != user.id:
-                await sio.emit('error', {'message': 'غير مصرح', 'code': 'E403'}, room=sid)
-                return
-        else:
-            await sio.emit('error', {'message': 'غير مصرح', 'code': 'E403'}, room=sid)
+        # Get room and verify access (cached after join)
+        room = await _authorize_room(sid, user, room_id)
+        if room is None:
             return
         
         # Create message
         message = ChatMessage(
             room_id=room.id,
-            sender_user_id=user.id,
+            sender_user_id=user.user_id,
             sender_role=user.role,
             content=content or "",
             imageUrl=image_url,
             is_read=False
         )
         await message.insert()
+        await record_room_message(room, message)
         
         # Broadcast to room
         room_key = f"room_{room.id}"
@@ -456,7 +659,7 @@ async def send_message(sid: str, data: dict):
 
                 await notify_patient_new_message(
                     patient_user_id=room.patient_user_id,
-                    doctor_user_id=user.id,
+                    doctor_user_id=user.user_id,
                     patient_id=str(room.patient_id) if room.patient_id else None,
                     room_id=str(room.id),
                 )
@@ -470,7 +673,7 @@ async def send_message(sid: str, data: dict):
 
                 await notify_doctor_new_message(
                     doctor_user_id=room.doctor_user_id,
-                    patient_user_id=user.id,
+                    patient_user_id=user.user_id,
                     patient_id=str(room.patient_id) if room.patient_id else None,
                     patient_name=user.name,
                     room_id=str(room.id),
@@ -500,36 +703,32 @@ async def edit_message(sid: str, data: dict):
             await sio.emit('error', {'message': 'لا يمكن حفظ رسالة فارغة', 'code': 'E400'}, room=sid)
             return
 
-        user_data = socket_users.get(sid)
-        if not user_data:
+        user = socket_users.get(sid)
+        if not user:
             await sio.emit('error', {'message': 'غير مصرح', 'code': 'E401'}, room=sid)
             return
-        user = user_data['user']
 
+        room = await _authorize_room(sid, user, room_id)
+        if room is None:
+            return
         try:
-            room = await ChatRoom.get(OID(room_id))
             message = await ChatMessage.get(OID(message_id))
         except Exception:
+            message = None
+        if not message:
             await sio.emit('error', {'message': 'العنصر المطلوب غير موجود', 'code': 'E404'}, room=sid)
             return
 
-        room = await ensure_chat_room_user_ids(room)
         if message.room_id != room.id:
             await sio.emit('error', {'message': 'غير مصرح', 'code': 'E403'}, room=sid)
             return
-        if message.sender_user_id != user.id:
+        if message.sender_user_id != user.user_id:
             await sio.emit('error', {'message': 'يمكنك تعديل رسائلك فقط', 'code': 'E403'}, room=sid)
             return
 
-        if user.role == Role.DOCTOR and room.doctor_user_id != user.id:
-            await sio.emit('error', {'message': 'غير مصرح', 'code': 'E403'}, room=sid)
-            return
-        if user.role == Role.PATIENT and room.patient_user_id != user.id:
-            await sio.emit('error', {'message': 'غير مصرح', 'code': 'E403'}, room=sid)
-            return
-
         message.content = content
         await message.save()
+        await record_room_message_edit(room.id, message)
 
         if user.role == Role.DOCTOR:
             receiver_id = str(room.patient_user_id) if room.patient_user_id else None
@@ -578,39 +777,24 @@ async def mark_read(sid: str, data: dict):
             return
         
         # Get user from socket
-        user_data = socket_users.get(sid)
-        if not user_data:
+        user = socket_users.get(sid)
+        if not user:
             await sio.emit('error', {'message': 'غير مصرح', 'code': 'E401'}, room=sid)
             return
         
-        user_id = user_data['user_id']
-        user = user_data['user']
+        user_id = str(user.user_id)
         
-        # Mark messages as read
-        room = await ChatRoom.get(OID(room_id))
-        if not room:
-            await sio.emit('error', {'message': 'المحادثة غير موجودة', 'code': 'E404'}, room=sid)
-            return
-        
-        room = await ensure_chat_room_user_ids(room)
-        if user.role == Role.DOCTOR:
-            if room.doctor_user_id != user.id:
-                await sio.emit('error', {'message': 'غير مصرح', 'code': 'E403'}, room=sid)
-                return
-        elif user.role == Role.PATIENT:
-            if room.patient_user_id != user.id:
-                await sio.emit('error', {'message': 'غير مصرح', 'code': 'E403'}, room=sid)
-                return
-        else:
-            await sio.emit('error', {'message': 'غير مصرح', 'code': 'E403'}, room=sid)
+        room = await _authorize_room(sid, user, room_id)
+        if room is None:
             return
 
         from beanie.operators import Set as UpdateSet
         await ChatMessage.find(
             ChatMessage.room_id == room.id,
-            ChatMessage.sender_user_id != user.id,
+            ChatMessage.sender_user_id != user.user_id,
             ChatMessage.is_read == False
         ).update(UpdateSet({"is_read": True}))
+        await mark_room_read(room, user.user_id)
         
         await sio.emit('marked_read', {'room_id': room_id}, room=sid)
     except Exception as e:
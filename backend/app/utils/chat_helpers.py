@@ -1,100 +1,433 @@
-from app.models import ChatRoom, Patient, Doctor
+from datetime import datetime, timedelta, timezone
+
+from beanie import PydanticObjectId as OID
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from app.models import ChatRoom, ChatMessage, Patient, Doctor
+from app.models.chat import CHAT_ROOM_PAIR_INDEX
+from app.utils.logger import get_logger
+
+logger = get_logger("chat_helpers")
+
+# أقصى طول لمعاينة آخر رسالة في قائمة المحادثات
+PREVIEW_MAX_LEN = 200
 
 
 async def ensure_chat_room_user_ids(room: ChatRoom) -> ChatRoom:
     """
-    Populate missing user-level identifiers for a chat room and persist the changes.
-    This keeps existing chat documents compatible while allowing newer logic to rely on
-    `patient_user_id` and `doctor_user_id`.
+    Fill missing user-level identifiers on a legacy chat room in memory only.
+    Stored rooms are completed once by `migrate_legacy_chat_rooms`, so after
+    the migration this is a no-op and never writes on the read path.
     """
-    updated = False
-
     if room.patient_user_id is None and room.patient_id is not None:
         patient = await Patient.get(room.patient_id)
         if patient:
             room.patient_user_id = patient.user_id
-            updated = True
 
     if room.doctor_user_id is None and room.doctor_id is not None:
         doctor = await Doctor.get(room.doctor_id)
         if doctor:
             room.doctor_user_id = doctor.user_id
-            updated = True
-
-    if updated:
-        await room.save()
 
     return room
 
 
 async def _find_chat_room(*, patient: Patient, doctor: Doctor) -> ChatRoom | None:
-    """البحث عن غرفة موجودة دون إنشاء غرفة جديدة."""
-    patient_user_id = patient.user_id
-    doctor_user_id = doctor.user_id
-
-    room = await ChatRoom.find_one(
+    """البحث عن غرفة موجودة دون إنشاء غرفة جديدة (استعلام واحد على الفهرس الفريد)."""
+    return await ChatRoom.find_one(
         ChatRoom.patient_id == patient.id,
         ChatRoom.doctor_id == doctor.id,
     )
 
-    if not room:
-        legacy_room = await ChatRoom.find_one(
-            ChatRoom.patient_user_id == patient_user_id,
-            ChatRoom.doctor_user_id == doctor_user_id,
-        )
-        # لا نعيد استخدام غرفة فرد آخر من نفس رقم الهاتف
-        if legacy_room and (
-            legacy_room.patient_id is None or legacy_room.patient_id == patient.id
-        ):
-            room = legacy_room
-
-    return room
-
-
-async def _sync_chat_room_ids(
-    room: ChatRoom, *, patient: Patient, doctor: Doctor
-) -> ChatRoom:
-    room = await ensure_chat_room_user_ids(room)
-    updated = False
-    if room.patient_id is None:
-        room.patient_id = patient.id
-        updated = True
-    if room.doctor_id is None:
-        room.doctor_id = doctor.id
-        updated = True
-    if updated:
-        await room.save()
-    return room
-
 
 async def get_chat_room(*, patient: Patient, doctor: Doctor) -> ChatRoom | None:
     """
     غرفة واحدة لكل (patient_id + doctor_id) — للقراءة فقط.
     يُرجع None إذا لم تُنشأ غرفة بعد (لا توجد رسائل).
     """
-    room = await _find_chat_room(patient=patient, doctor=doctor)
-    if not room:
-        return None
-    return await _sync_chat_room_ids(room, patient=patient, doctor=doctor)
+    return await _find_chat_room(patient=patient, doctor=doctor)
 
 
 async def get_or_create_chat_room(*, patient: Patient, doctor: Doctor) -> ChatRoom:
     """
     غرفة واحدة لكل (patient_id + doctor_id).
     مهم للعائلة: نفس user_id لا يكفي — كل فرد له غرفة مستقلة.
+    الفهرس الفريد يضمن ألا يُنشئ طلبان متزامنان غرفتين.
     """
-    patient_user_id = patient.user_id
-    doctor_user_id = doctor.user_id
-
     room = await _find_chat_room(patient=patient, doctor=doctor)
     if room:
-        return await _sync_chat_room_ids(room, patient=patient, doctor=doctor)
+        return room
 
     room = ChatRoom(
-        patient_user_id=patient_user_id,
-        doctor_user_id=doctor_user_id,
+        patient_user_id=patient.user_id,
+        doctor_user_id=doctor.user_id,
         patient_id=patient.id,
         doctor_id=doctor.id,
     )
-    await room.insert()
+    try:
+        await room.insert()
+    except DuplicateKeyError:
+        room = await _find_chat_room(patient=patient, doctor=doctor)
     return room
+
+
+# ---------------------- Message history ----------------------
+
+# الحقول التي يحتاجها ChatMessageOut فقط
+MESSAGE_PROJECTION = {
+    "room_id": 1,
+    "sender_user_id": 1,
+    "sender_role": 1,
+    "content": 1,
+    "imageUrl": 1,
+    "is_read": 1,
+    "created_at": 1,
+}
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def encode_message_cursor(created_at: datetime, message_id: OID) -> str:
+    """مؤشر معتم: <created_at بالميلي ثانية>_<message id>."""
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    millis = (created_at - _EPOCH) // timedelta(milliseconds=1)
+    return f"{millis}_{message_id}"
+
+
+def decode_message_cursor(cursor: str) -> tuple[datetime, OID]:
+    """Raises ValueError for a malformed cursor."""
+    millis, _, message_id = cursor.partition("_")
+    created_at = _EPOCH + timedelta(milliseconds=int(millis))
+    return created_at, OID(message_id)
+
+
+async def fetch_room_messages(
+    room_id: OID,
+    *,
+    cursor: tuple[datetime, OID | None] | None = None,
+    direction: str = "before",
+    limit: int = 50,
+) -> tuple[list[dict], bool]:
+    """
+    صفحة رسائل لغرفة على الفهرس (room_id, created_at, _id).
+
+    - before: الرسائل الأقدم من المؤشر، الأحدث أولاً.
+    - after: الرسائل الأحدث من المؤشر، الأقدم أولاً (للّحاق بعد إعادة الاتصال).
+    _id يكسر التعادل بين رسائل لها نفس created_at فلا تُكرر ولا تُفقد.
+    يُرجع (مستندات خام بإسقاط MESSAGE_PROJECTION، هل توجد رسائل أخرى).
+    """
+    older = direction == "before"
+    query: dict = {"room_id": room_id}
+    if cursor is not None:
+        created_at, message_id = cursor
+        op = "$lt" if older else "$gt"
+        if message_id is None:
+            query["created_at"] = {op: created_at}
+        else:
+            query["$or"] = [
+                {"created_at": {op: created_at}},
+                {"created_at": created_at, "_id": {op: message_id}},
+            ]
+    order = -1 if older else 1
+    docs = (
+        await ChatMessage.get_motor_collection()
+        .find(query, MESSAGE_PROJECTION)
+        .sort([("created_at", order), ("_id", order)])
+        .limit(limit + 1)
+        .to_list(limit + 1)
+    )
+    return docs[:limit], len(docs) > limit
+
+
+# ---------------------- Legacy room migration ----------------------
+
+
+async def _fill_legacy_room_ids() -> int:
+    """Persist missing patient/doctor ids (document + user level) on legacy rooms."""
+    rooms = ChatRoom.get_motor_collection()
+    legacy = await rooms.find(
+        {
+            "$or": [
+                {"patient_id": None},
+                {"doctor_id": None},
+                {"patient_user_id": None},
+                {"doctor_user_id": None},
+            ]
+        },
+        {"patient_id": 1, "doctor_id": 1, "patient_user_id": 1, "doctor_user_id": 1},
+    ).to_list(None)
+    if not legacy:
+        return 0
+
+    patient_ids = {r["patient_id"] for r in legacy if r.get("patient_id")}
+    patient_user_ids = {
+        r["patient_user_id"] for r in legacy if r.get("patient_user_id") and not r.get("patient_id")
+    }
+    doctor_ids = {r["doctor_id"] for r in legacy if r.get("doctor_id")}
+    doctor_user_ids = {
+        r["doctor_user_id"] for r in legacy if r.get("doctor_user_id") and not r.get("doctor_id")
+    }
+
+    patients = await Patient.find(
+        {"$or": [{"_id": {"$in": list(patient_ids)}}, {"user_id": {"$in": list(patient_user_ids)}}]}
+    ).to_list()
+    doctors = await Doctor.find(
+        {"$or": [{"_id": {"$in": list(doctor_ids)}}, {"user_id": {"$in": list(doctor_user_ids)}}]}
+    ).to_list()
+
+    patient_user_by_id = {p.id: p.user_id for p in patients}
+    doctor_user_by_id = {d.id: d.user_id for d in doctors}
+    doctor_by_user = {d.user_id: d.id for d in doctors}
+    # الغرف القديمة كانت لكل حساب (user_id)؛ نربطها بالملف الأساسي للعائلة
+    # أو بالملف الوحيد — وإلا تبقى دون patient_id.
+    family: dict = {}
+    for p in patients:
+        family.setdefault(p.user_id, []).append(p)
+    patient_by_user: dict = {}
+    for user_id, members in family.items():
+        primary = [m for m in members if getattr(m, "is_primary", True)]
+        if len(members) == 1:
+            patient_by_user[user_id] = members[0].id
+        elif len(primary) == 1:
+            patient_by_user[user_id] = primary[0].id
+
+    ops: list[UpdateOne] = []
+    for r in legacy:
+        fields: dict = {}
+        if not r.get("patient_id") and r.get("patient_user_id") in patient_by_user:
+            fields["patient_id"] = patient_by_user[r["patient_user_id"]]
+        if not r.get("doctor_id") and r.get("doctor_user_id") in doctor_by_user:
+            fields["doctor_id"] = doctor_by_user[r["doctor_user_id"]]
+        if not r.get("patient_user_id") and r.get("patient_id") in patient_user_by_id:
+            fields["patient_user_id"] = patient_user_by_id[r["patient_id"]]
+        if not r.get("doctor_user_id") and r.get("doctor_id") in doctor_user_by_id:
+            fields["doctor_user_id"] = doctor_user_by_id[r["doctor_id"]]
+        if fields:
+            ops.append(UpdateOne({"_id": r["_id"]}, {"$set": fields}))
+    if ops:
+        await rooms.bulk_write(ops, ordered=False)
+    return len(ops)
+
+
+async def _merge_duplicate_rooms() -> tuple[int, list[OID]]:
+    """Merge rooms sharing (patient_id, doctor_id) into the oldest one."""
+    rooms = ChatRoom.get_motor_collection()
+    messages = ChatMessage.get_motor_collection()
+    merged = 0
+    keepers: list[OID] = []
+    async for group in rooms.aggregate(
+        [
+            {"$match": {"patient_id": {"$type": "objectId"}, "doctor_id": {"$type": "objectId"}}},
+            {
+                "$group": {
+                    "_id": {"patient_id": "$patient_id", "doctor_id": "$doctor_id"},
+                    "room_ids": {"$push": "$_id"},
+                    "count": {"$sum": 1},
+                }
+            },
+            {"$match": {"count": {"$gt": 1}}},
+        ],
+        allowDiskUse=True,
+    ):
+        keeper, *duplicates = sorted(group["room_ids"])
+        await messages.update_many(
+            {"room_id": {"$in": duplicates}}, {"$set": {"room_id": keeper}}
+        )
+        await rooms.delete_many({"_id": {"$in": duplicates}})
+        keepers.append(keeper)
+        merged += len(duplicates)
+    return merged, keepers
+
+
+async def migrate_legacy_chat_rooms() -> tuple[int, int]:
+    """
+    ترحيل لمرة واحدة للغرف القديمة:
+    1) تعبئة patient_id / doctor_id / patient_user_id / doctor_user_id الناقصة
+    2) دمج الغرف المكررة لنفس (patient_id, doctor_id) في أقدم غرفة (مع نقل الرسائل)
+    3) إنشاء الفهرس الفريد CHAT_ROOM_PAIR_INDEX
+
+    يتوقف فوراً إذا كان الفهرس موجوداً. يُرجع (غرف مكتملة، غرف مدموجة).
+    تُشغَّل كمهمة leased_job(run_once=True) عند الإقلاع حتى لا يدمج عدة عمّال معاً.
+    """
+    rooms = ChatRoom.get_motor_collection()
+    if CHAT_ROOM_PAIR_INDEX in await rooms.index_information():
+        return 0, 0
+
+    filled = await _fill_legacy_room_ids()
+    merged, keepers = await _merge_duplicate_rooms()
+    if keepers:
+        await backfill_chat_room_summaries(room_ids=keepers)
+
+    await rooms.create_index(
+        [("patient_id", ASCENDING), ("doctor_id", ASCENDING)],
+        name=CHAT_ROOM_PAIR_INDEX,
+        unique=True,
+        # الغرف القديمة التي تعذّر ربطها بملف مريض تبقى خارج الفهرس
+        partialFilterExpression={
+            "patient_id": {"$type": "objectId"},
+            "doctor_id": {"$type": "objectId"},
+        },
+    )
+    if filled or merged:
+        logger.info(
+            "Migrated legacy chat rooms: %s completed, %s duplicates merged", filled, merged
+        )
+    return filled, merged
+
+
+# ---------------------- Room summary (chat list) ----------------------
+
+
+def message_preview(content: str | None, image_url: str | None) -> str:
+    """النص المعروض لآخر رسالة في قائمة المحادثات."""
+    if image_url:
+        return "صورة"
+    return (content or "")[:PREVIEW_MAX_LEN]
+
+
+def _receiver_unread_field(room: ChatRoom, sender_user_id: OID | None) -> str:
+    if sender_user_id is not None and sender_user_id == room.doctor_user_id:
+        return "unread_for_patient"
+    return "unread_for_doctor"
+
+
+def _reader_unread_field(room: ChatRoom, reader_user_id: OID) -> str | None:
+    if reader_user_id == room.doctor_user_id:
+        return "unread_for_doctor"
+    if reader_user_id == room.patient_user_id:
+        return "unread_for_patient"
+    return None
+
+
+async def record_room_message(room: ChatRoom, message: ChatMessage) -> None:
+    """Update the room summary for a newly inserted message (one atomic update)."""
+    unread_field = _receiver_unread_field(room, message.sender_user_id)
+    await ChatRoom.get_motor_collection().update_one(
+        {"_id": room.id},
+        {
+            "$set": {
+                "last_message_id": message.id,
+                "last_message_at": message.created_at,
+                "last_message_preview": message_preview(message.content, message.imageUrl),
+                "last_sender_user_id": message.sender_user_id,
+            },
+            "$inc": {unread_field: 1},
+        },
+    )
+
+
+async def record_room_message_edit(room_id: OID, message: ChatMessage) -> None:
+    """Refresh the preview if the edited message is the room's last message."""
+    await ChatRoom.get_motor_collection().update_one(
+        {"_id": room_id, "last_message_id": message.id},
+        {"$set": {"last_message_preview": message_preview(message.content, message.imageUrl)}},
+    )
+
+
+async def mark_room_read(room: ChatRoom, reader_user_id: OID) -> None:
+    """Reset the reader's unread counter after marking the whole room as read."""
+    field = _reader_unread_field(room, reader_user_id)
+    if field:
+        await ChatRoom.get_motor_collection().update_one(
+            {"_id": room.id}, {"$set": {field: 0}}
+        )
+
+
+async def mark_room_message_read(room: ChatRoom, reader_user_id: OID) -> None:
+    """Decrement the reader's unread counter after one message became read."""
+    field = _reader_unread_field(room, reader_user_id)
+    if field:
+        await ChatRoom.get_motor_collection().update_one(
+            {"_id": room.id, field: {"$gt": 0}}, {"$inc": {field: -1}}
+        )
+
+
+async def backfill_chat_room_summaries(room_ids: list[OID] | None = None) -> int:
+    """
+    حساب ملخص كل غرفة (آخر رسالة + غير المقروء لكل طرف) من chat_messages.
+    يملأ أيضاً المعرفات الناقصة في الغرف القديمة. room_ids يحصر الحساب في غرف محددة.
+    آمن لإعادة التشغيل (idempotent).
+    """
+    await _fill_legacy_room_ids()
+
+    messages = ChatMessage.get_motor_collection()
+    message_match = {"room_id": {"$in": room_ids}} if room_ids is not None else {}
+
+    last_by_room: dict = {}
+    async for row in messages.aggregate(
+        [
+            {"$match": message_match},
+            {"$sort": {"room_id": 1, "created_at": -1}},
+            {
+                "$group": {
+                    "_id": "$room_id",
+                    "message_id": {"$first": "$_id"},
+                    "created_at": {"$first": "$created_at"},
+                    "content": {"$first": "$content"},
+                    "imageUrl": {"$first": "$imageUrl"},
+                    "sender_user_id": {"$first": "$sender_user_id"},
+                }
+            },
+        ],
+        allowDiskUse=True,
+    ):
+        last_by_room[row["_id"]] = row
+
+    unread_by_sender: dict = {}
+    async for row in messages.aggregate(
+        [
+            {"$match": {**message_match, "is_read": False}},
+            {
+                "$group": {
+                    "_id": {"room_id": "$room_id", "sender_user_id": "$sender_user_id"},
+                    "count": {"$sum": 1},
+                }
+            },
+        ],
+        allowDiskUse=True,
+    ):
+        key = (row["_id"].get("room_id"), row["_id"].get("sender_user_id"))
+        unread_by_sender[key] = row["count"]
+
+    ops: list[UpdateOne] = []
+    updated = 0
+    room_filter = {"_id": {"$in": room_ids}} if room_ids is not None else {}
+    async for room in ChatRoom.get_motor_collection().find(
+        room_filter, {"doctor_user_id": 1, "patient_user_id": 1}
+    ):
+        last = last_by_room.get(room["_id"])
+        ops.append(
+            UpdateOne(
+                {"_id": room["_id"]},
+                {
+                    "$set": {
+                        "last_message_id": last["message_id"] if last else None,
+                        "last_message_at": last["created_at"] if last else None,
+                        "last_message_preview": (
+                            message_preview(last.get("content"), last.get("imageUrl"))
+                            if last
+                            else None
+                        ),
+                        "last_sender_user_id": last.get("sender_user_id") if last else None,
+                        "unread_for_doctor": unread_by_sender.get(
+                            (room["_id"], room.get("patient_user_id")), 0
+                        ),
+                        "unread_for_patient": unread_by_sender.get(
+                            (room["_id"], room.get("doctor_user_id")), 0
+                        ),
+                    }
+                },
+            )
+        )
+        if len(ops) >= 1000:
+            await ChatRoom.get_motor_collection().bulk_write(ops, ordered=False)
+            updated += len(ops)
+            ops = []
+    if ops:
+        await ChatRoom.get_motor_collection().bulk_write(ops, ordered=False)
+        updated += len(ops)
+    return updated
+
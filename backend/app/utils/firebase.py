@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 import os
 from pathlib import Path
 from typing import List, Optional, Dict
@@ -144,7 +145,8 @@ async def send_firebase_message(
     )
 
     try:
-        response = messaging.send_each_for_multicast(message)
+        # The Admin SDK call is blocking HTTP; keep it off the event loop.
+        response = await asyncio.to_thread(messaging.send_each_for_multicast, message)
         logger.info(
             "[FCM] Sent title=%s success=%s failure=%s",
             title,
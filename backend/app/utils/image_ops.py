@@ -0,0 +1,94 @@
+"""Pillow work for image variants and QR codes, run inside ProcessPoolExecutor workers.
+
+Only Pillow, qrcode (and the optional pillow-heif plugin) are imported here so
+spawned workers start quickly and never touch the app config, database or
+event loop.
+"""
+
+import io
+import os
+from typing import Union
+
+import qrcode
+import qrcode.image.svg
+from PIL import Image, ImageOps
+
+# Formats that phones produce and browsers/Flutter cannot always decode.
+TRANSCODE_FORMATS = {"HEIF", "HEIC", "AVIF", "MPO"}
+
+
+def init_worker() -> None:
+    """Process-pool initializer: register the HEIC/HEIF opener when pillow-heif is installed."""
+    try:
+        import pillow_heif
+    except ImportError:
+        return
+    pillow_heif.register_heif_opener()
+
+
+def _encode(img: Image.Image, fmt: str, quality: int) -> bytes:
+    out = io.BytesIO()
+    if fmt == "jpeg":
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        img.save(out, format="JPEG", quality=quality, optimize=True, progressive=True)
+    else:
+        if img.mode not in ("RGB", "RGBA", "L"):
+            img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+        img.save(out, format="WEBP", quality=quality, method=4)
+    # No exif=/icc_profile= is passed, so EXIF (GPS, device, timestamps) is dropped.
+    return out.getvalue()
+
+
+def render_variants(
+    source: Union[bytes, str],
+    sizes: dict[str, int],
+    *,
+    fmt: str = "webp",
+    quality: int = 80,
+    display_px: int = 2048,
+    transcode_over_bytes: int = 0,
+) -> dict[str, bytes]:
+    """
+    Decode `source` (bytes or a local file path) once and return encoded variants.
+
+    - every entry of `sizes` ({"thumb": 320, "medium": 1280}) is a downscale to
+      that longest edge (never upscaled)
+    - "display" is added for HEIC/HEIF originals and for originals larger than
+      `transcode_over_bytes`: a full-resolution (capped at `display_px`) re-encode
+    - EXIF orientation is applied to the pixels first, then all metadata is stripped
+    """
+    if isinstance(source, (bytes, bytearray)):
+        original_size = len(source)
+        img = Image.open(io.BytesIO(source))
+    else:
+        original_size = os.path.getsize(source)
+        img = Image.open(source)
+
+    source_format = (img.format or "").upper()
+    img = ImageOps.exif_transpose(img)
+    img.load()
+
+    variants: dict[str, bytes] = {}
+    for name, edge in sizes.items():
+        copy = img.copy()
+        copy.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+        variants[name] = _encode(copy, fmt, quality)
+
+    needs_display = source_format in TRANSCODE_FORMATS or (
+        transcode_over_bytes and original_size > transcode_over_bytes
+    )
+    if needs_display:
+        copy = img.copy()
+        copy.thumbnail((display_px, display_px), Image.Resampling.LANCZOS)
+        variants["display"] = _encode(copy, fmt, quality)
+    return variants
+
+
+def render_qr(code: str, fmt: str = "png") -> bytes:
+    """QR image of `code` as PNG or SVG bytes (deterministic for a given code)."""
+    if fmt == "svg":
+        return qrcode.make(code, image_factory=qrcode.image.svg.SvgPathImage).to_string()
+    out = io.BytesIO()
+    qrcode.make(code).save(out, format="PNG")
+    return out.getvalue()
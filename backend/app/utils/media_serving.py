@@ -0,0 +1,209 @@
+"""Serving locally stored media with HTTP caching.
+
+- one stat() per request (no exists()/is_file() pair)
+- ETag: SHA-256 of the content for files small enough to cache in memory,
+  otherwise size + mtime (both change whenever a file is rewritten)
+- If-None-Match -> 304, so an app reopening a gallery revalidates instead of
+  downloading every photo again
+- single Range requests -> 206 (If-Range honoured), unsatisfiable -> 416
+- keys written by upload_clinic_file/_image are timestamped and never
+  overwritten, so they are served `immutable` for a year; anything else gets
+  a short max-age and is revalidated
+- small hot files (QR codes, thumbnails) are kept in a bounded in-memory LRU,
+  checked against size + mtime on every hit
+"""
+
+import asyncio
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from collections import OrderedDict
+from email.utils import formatdate
+from pathlib import Path
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+from app.config import get_settings
+from app.services.media_storage import MEDIA_DIR
+
+settings = get_settings()
+
+# Older builds served from <project root>/media; keep reading files left there.
+LEGACY_MEDIA_DIR = Path(__file__).resolve().parents[3] / "media"
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "public, max-age=300, must-revalidate"
+# patients/.../20250101123045123456.jpg  and  .../variants/20250101123045123456_thumb.webp
+_TIMESTAMPED_NAME = re.compile(r"^\d{20}(_[a-z]+)?\.[A-Za-z0-9]+$")
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+_CHUNK = 256 * 1024
+
+
+class _CachedFile:
+    __slots__ = ("size", "mtime_ns", "etag", "body")
+
+    def __init__(self, size: int, mtime_ns: int, etag: str, body: bytes) -> None:
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.etag = etag
+        self.body = body
+
+
+class _HotFileCache:
+    """LRU of small file bodies, bounded by total bytes."""
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._items: "OrderedDict[str, _CachedFile]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: str, size: int, mtime_ns: int) -> Optional[_CachedFile]:
+        with self._lock:
+            item = self._items.get(path)
+            if item is None:
+                return None
+            if item.size != size or item.mtime_ns != mtime_ns:
+                self._drop(path)
+                return None
+            self._items.move_to_end(path)
+            return item
+
+    def put(self, path: str, item: _CachedFile) -> None:
+        with self._lock:
+            if path in self._items:
+                self._drop(path)
+            self._items[path] = item
+            self.bytes += item.size
+            while self.bytes > self.max_bytes and self._items:
+                self._drop(next(iter(self._items)))
+
+    def _drop(self, path: str) -> None:
+        item = self._items.pop(path, None)
+        if item is not None:
+            self.bytes -= item.size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self.bytes = 0
+
+
+hot_cache = _HotFileCache(settings.MEDIA_CACHE_MAX_MB * 1024 * 1024)
+
+
+def _stat(file_path: str) -> Optional[tuple[Path, os.stat_result]]:
+    for root in (MEDIA_DIR, LEGACY_MEDIA_DIR):
+        path = root / file_path
+        try:
+            st = path.stat()
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        if st.st_mode & 0o170000 == 0o100000:  # regular file
+            return path, st
+    return None
+
+
+def _cache_control(file_path: str) -> str:
+    return IMMUTABLE_CACHE if _TIMESTAMPED_NAME.match(file_path.rsplit("/", 1)[-1]) else REVALIDATE_CACHE
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = [c.strip() for c in header.split(",")]
+    return etag in candidates or f"W/{etag}" in candidates
+
+
+def _parse_range(header: Optional[str], size: int) -> Optional[tuple[int, int]] | str:
+    """(start, end) inclusive, None for a full response, "invalid" for 416."""
+    if not header:
+        return None
+    match = _RANGE.match(header.strip())
+    if not match:
+        return None  # multi-range or other units: send the whole file
+    first, last = match.groups()
+    if first == "" and last == "":
+        return None
+    if first == "":
+        length = int(last)
+        if length == 0:
+            return "invalid"
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        return "invalid"
+    return start, min(end, size - 1)
+
+
+async def _read_range(path: Path, start: int, end: int):
+    def _open():
+        f = open(path, "rb")
+        f.seek(start)
+        return f
+
+    f = await asyncio.to_thread(_open)
+    try:
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await asyncio.to_thread(f.read, min(_CHUNK, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+async def serve_local_media(request: Request, file_path: str) -> Optional[Response]:
+    """Response for a locally stored media file, or None if it is not on this machine."""
+    found = _stat(file_path)
+    if found is None:
+        return None
+    path, st = found
+    size, mtime_ns = st.st_size, st.st_mtime_ns
+    content_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+
+    cached = hot_cache.get(str(path), size, mtime_ns)
+    if cached is None and size <= settings.MEDIA_CACHE_MAX_FILE_KB * 1024:
+        body = await asyncio.to_thread(path.read_bytes)
+        cached = _CachedFile(size, mtime_ns, f'"{hashlib.sha256(body).hexdigest()[:32]}"', body)
+        hot_cache.put(str(path), cached)
+    etag = cached.etag if cached else f'"{size:x}-{mtime_ns:x}"'
+
+    headers = {
+        "ETag": etag,
+        "Cache-Control": _cache_control(file_path),
+        "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+        "Accept-Ranges": "bytes",
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    byte_range = _parse_range(request.headers.get("range"), size)
+    if_range = request.headers.get("if-range")
+    if byte_range is not None and if_range and if_range.strip() != etag:
+        byte_range = None
+    if byte_range == "invalid":
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+    if byte_range is not None:
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        if cached:
+            return Response(cached.body[start:end + 1], status_code=206, media_type=content_type, headers=headers)
+        return StreamingResponse(
+            _read_range(path, start, end), status_code=206, media_type=content_type, headers=headers
+        )
+
+    if cached:
+        return Response(cached.body, media_type=content_type, headers=headers)
+    return FileResponse(path, media_type=content_type, headers=headers, stat_result=st)
@@ -8,6 +8,7 @@ from typing import Dict, Optional
 from app.models import Patient, User
 from app.schemas import DoctorPatientProfileOut, PatientOut
 from app.utils.patient_profile import build_doctor_profile_map, get_doctor_profile
+from app.utils.qrcode_gen import patient_qr_image_url
 
 
 def _resolve_image_url(
@@ -165,7 +166,7 @@ def build_patient_out(
         doctor_ids=[str(did) for did in patient.doctor_ids],
         doctor_profiles=doctor_profiles,
         qr_code_data=patient.qr_code_data,
-        qr_image_path=patient.qr_image_path,
+        qr_image_path=patient_qr_image_url(patient.qr_code_data, patient.qr_image_path),
         imageUrl=identity["imageUrl"],
         created_at=created_at,
     )
@@ -222,7 +223,7 @@ def build_patient_out_from_agg(
         doctor_ids=[str(d) for d in patient_doc.get("doctor_ids", [])],
         doctor_profiles=doctor_profiles_out,
         qr_code_data=patient_doc.get("qr_code_data", ""),
-        qr_image_path=patient_doc.get("qr_image_path"),
+        qr_image_path=patient_qr_image_url(patient_doc.get("qr_code_data"), patient_doc.get("qr_image_path")),
         imageUrl=identity["imageUrl"],
         created_at=created_at,
     )
@@ -1,50 +1,66 @@
+import asyncio
 import os
-from io import BytesIO
+from functools import lru_cache
 
-import qrcode
-from fastapi import HTTPException
+from beanie import PydanticObjectId as OID
 
+from app.config import get_settings
 from app.models import Patient
-from app.utils.r2_clinic import upload_clinic_image
+from app.utils.image_ops import render_qr
 from app.utils.logger import get_logger
 
+settings = get_settings()
 logger = get_logger("qrcode")
 
+QR_FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+
+
+def new_qr_code(patient_id: OID | str) -> str:
+    """قيمة QR جديدة: جزء من معرف المريض لتمييز الكود + salt عشوائي."""
+    salt = os.urandom(4).hex()
+    pid = str(patient_id)[-6:]
+    return f"P{pid}-{salt}"
+
+
+def lazy_qr_url(code: str, fmt: str = "png") -> str:
+    """رابط الصورة التي تُولَّد عند أول طلب (GET /qr/{code}.png|svg)."""
+    return f"/qr/{code}.{fmt}"
+
+
+def patient_qr_image_url(code: str | None, stored_path: str | None) -> str | None:
+    """الصورة المخزّنة إن وُجدت (pre-rendered)، وإلا الرابط الكسول."""
+    if stored_path:
+        return stored_path
+    if code and not code.startswith("tmp-"):
+        return lazy_qr_url(code)
+    return None
+
+
+@lru_cache(maxsize=settings.QR_CACHE_SIZE)
+def _cached_qr(code: str, fmt: str) -> bytes:
+    return render_qr(code, fmt)
+
+
+async def qr_image_bytes(code: str, fmt: str = "png") -> bytes:
+    """صورة QR من الكاش، أو تُولَّد في thread حتى لا تحجز الـ event loop."""
+    return await asyncio.to_thread(_cached_qr, code, fmt)
+
 
 async def ensure_patient_qr(patient: Patient) -> None:
-    """توليد وحفظ QR للمريض إن لم يكن موجودًا ثم رفعه إلى R2 وتخزين URL.
+    """تعيين qr_code_data للمريض إن لم يكن موجودًا (أو كان مؤقتًا) ثم الحفظ.
 
-    في حال فشل الرفع إلى R2 (مثلاً مشكلة SSL محلية)، لا نمنع إنشاء المريض:
-    - نطبع الخطأ في اللوج
-    - نترك qr_image_path = None، لكن qr_code_data يكون موجود ويمكن استخدامه.
+    لا يتم توليد أو رفع الصورة هنا: qr_image_path يشير إلى /qr/{code}.png التي
+    تُولَّد عند أول طلب، أو إلى الصورة المرفوعة مسبقًا عبر
+    `python -m app.scripts.prerender_qr_codes`.
     """
-    if not patient.qr_code_data:
-        salt = os.urandom(4).hex()
-        # استخدم جزء من معرف المريض لتمييز الكود
-        pid = str(patient.id)[-6:]
-        patient.qr_code_data = f"P{pid}-{salt}"
-
-    img = qrcode.make(patient.qr_code_data)
-    buffer = BytesIO()
-    img.save(buffer, format="PNG")
-    file_bytes = buffer.getvalue()
-
-    try:
-        url = await upload_clinic_image(
-            patient_id=str(patient.id),
-            folder="qr",
-            file_bytes=file_bytes,
-            content_type="image/png",
-            name_hint=patient.name,
-        )
-        patient.qr_image_path = url
-    except Exception as e:
-        # لا نرمي استثناء حتى لا نفشل إنشاء المريض؛ فقط نسجل الخطأ
-        logger.error(f"Failed to upload QR image to R2 for patient {patient.id}: {e}")
+    if not patient.qr_code_data or patient.qr_code_data.startswith("tmp-"):
+        patient.qr_code_data = new_qr_code(patient.id)
         patient.qr_image_path = None
-
+    if not patient.qr_image_path:
+        patient.qr_image_path = lazy_qr_url(patient.qr_code_data)
     await patient.save()
 
+
 async def get_patient_by_qr(code: str) -> Patient | None:
     """جلب مريض عبر قيمة qr_code_data."""
     return await Patient.find_one(Patient.qr_code_data == code)
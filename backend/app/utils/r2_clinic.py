@@ -1,14 +1,13 @@
+import hashlib
 from datetime import datetime
-from pathlib import Path
-from typing import Optional
+from typing import Callable, Optional
 
-import boto3
-from fastapi import HTTPException
+from fastapi import HTTPException, UploadFile
 
-from app.config import get_settings
+from app.services.media_blobs import store_deduplicated
+from app.utils.uploads import MAX_IMAGE_MB, stage_upload
 from app.utils.logger import get_logger
 
-settings = get_settings()
 logger = get_logger("r2")
 
 # Internal folder keys → R2 display folder names
@@ -72,24 +71,42 @@ def resolve_media_folder(folder: str) -> str:
     return PATIENT_MEDIA_FOLDERS.get(folder, folder)
 
 
-def _get_r2_client():
-    if not (
-        settings.R2_ACCOUNT_ID
-        and settings.R2_ACCESS_KEY_ID
-        and settings.R2_SECRET_ACCESS_KEY
-        and settings.R2_BUCKET_NAME
-        and settings.R2_PUBLIC_BASE
-    ):
-        return None
-
-    session = boto3.session.Session()
-    return session.client(
-        "s3",
-        endpoint_url=f"https://{settings.R2_ACCOUNT_ID}.r2.cloudflarestorage.com",
-        aws_access_key_id=settings.R2_ACCESS_KEY_ID,
-        aws_secret_access_key=settings.R2_SECRET_ACCESS_KEY,
-        region_name="auto",
-    )
+def build_media_key(
+    patient_id: str,
+    folder: str,
+    content_type: str,
+    name_hint: Optional[str] = None,
+) -> str:
+    """Object key: patients/{dir_label}/{media_folder}/{timestamp}{ext}."""
+    ts = datetime.utcnow().strftime("%Y%m%d%H%M%S%f")
+    ext = _ext_from_content_type(content_type)
+    dir_label = build_patient_dir_label(name_hint, patient_id)
+    media_folder = resolve_media_folder(folder)
+    return f"patients/{dir_label}/{media_folder}/{ts}{ext}"
+
+
+async def _store(
+    patient_id: str,
+    sha256: str,
+    body,
+    content_type: str,
+    size: int,
+    make_key: Callable[[], str],
+) -> str:
+    # Same bytes for the same patient reuse the stored object (media_blobs);
+    # new content goes through the pooled uploader without blocking the loop.
+    try:
+        return await store_deduplicated(
+            patient_id=patient_id,
+            sha256=sha256,
+            body=body,
+            content_type=content_type,
+            size=size,
+            make_key=make_key,
+        )
+    except Exception as exc:
+        logger.error(f"Failed to store media file for {patient_id}: {exc}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to upload media file")
 
 
 async def upload_clinic_image(
@@ -99,41 +116,41 @@ async def upload_clinic_image(
     content_type: str = "image/jpeg",
     name_hint: Optional[str] = None,
 ) -> str:
+    """Upload an in-memory image (generated files such as QR codes)."""
     if not patient_id or not folder or not file_bytes:
         raise HTTPException(status_code=400, detail="Missing upload information")
 
-    ts = datetime.utcnow().strftime("%Y%m%d%H%M%S%f")
-    ext = _ext_from_content_type(content_type)
-    dir_label = build_patient_dir_label(name_hint, patient_id)
-    media_folder = resolve_media_folder(folder)
-    file_name = f"{ts}{ext}"
-    key = f"patients/{dir_label}/{media_folder}/{file_name}"
-
-    client = _get_r2_client()
-    if client:
-        try:
-            client.put_object(
-                Bucket=settings.R2_BUCKET_NAME,
-                Key=key,
-                Body=file_bytes,
-                ContentType=content_type,
-            )
-            safe_key = key.encode("ascii", "ignore").decode("ascii")
-            logger.info("Uploaded file to R2: %s", safe_key or key)
-            return f"{settings.R2_PUBLIC_BASE.rstrip('/')}/{key}"
-        except Exception as exc:
-            logger.error(f"Failed to upload to R2 ({key}): {exc}", exc_info=True)
-            raise HTTPException(status_code=500, detail="Failed to upload media file")
-
-    media_dir = Path(__file__).resolve().parents[2] / "media"
-    local_file_path = media_dir / key
-    local_file_path.parent.mkdir(parents=True, exist_ok=True)
+    return await _store(
+        patient_id,
+        hashlib.sha256(file_bytes).hexdigest(),
+        file_bytes,
+        content_type,
+        len(file_bytes),
+        lambda: build_media_key(patient_id, folder, content_type, name_hint),
+    )
 
-    try:
-        with open(local_file_path, "wb") as f:
-            f.write(file_bytes)
-        logger.info(f"Saved file locally to: {local_file_path}")
-        return f"/media/{key}"
-    except Exception as e:
-        logger.error(f"Failed to save file locally: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail="Failed to save media file")
+
+async def upload_clinic_file(
+    patient_id: str,
+    folder: str,
+    upload: UploadFile,
+    content_type: Optional[str] = None,
+    name_hint: Optional[str] = None,
+    max_mb: float = MAX_IMAGE_MB,
+) -> str:
+    """
+    Upload a multipart file without reading it into memory: the spooled file is
+    checked against `max_mb` chunk by chunk, then streamed to R2/local storage.
+    """
+    if not patient_id or not folder or upload is None:
+        raise HTTPException(status_code=400, detail="Missing upload information")
+
+    staged = await stage_upload(upload, content_type=content_type, max_mb=max_mb)
+    return await _store(
+        patient_id,
+        staged.sha256,
+        staged.file,
+        staged.content_type,
+        staged.size,
+        lambda: build_media_key(patient_id, folder, staged.content_type, name_hint),
+    )
@@ -0,0 +1,146 @@
+"""Streaming handling of multipart image uploads.
+
+Starlette already spools each multipart file to a SpooledTemporaryFile (kept in
+memory up to 1 MiB, on disk beyond that). Handlers used to undo that with
+`await image.read()`, holding every whole image in RAM. `stage_upload` instead
+walks the spooled file in chunks: it enforces MAX_IMAGE_MB as it goes and
+computes the SHA-256 on the fly, then hands the same seekable file to storage,
+so peak memory per upload stays at one chunk plus the spool threshold.
+
+`UploadBodyLimitMiddleware` caps the raw multipart body while it is being
+received, so an oversized request is cut off before it is fully spooled.
+"""
+
+import hashlib
+from typing import BinaryIO, Iterable, Optional
+
+from fastapi import HTTPException, UploadFile
+
+from app.config import get_settings
+
+settings = get_settings()
+
+MAX_IMAGE_MB = settings.MAX_IMAGE_MB
+CHUNK_SIZE = 256 * 1024
+_MB = 1024 * 1024
+# مسارات رفع الدفعات (gallery/batch) لها حد أكبر لجسم الطلب
+BATCH_UPLOAD_SUFFIX = "/gallery/batch"
+
+
+class StagedUpload:
+    """ملف مرفوع جاهز للتخزين: الملف المؤقت (seekable) وحجمه وبصمته."""
+
+    __slots__ = ("file", "size", "sha256", "content_type")
+
+    def __init__(self, file: BinaryIO, size: int, sha256: str, content_type: str) -> None:
+        self.file = file
+        self.size = size
+        self.sha256 = sha256
+        self.content_type = content_type
+
+
+def normalize_content_type(content_type: Optional[str]) -> str:
+    return (content_type or "").split(";")[0].strip().lower()
+
+
+async def stage_upload(
+    upload: UploadFile,
+    *,
+    content_type: Optional[str] = None,
+    allowed_types: Optional[Iterable[str]] = None,
+    max_mb: float = MAX_IMAGE_MB,
+) -> StagedUpload:
+    """
+    Read the upload in chunks: 413 as soon as it passes `max_mb`, 400 if empty
+    or of a disallowed type. The file is rewound so it can be streamed to storage.
+    """
+    content_type = normalize_content_type(content_type or upload.content_type) or "application/octet-stream"
+    if allowed_types is not None and content_type not in allowed_types:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported file type. Allowed types: {', '.join(allowed_types)}",
+        )
+
+    limit = int(max_mb * _MB)
+    digest = hashlib.sha256()
+    size = 0
+    await upload.seek(0)
+    while chunk := await upload.read(CHUNK_SIZE):
+        size += len(chunk)
+        if size > limit:
+            raise HTTPException(status_code=413, detail=f"Image is larger than {max_mb:g} MB")
+        digest.update(chunk)
+    if size == 0:
+        raise HTTPException(status_code=400, detail="Empty image file")
+    await upload.seek(0)
+    return StagedUpload(upload.file, size, digest.hexdigest(), content_type)
+
+
+class _BodyTooLarge(HTTPException):
+    # HTTPException so FastAPI's body parsing re-raises it as-is instead of
+    # turning it into "400 error parsing the body".
+    def __init__(self) -> None:
+        super().__init__(status_code=413, detail="Upload is too large")
+
+
+class UploadBodyLimitMiddleware:
+    """Reject multipart bodies above MAX_UPLOAD_REQUEST_MB while they stream in (413).
+
+    Batch upload paths (ending in BATCH_UPLOAD_SUFFIX) get MAX_BATCH_UPLOAD_REQUEST_MB.
+    """
+
+    def __init__(self, app, max_mb: float | None = None, batch_max_mb: float | None = None) -> None:
+        self.app = app
+        self.max_bytes = int((max_mb or settings.MAX_UPLOAD_REQUEST_MB) * _MB)
+        self.batch_max_bytes = int((batch_max_mb or settings.MAX_BATCH_UPLOAD_REQUEST_MB) * _MB)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope.get("headers") or [])
+        if not headers.get(b"content-type", b"").lower().startswith(b"multipart/"):
+            return await self.app(scope, receive, send)
+
+        max_bytes = self.batch_max_bytes if scope.get("path", "").endswith(BATCH_UPLOAD_SUFFIX) else self.max_bytes
+        declared = headers.get(b"content-length")
+        if declared and declared.isdigit() and int(declared) > max_bytes:
+            return await self._reject(send)
+
+        received = 0
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    raise _BodyTooLarge()
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except _BodyTooLarge:
+            if not response_started:
+                await self._reject(send)
+
+    async def _reject(self, send) -> None:
+        body = b'{"detail":"Upload is too large"}'
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 413,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"connection", b"close"),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})